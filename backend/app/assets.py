@@ -0,0 +1,132 @@
+"""
+Cache-friendly delivery of HTML pages and static assets.
+
+- Static files are referenced through static_url(), which appends a content
+  hash (?v=<sha256 prefix>). Requests carrying the current hash are served
+  with a one-year immutable Cache-Control; anything else must revalidate.
+- The page templates do not depend on the request, so each one is rendered
+  once, together with its gzip/brotli variants and a strong ETag. Pages are
+  served with Cache-Control: no-cache so browsers revalidate and get a 304
+  while the build is unchanged.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+
+from .compression import accepts, brotli
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STATIC_DIR = BASE_DIR / "static"
+
+
+class AssetHasher:
+    """Content hashes of static files, recomputed only when a file changes"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def hash(self, path):
+        full_path = self.directory / path
+        try:
+            mtime = os.stat(full_path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._hashes.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        digest = hashlib.sha256(full_path.read_bytes()).hexdigest()[:12]
+        with self._lock:
+            self._hashes[path] = (mtime, digest)
+        return digest
+
+
+hasher = AssetHasher(STATIC_DIR)
+
+
+def static_url(path):
+    """URL of a static file with its content hash, for use in templates"""
+    digest = hasher.hash(path)
+    return f"/static/{path}?v={digest}" if digest else f"/static/{path}"
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles that lets fingerprinted URLs be cached forever"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        version = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v", [None])[0]
+        path = Path(os.path.relpath(full_path, self.directory)).as_posix()
+        if version and version == hasher.hash(path):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        return response
+
+
+class RenderedPage:
+    def __init__(self, html, gzip_level=6, brotli_quality=11):
+        self.identity = html.encode("utf-8")
+        self.digest = hashlib.sha256(self.identity).hexdigest()[:16]
+        self.encoded = {"gzip": gzip.compress(self.identity, compresslevel=gzip_level)}
+        if brotli is not None:
+            # Rendered once, so the slowest (smallest) brotli setting is affordable
+            self.encoded["br"] = brotli.compress(self.identity, quality=brotli_quality)
+
+    def etag(self, coding=None):
+        # Each encoding is a different representation, so gets its own strong ETag
+        return f'"{self.digest}-{coding}"' if coding else f'"{self.digest}"'
+
+    def response(self, request: Request):
+        accept_encoding = request.headers.get("accept-encoding", "")
+        coding = next(
+            (c for c in ("br", "gzip") if c in self.encoded and accepts(accept_encoding, c)), None
+        )
+        headers = {
+            "ETag": self.etag(coding),
+            "Cache-Control": REVALIDATE_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+        if headers["ETag"] in if_none_match or "*" in if_none_match:
+            return Response(status_code=304, headers=headers)
+
+        if coding is None:
+            return Response(self.identity, media_type="text/html", headers=headers)
+        headers["Content-Encoding"] = coding
+        return Response(self.encoded[coding], media_type="text/html", headers=headers)
+
+
+class PageCache:
+    """Templates rendered once per process (they do not vary per request)"""
+
+    def __init__(self, templates, gzip_level=6):
+        self.templates = templates
+        self.gzip_level = gzip_level
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        page = self._pages.get(name)
+        if page is None:
+            with self._lock:
+                page = self._pages.get(name)
+                if page is None:
+                    html = self.templates.get_template(name).render()
+                    page = RenderedPage(html, gzip_level=self.gzip_level)
+                    self._pages[name] = page
+        return page
+
+    def response(self, name, request: Request):
+        return self.get(name).response(request)
@@ -1,21 +1,16 @@
-import os
 import re
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from pathlib import Path
-from dotenv import load_dotenv
 
+from .config import get_settings
 from .database import SessionLocal
 from . import models
 
-# Load environment variables
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path, override=True)
-
 # =========================
 # PASSWORD HASHING
 # =========================
@@ -28,24 +23,9 @@ pwd_context = CryptContext(
 # JWT CONFIG
 # =========================
 def get_secret_key():
-    """Get SECRET_KEY from environment variables. Fails gracefully if missing."""
-    secret_key = os.getenv("SECRET_KEY")
-    if not secret_key:
-        # Try reading from .env file directly
-        if env_path.exists():
-            try:
-                with open(env_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if line and not line.startswith('#') and line.startswith("SECRET_KEY="):
-                            key_value = line.split("=", 1)[1]
-                            key_value = key_value.strip().strip('"').strip("'")
-                            if key_value:
-                                secret_key = key_value
-                                break
-            except Exception as e:
-                pass  # Will raise error below
-    
+    """Get SECRET_KEY from settings. Fails gracefully if missing."""
+    secret_key = get_settings().secret_key
+
     if not secret_key:
         raise ValueError(
             "SECRET_KEY environment variable is required. "
@@ -92,6 +72,20 @@ def validate_password(password: str) -> tuple[bool, str]:
         return False, "Password must contain at least one number"
     return True, ""
 
+def validate_email(email: str) -> bool:
+    """Basic email format check"""
+    return "@" in email and "." in email.split("@")[1]
+
+def normalize_email(email: str) -> str:
+    """Emails are stored and compared lowercased, so A@x.com and a@x.com are one account"""
+    return email.strip().lower()
+
+def find_user_by_email(db: Session, email: str):
+    # lower() also matches accounts registered before emails were normalized
+    return db.query(models.User).filter(
+        func.lower(models.User.email) == normalize_email(email)
+    ).first()
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -110,7 +104,20 @@ def create_access_token(data: dict):
 # =========================
 # CURRENT USER (🔥 FIX)
 # =========================
+def user_from_token(token: str, db: Session):
+    """Resolve a bearer token to a User, or None if it is invalid or expired"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    email: str = payload.get("sub")
+    if email is None:
+        return None
+    return db.query(models.User).filter(models.User.email == email).first()
+
+
 def get_current_user(
+    request: Request,
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ):
@@ -120,16 +127,18 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = user_from_token(token, db)
     if user is None:
         raise credentials_exception
 
+    # Lets middleware attribute the request to a user (see read_routing.py)
+    request.state.user_id = user.id
+    return user
+
+
+def get_admin_user(user = Depends(get_current_user)):
+    """The current user, if listed in ADMIN_USER_IDS"""
+    # By id rather than email: ids are assigned by the server, emails are chosen by whoever registers
+    if user.id not in get_settings().admin_user_ids:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
     return user
@@ -0,0 +1,71 @@
+"""
+Abandoning upstream calls when the client goes away.
+
+A chat reply can take many seconds to generate, and its output tokens are
+paid for whether or not anyone reads them. POST /chat takes a CancelToken
+from the client_disconnect dependency. A small task waits for the ASGI
+http.disconnect message and sets the token. The chat call (which runs in a
+worker thread) reads the upstream reply as a stream and checks the token
+between events. When the token is set, the call closes the stream, which
+stops generation upstream, and skips any retries left. The WebSocket chat
+gets the same effect from task cancellation (see routes/chat_ws.py).
+
+Abandoned calls are counted in chat_upstream_cancelled_total.
+"""
+import asyncio
+import threading
+
+from fastapi import Request
+from prometheus_client import Counter
+
+upstream_cancelled = Counter(
+    "chat_upstream_cancelled_total",
+    "Chat upstream calls abandoned because the client disconnected or cancelled",
+    ["path"],
+)
+
+
+class Cancelled(Exception):
+    """The client went away; the upstream call was abandoned"""
+
+
+class CancelToken:
+    """Set from the event loop, checked from the thread doing the upstream call"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled("Client disconnected")
+
+    def sleep(self, seconds):
+        """time.sleep that ends early, raising Cancelled, if the token is set"""
+        if self._event.wait(seconds):
+            raise Cancelled("Client disconnected")
+
+
+async def _watch(receive, token):
+    # The request body has been read by now, so the next message is the disconnect
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            token.cancel()
+            return
+
+
+async def client_disconnect(request: Request):
+    """Dependency: a CancelToken that is set if the client disconnects"""
+    token = CancelToken()
+    watcher = asyncio.create_task(_watch(request.receive, token))
+    try:
+        yield token
+    finally:
+        watcher.cancel()
@@ -0,0 +1,30 @@
+"""
+CPU and worker sizing, shared by the server entrypoint (serve.py) and the
+pools that run inside each app worker (ingestion.py, user_import.py).
+"""
+import math
+import os
+
+from .config import get_settings
+
+
+def available_cpus():
+    """Cores this process may use: CPU affinity, capped by a cgroup v2 quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def worker_count():
+    """App worker processes: SERVE_WORKERS, or one per available core"""
+    configured = get_settings().serve_workers
+    return configured if configured > 0 else available_cpus()
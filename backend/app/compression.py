@@ -0,0 +1,81 @@
+"""
+Response compression for text payloads.
+
+Extends Starlette's GZipMiddleware with brotli (used when the client
+accepts "br" and the brotli package is installed) and restricts
+compression to text-like content types: HTML, JSON, JavaScript, CSS and
+plain text. Responses that already carry a Content-Encoding (such as the
+pre-compressed pages served by assets.py) and event streams pass through
+untouched.
+"""
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder, IdentityResponder
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is used instead
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/x-javascript",
+    "image/svg+xml",
+)
+
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class _TextOnlyMixin:
+    """Skip compression for binary content (uploads, images, ...)"""
+
+    async def send_with_compression(self, message):
+        await super().send_with_compression(message)
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            if not is_compressible(content_type):
+                self.content_type_is_excluded = True
+
+
+class TextGZipResponder(_TextOnlyMixin, GZipResponder):
+    pass
+
+
+class BrotliResponder(_TextOnlyMixin, IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size, quality=5):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body, *, more_body):
+        output = self.compressor.process(body)
+        # Flush streamed chunks so the client is not left waiting on the encoder
+        return output + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+def accepts(accept_encoding, coding):
+    return any(part.split(";")[0].strip() == coding for part in accept_encoding.split(","))
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def __init__(self, app, minimum_size=500, compresslevel=6, brotli_quality=5):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("Accept-Encoding", "")
+        if brotli is not None and accepts(accept_encoding, "br"):
+            responder = BrotliResponder(self.app, self.minimum_size, quality=self.brotli_quality)
+        elif accepts(accept_encoding, "gzip"):
+            responder = TextGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
@@ -0,0 +1,246 @@
+"""
+Application settings.
+
+backend/.env is parsed once, on the first get_settings() call, and every
+module reads configuration from the cached Settings object instead of
+calling os.getenv / load_dotenv itself. As before, values in .env take
+precedence over variables already set in the process environment.
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from dotenv import dotenv_values
+
+ENV_PATH = Path(__file__).parent.parent / ".env"
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = value.strip().strip('"').strip("'")
+    return value or None
+
+
+def _bool(value, default=False):
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    openai_api_key: Optional[str]
+    openai_base_url: Optional[str]
+    secret_key: Optional[str]
+    database_url: str
+    database_replica_url: Optional[str]
+    read_your_writes_seconds: float
+
+    # Logging pipeline (see logging_config.py)
+    log_level: str
+    log_file: Optional[str]
+    log_max_bytes: int
+    log_backup_count: int
+    log_json: bool
+    log_queue_size: int
+    log_sample_rates: Optional[str]
+
+    # Pre-flight context sizing (see context_budget.py)
+    context_safety_margin_tokens: int
+    min_output_tokens: int
+
+    # WebSocket chat (see routes/chat_ws.py)
+    ws_max_conversations: int
+    ws_send_queue_size: int
+    ws_auth_timeout_seconds: float
+
+    # Response compression and page caching (see compression.py, assets.py)
+    compression_min_size: int
+    gzip_level: int
+    brotli_quality: int
+
+    # Background health checks (see health.py)
+    health_check_interval_seconds: float
+    health_check_timeout_seconds: float
+    health_upstream_required: bool
+
+    # Remote file deletion outbox (see file_cleanup.py)
+    file_cleanup_interval_seconds: float
+    file_cleanup_batch_size: int
+    file_cleanup_concurrency: int
+    file_cleanup_max_attempts: int
+
+    # Idempotency-Key handling (see idempotency.py)
+    idempotency_ttl_hours: float
+    idempotency_lock_seconds: float
+    idempotency_wait_seconds: float
+
+    # Upstream HTTP transport (see upstream.py)
+    upstream_http2: bool
+    upstream_max_connections: int
+    upstream_max_keepalive: int
+    upstream_keepalive_expiry: float
+    upstream_connect_timeout: float
+    upstream_timeout: float
+    upstream_dns_cache_seconds: float
+    upstream_prewarm: bool
+    upstream_prewarm_connections: int
+    upstream_keepwarm_seconds: float
+
+    # Production server (see serve.py)
+    serve_workers: int
+    serve_max_requests: int
+    serve_max_requests_jitter: int
+    serve_max_worker_memory_mb: int
+    serve_graceful_timeout: float
+    serve_drain_delay_seconds: float
+    serve_worker_timeout: float
+    serve_keepalive_seconds: int
+
+    # Background ingestion of uploaded files (see ingestion.py)
+    ingest_processes: int
+    ingest_interval_seconds: float
+    ingest_chunk_size: int
+    ingest_chunk_overlap: int
+    ingest_max_attempts: int
+
+    # Bulk user provisioning (see user_import.py)
+    admin_user_ids: tuple
+    user_import_batch_size: int
+    user_import_hash_threads: int
+    user_import_max_rows: int
+
+    # Request tracing (see tracing.py)
+    trace_exporter: str
+    trace_file: str
+    trace_sample_rate: float
+    trace_slow_ms: float
+    trace_max_spans: int
+    trace_trusted_peers: tuple
+
+    # Traffic recording for replay (see traffic_recorder.py)
+    traffic_record_path: str
+    traffic_record_sample_rate: float
+    traffic_record_salt: str
+
+    # Hedged chat requests (see hedging.py)
+    hedging_enabled: bool
+    hedge_max_extra_ratio: float
+    hedge_percentile: float
+    hedge_min_samples: int
+    hedge_min_delay_ms: float
+
+    # Model routing (see model_router.py)
+    allowed_models: tuple
+    router_ewma_alpha: float
+    router_max_error_rate: float
+    router_latency_factor: float
+    router_failure_threshold: int
+    router_cooldown_seconds: float
+    router_probe_rate: float
+
+    @classmethod
+    def from_env(cls, env_path=ENV_PATH):
+        values = dict(os.environ)
+        if env_path.exists():
+            values.update({k: v for k, v in dotenv_values(env_path).items() if v is not None})
+
+        def get(name, default=None):
+            value = _clean(values.get(name))
+            return default if value is None else value
+
+        return cls(
+            openai_api_key=get("OPENAI_API_KEY"),
+            openai_base_url=get("OPENAI_BASE_URL"),
+            secret_key=get("SECRET_KEY"),
+            database_url=get("DATABASE_URL", "sqlite:///./app.db"),
+            database_replica_url=get("DATABASE_REPLICA_URL"),
+            read_your_writes_seconds=float(get("READ_YOUR_WRITES_SECONDS", "5")),
+            log_level=get("LOG_LEVEL", "INFO").upper(),
+            log_file=get("LOG_FILE", "app.log"),
+            log_max_bytes=int(get("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+            log_backup_count=int(get("LOG_BACKUP_COUNT", "5")),
+            log_json=_bool(get("LOG_JSON"), default=True),
+            log_queue_size=int(get("LOG_QUEUE_SIZE", "10000")),
+            log_sample_rates=get("LOG_SAMPLE_RATES"),
+            context_safety_margin_tokens=int(get("CONTEXT_SAFETY_MARGIN_TOKENS", "256")),
+            min_output_tokens=int(get("MIN_OUTPUT_TOKENS", "256")),
+            ws_max_conversations=int(get("WS_MAX_CONVERSATIONS", "8")),
+            ws_send_queue_size=int(get("WS_SEND_QUEUE_SIZE", "64")),
+            ws_auth_timeout_seconds=float(get("WS_AUTH_TIMEOUT_SECONDS", "10")),
+            compression_min_size=int(get("COMPRESSION_MIN_SIZE", "500")),
+            gzip_level=int(get("GZIP_LEVEL", "6")),
+            brotli_quality=int(get("BROTLI_QUALITY", "5")),
+            health_check_interval_seconds=float(get("HEALTH_CHECK_INTERVAL_SECONDS", "15")),
+            health_check_timeout_seconds=float(get("HEALTH_CHECK_TIMEOUT_SECONDS", "5")),
+            health_upstream_required=_bool(get("HEALTH_UPSTREAM_REQUIRED")),
+            file_cleanup_interval_seconds=float(get("FILE_CLEANUP_INTERVAL_SECONDS", "5")),
+            file_cleanup_batch_size=int(get("FILE_CLEANUP_BATCH_SIZE", "50")),
+            file_cleanup_concurrency=int(get("FILE_CLEANUP_CONCURRENCY", "8")),
+            file_cleanup_max_attempts=int(get("FILE_CLEANUP_MAX_ATTEMPTS", "10")),
+            idempotency_ttl_hours=float(get("IDEMPOTENCY_TTL_HOURS", "24")),
+            idempotency_lock_seconds=float(get("IDEMPOTENCY_LOCK_SECONDS", "300")),
+            idempotency_wait_seconds=float(get("IDEMPOTENCY_WAIT_SECONDS", "60")),
+            upstream_http2=_bool(get("UPSTREAM_HTTP2"), default=True),
+            upstream_max_connections=int(get("UPSTREAM_MAX_CONNECTIONS", "100")),
+            upstream_max_keepalive=int(get("UPSTREAM_MAX_KEEPALIVE", "20")),
+            upstream_keepalive_expiry=float(get("UPSTREAM_KEEPALIVE_EXPIRY", "90")),
+            upstream_connect_timeout=float(get("UPSTREAM_CONNECT_TIMEOUT", "5")),
+            upstream_timeout=float(get("UPSTREAM_TIMEOUT", "600")),
+            upstream_dns_cache_seconds=float(get("UPSTREAM_DNS_CACHE_SECONDS", "300")),
+            upstream_prewarm=_bool(get("UPSTREAM_PREWARM"), default=True),
+            upstream_prewarm_connections=int(get("UPSTREAM_PREWARM_CONNECTIONS", "2")),
+            upstream_keepwarm_seconds=float(get("UPSTREAM_KEEPWARM_SECONDS", "45")),
+            serve_workers=int(get("SERVE_WORKERS", "0")),
+            serve_max_requests=int(get("SERVE_MAX_REQUESTS", "10000")),
+            serve_max_requests_jitter=int(get("SERVE_MAX_REQUESTS_JITTER", "1000")),
+            serve_max_worker_memory_mb=int(get("SERVE_MAX_WORKER_MEMORY_MB", "0")),
+            serve_graceful_timeout=float(get("SERVE_GRACEFUL_TIMEOUT", "120")),
+            serve_drain_delay_seconds=float(get("SERVE_DRAIN_DELAY_SECONDS", "5")),
+            serve_worker_timeout=float(get("SERVE_WORKER_TIMEOUT", "60")),
+            serve_keepalive_seconds=int(get("SERVE_KEEPALIVE_SECONDS", "5")),
+            ingest_processes=int(get("INGEST_PROCESSES", "0")),
+            ingest_interval_seconds=float(get("INGEST_INTERVAL_SECONDS", "10")),
+            ingest_chunk_size=int(get("INGEST_CHUNK_SIZE", "1000")),
+            ingest_chunk_overlap=int(get("INGEST_CHUNK_OVERLAP", "150")),
+            ingest_max_attempts=int(get("INGEST_MAX_ATTEMPTS", "3")),
+            admin_user_ids=tuple(
+                int(user_id) for user_id in (get("ADMIN_USER_IDS") or "").split(",") if user_id.strip()
+            ),
+            user_import_batch_size=int(get("USER_IMPORT_BATCH_SIZE", "500")),
+            user_import_hash_threads=int(get("USER_IMPORT_HASH_THREADS", "0")),
+            user_import_max_rows=int(get("USER_IMPORT_MAX_ROWS", "50000")),
+            trace_exporter=get("TRACE_EXPORTER", ""),
+            trace_file=get("TRACE_FILE", "traces.jsonl"),
+            trace_sample_rate=float(get("TRACE_SAMPLE_RATE", "0.01")),
+            trace_slow_ms=float(get("TRACE_SLOW_MS", "2000")),
+            trace_max_spans=int(get("TRACE_MAX_SPANS", "500")),
+            trace_trusted_peers=tuple(
+                peer.strip() for peer in (get("TRACE_TRUSTED_PEERS") or "").split(",") if peer.strip()
+            ),
+            traffic_record_path=get("TRAFFIC_RECORD_PATH", ""),
+            traffic_record_sample_rate=float(get("TRAFFIC_RECORD_SAMPLE_RATE", "1.0")),
+            traffic_record_salt=get("TRAFFIC_RECORD_SALT", ""),
+            hedging_enabled=_bool(get("CHAT_HEDGING_ENABLED")),
+            hedge_max_extra_ratio=float(get("HEDGE_MAX_EXTRA_RATIO", "0.05")),
+            hedge_percentile=float(get("HEDGE_PERCENTILE", "95")),
+            hedge_min_samples=int(get("HEDGE_MIN_SAMPLES", "20")),
+            hedge_min_delay_ms=float(get("HEDGE_MIN_DELAY_MS", "100")),
+            allowed_models=tuple(
+                model.strip() for model in (get("ALLOWED_MODELS") or "").split(",") if model.strip()
+            ),
+            router_ewma_alpha=float(get("ROUTER_EWMA_ALPHA", "0.2")),
+            router_max_error_rate=float(get("ROUTER_MAX_ERROR_RATE", "0.5")),
+            router_latency_factor=float(get("ROUTER_LATENCY_FACTOR", "3.0")),
+            router_failure_threshold=int(get("ROUTER_FAILURE_THRESHOLD", "3")),
+            router_cooldown_seconds=float(get("ROUTER_COOLDOWN_SECONDS", "30")),
+            router_probe_rate=float(get("ROUTER_PROBE_RATE", "0.05")),
+        )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings.from_env()
@@ -0,0 +1,146 @@
+"""
+Pre-flight token estimation and context trimming.
+
+Before any network call the chat request is sized against the smallest
+context window among the project's allowed models:
+
+- if the user message (plus any chained history) cannot fit together with
+  a minimum output allowance, the request is rejected (ContextTooLarge);
+- otherwise project prompts are kept by priority (highest first, then
+  lowest id) until the budget is used; a prompt that only partly fits is
+  truncated and the rest are dropped. Kept prompts stay in id order, so the
+  cacheable prefix does not change between requests;
+- the output cap is reduced to whatever budget remains.
+
+Token counts use tiktoken when it is installed and a conservative
+character/word heuristic otherwise.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .config import get_settings
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional
+    _encoding = None
+
+# Context windows (input + output tokens) by model name prefix; longest prefix wins
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1-nano": 1047576,
+    "gpt-5": 400000,
+    "o3": 200000,
+    "o4-mini": 200000,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 128000
+
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+class ContextTooLarge(ValueError):
+    """The request cannot fit the model context, whatever is trimmed"""
+
+
+@dataclass
+class ContextPlan:
+    prompt_contents: list
+    max_output_tokens: int
+    input_tokens: int
+    dropped_prompts: list = field(default_factory=list)
+    truncated_prompt: Optional[int] = None
+
+
+def estimate_tokens(text):
+    """Estimated token count of text"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # ~1 token per punctuation mark, ~1 token per 4 characters of a word
+    return sum(1 + (len(m) - 1) // 4 for m in _TOKEN_PATTERN.findall(text))
+
+
+def context_window(model):
+    best = None
+    for prefix, window in MODEL_CONTEXT_WINDOWS.items():
+        if model.startswith(prefix) and (best is None or len(prefix) > len(best[0])):
+            best = (prefix, window)
+    return best[1] if best else DEFAULT_CONTEXT_WINDOW
+
+
+def _truncate(text, max_tokens):
+    """Cut text to roughly max_tokens, preferring a whitespace boundary"""
+    if max_tokens <= 0:
+        return ""
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens])
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    space = cut.rfind(" ")
+    return cut[:space] if space > len(cut) // 2 else cut
+
+
+def plan_context(models, prompts, message, max_output_tokens, history_tokens=0, default_prompt=""):
+    """
+    Size a chat request. prompts is a list of dicts with id, priority and
+    content; history_tokens is the upstream context carried by a chained turn.
+    Returns a ContextPlan or raises ContextTooLarge.
+    """
+    settings = get_settings()
+    window = min(context_window(m) for m in models) - settings.context_safety_margin_tokens
+    min_output = min(max_output_tokens, settings.min_output_tokens)
+
+    fixed = estimate_tokens(message) + MESSAGE_OVERHEAD_TOKENS + history_tokens
+    if fixed + min_output > window:
+        raise ContextTooLarge(
+            f"Message needs about {fixed} tokens but the model context allows "
+            f"{window - min_output}. Shorten the message or start a new conversation."
+        )
+
+    prompt_budget = window - fixed - min_output
+    kept = {}
+    dropped = []
+    truncated = None
+    used = 0
+    if prompts:
+        used = MESSAGE_OVERHEAD_TOKENS
+        ranked = sorted(prompts, key=lambda p: (-(p["priority"] or 0), p["id"]))
+        for prompt in ranked:
+            # +1 for the newline joining prompts
+            cost = estimate_tokens(prompt["content"]) + 1
+            if used + cost <= prompt_budget:
+                kept[prompt["id"]] = prompt["content"]
+                used += cost
+            elif truncated is None and prompt_budget - used > MESSAGE_OVERHEAD_TOKENS:
+                kept[prompt["id"]] = _truncate(prompt["content"], prompt_budget - used - 1)
+                used = prompt_budget
+                truncated = prompt["id"]
+            else:
+                dropped.append(prompt["id"])
+    elif default_prompt:
+        used = estimate_tokens(default_prompt) + MESSAGE_OVERHEAD_TOKENS
+
+    input_tokens = fixed + used
+    return ContextPlan(
+        prompt_contents=[kept[pid] for pid in sorted(kept)],
+        max_output_tokens=max(min_output, min(max_output_tokens, window - input_tokens)),
+        input_tokens=input_tokens,
+        dropped_prompts=dropped,
+        truncated_prompt=truncated,
+    )
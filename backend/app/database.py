@@ -1,20 +1,28 @@
-import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from pathlib import Path
-from dotenv import load_dotenv
+from sqlalchemy.schema import CreateIndex
 
-# Load environment variables
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path, override=True)
+from .config import get_settings
+from .tracing import instrument_engine
 
 # Database URL from environment or default to SQLite
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+DATABASE_URL = get_settings().database_url
+# Optional read replica for read-only routes (see read_routing.py)
+DATABASE_REPLICA_URL = get_settings().database_replica_url
+
+
+def _create_engine(url, name):
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if url.startswith("sqlite") else {}
+    )
+    instrument_engine(engine, name)
+    return engine
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+engine = _create_engine(DATABASE_URL, "primary")
+replica_engine = _create_engine(DATABASE_REPLICA_URL, "replica") if DATABASE_REPLICA_URL else None
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -22,6 +30,13 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+# Sessions on the replica; the primary when no replica is configured
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=replica_engine or engine
+)
+
 Base = declarative_base()
 
 
@@ -32,3 +47,28 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def add_missing_columns():
+    """
+    Add columns that exist on the models but not yet in the database.
+    create_all() only creates missing tables, so new nullable columns (and
+    new indexes) on existing tables (e.g. in an existing app.db) are added here.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                ))
+            for index in table.indexes:
+                # The inspector does not list expression indexes on SQLite
+                conn.execute(CreateIndex(index, if_not_exists=True))
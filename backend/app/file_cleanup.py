@@ -0,0 +1,165 @@
+"""
+Asynchronous deletion of uploaded files from the upstream API.
+
+Request handlers never call files.delete themselves: they add a
+RemoteFileDeletion row in the same transaction that removes the
+ProjectFile, and return. A background task started with the app drains
+that outbox every FILE_CLEANUP_INTERVAL_SECONDS:
+
+1. claim up to FILE_CLEANUP_BATCH_SIZE due rows (a conditional UPDATE with a
+   per-batch token, so several worker processes never take the same row);
+2. delete the files upstream, FILE_CLEANUP_CONCURRENCY at a time;
+3. drop the rows that succeeded (or were already gone upstream) and push
+   the others back with exponential backoff.
+
+Rows that fail FILE_CLEANUP_MAX_ATTEMPTS times stay in the table with
+their last error for manual inspection.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from prometheus_client import Counter
+from starlette.concurrency import run_in_threadpool
+
+from .config import get_settings
+from .database import SessionLocal
+from .models import RemoteFileDeletion
+from .upstream import get_async_client
+
+logger = logging.getLogger(__name__)
+
+# A claimed row becomes due again after this long, in case its worker died
+CLAIM_LEASE = timedelta(minutes=5)
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+files_deleted = Counter("remote_files_deleted_total", "Uploaded files deleted from the upstream API")
+deletes_failed = Counter("remote_file_delete_failures_total", "Failed upstream file deletions (will be retried)")
+
+
+def enqueue_deletions(db, openai_file_ids):
+    """Add files to the outbox; committed together with the caller's transaction"""
+    db.add_all([RemoteFileDeletion(openai_file_id=file_id) for file_id in openai_file_ids])
+
+
+def claim_batch(batch_size, max_attempts):
+    """Claim due outbox rows for this worker; returns [(id, openai_file_id, attempts)]"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        due = RemoteFileDeletion.next_attempt_at <= now
+        ids = [row.id for row in db.query(RemoteFileDeletion.id).filter(
+            due, RemoteFileDeletion.attempts < max_attempts
+        ).order_by(RemoteFileDeletion.next_attempt_at).limit(batch_size)]
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        db.query(RemoteFileDeletion).filter(RemoteFileDeletion.id.in_(ids), due).update(
+            {"claim_token": token, "next_attempt_at": now + CLAIM_LEASE}, synchronize_session=False
+        )
+        db.commit()
+        return [
+            (row.id, row.openai_file_id, row.attempts)
+            for row in db.query(
+                RemoteFileDeletion.id, RemoteFileDeletion.openai_file_id, RemoteFileDeletion.attempts
+            ).filter(RemoteFileDeletion.claim_token == token)
+        ]
+    finally:
+        db.close()
+
+
+def record_results(done_ids, failures, max_attempts):
+    """Delete finished rows and reschedule failed ones (failures: {id: (attempts, error)})"""
+    db = SessionLocal()
+    try:
+        if done_ids:
+            db.query(RemoteFileDeletion).filter(RemoteFileDeletion.id.in_(done_ids)).delete(
+                synchronize_session=False
+            )
+        now = datetime.utcnow()
+        for row_id, (attempts, error) in failures.items():
+            delay = min(RETRY_BASE_SECONDS * 2 ** attempts, RETRY_MAX_SECONDS)
+            db.query(RemoteFileDeletion).filter(RemoteFileDeletion.id == row_id).update({
+                "attempts": attempts + 1,
+                "next_attempt_at": now + timedelta(seconds=delay),
+                "claim_token": None,
+                "last_error": error[:1000],
+            }, synchronize_session=False)
+            if attempts + 1 >= max_attempts:
+                logger.error("Giving up deleting remote file outbox row %s after %d attempts: %s",
+                             row_id, attempts + 1, error)
+        db.commit()
+    finally:
+        db.close()
+
+
+class FileCleanupWorker:
+    def __init__(self):
+        settings = get_settings()
+        self.interval = settings.file_cleanup_interval_seconds
+        self.batch_size = settings.file_cleanup_batch_size
+        self.concurrency = settings.file_cleanup_concurrency
+        self.max_attempts = settings.file_cleanup_max_attempts
+        self._task = None
+
+    async def _delete(self, semaphore, openai_file_id):
+        """None on success, else the error message"""
+        from openai import NotFoundError
+
+        async with semaphore:
+            try:
+                await get_async_client().files.delete(openai_file_id)
+            except NotFoundError:
+                # Already gone upstream (or deleted by a previous attempt)
+                pass
+            except Exception as e:
+                return str(e) or type(e).__name__
+        return None
+
+    async def drain_once(self):
+        """Process one batch; returns the number of rows claimed"""
+        batch = await run_in_threadpool(claim_batch, self.batch_size, self.max_attempts)
+        if not batch:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        errors = await asyncio.gather(*(self._delete(semaphore, file_id) for _, file_id, _ in batch))
+
+        done_ids, failures = [], {}
+        for (row_id, file_id, attempts), error in zip(batch, errors):
+            if error is None:
+                done_ids.append(row_id)
+            else:
+                failures[row_id] = (attempts, error)
+                logger.warning("Deleting remote file %s failed (attempt %d): %s", file_id, attempts + 1, error)
+        files_deleted.inc(len(done_ids))
+        deletes_failed.inc(len(failures))
+        await run_in_threadpool(record_results, done_ids, failures, self.max_attempts)
+        return len(batch)
+
+    async def _loop(self):
+        while True:
+            try:
+                # Keep going while full batches come back, then wait
+                while await self.drain_once() >= self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error("Remote file cleanup failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+worker = FileCleanupWorker()
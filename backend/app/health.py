@@ -0,0 +1,149 @@
+"""
+Liveness and readiness.
+
+A background task checks the database (a pooled connection running
+SELECT 1) and the upstream API (a models.list call) every
+HEALTH_CHECK_INTERVAL_SECONDS and caches the results, so /livez and /readyz
+answer from memory without touching either dependency.
+
+- /livez: 200 while the event loop is serving requests.
+- /readyz: 503 until the first check has run, when the database check
+  failed (or the upstream check, if HEALTH_UPSTREAM_REQUIRED=true), when the
+  cached results are stale because the checker stopped, and while the
+  process is draining for shutdown.
+
+Draining starts at SIGTERM, not at lifespan shutdown: by then uvicorn has
+already closed its listeners. start() wraps the server's SIGTERM handler so
+that /readyz goes not-ready first and the server is only told to stop
+SERVE_DRAIN_DELAY_SECONDS later, while it keeps serving.
+"""
+import asyncio
+import logging
+import signal
+import threading
+import time
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from .config import get_settings
+from .database import engine, replica_engine
+from .upstream import get_client
+
+logger = logging.getLogger(__name__)
+
+
+def check_database(bind=engine):
+    with bind.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def check_upstream(timeout):
+    get_client().with_options(timeout=timeout, max_retries=0).models.list()
+
+
+class HealthMonitor:
+    def __init__(self):
+        settings = get_settings()
+        self.interval = settings.health_check_interval_seconds
+        self.timeout = settings.health_check_timeout_seconds
+        self.upstream_required = settings.health_upstream_required
+        self.checks = {}
+        self.draining = False
+        self._task = None
+
+    async def _run_check(self, name, check, *args):
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(run_in_threadpool(check, *args), timeout=self.timeout)
+            result = {"ok": True}
+        except Exception as e:
+            # TimeoutError has an empty message
+            result = {"ok": False, "error": str(e) or type(e).__name__}
+        result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        result["checked_at"] = time.time()
+        previous = self.checks.get(name)
+        if previous is None or previous["ok"] != result["ok"]:
+            log = logger.info if result["ok"] else logger.warning
+            log("Health check %s is %s%s", name, "ok" if result["ok"] else "failing",
+                "" if result["ok"] else f": {result['error']}")
+        self.checks[name] = result
+
+    async def check_once(self):
+        checks = [
+            self._run_check("database", check_database),
+            self._run_check("upstream", check_upstream, self.timeout),
+        ]
+        if replica_engine is not None:
+            # Reported, but does not gate readiness
+            checks.append(self._run_check("replica", check_database, replica_engine))
+        await asyncio.gather(*checks)
+
+    async def _loop(self):
+        while True:
+            await self.check_once()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self.draining = False
+            self._task = asyncio.create_task(self._loop())
+            self._install_drain_hook()
+
+    def _install_drain_hook(self):
+        # Runs after uvicorn (or its gunicorn worker) has installed its own handlers
+        previous = signal.getsignal(signal.SIGTERM)
+        if not callable(previous):
+            return
+        delay = get_settings().serve_drain_delay_seconds
+
+        def handle_sigterm(sig, frame):
+            if self.draining or delay <= 0:
+                # A second SIGTERM stops the server right away
+                self.begin_drain()
+                previous(sig, frame)
+                return
+            logger.info("SIGTERM received, draining for %ss before shutting down", delay)
+            self.begin_drain()
+            threading.Timer(delay, previous, (sig, frame)).start()
+
+        try:
+            signal.signal(signal.SIGTERM, handle_sigterm)
+        except ValueError:
+            # Not the main thread (e.g. the test client); nothing to wrap
+            pass
+
+    async def stop(self):
+        self.draining = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def begin_drain(self):
+        """Report not-ready from now on, so load balancers stop routing here"""
+        self.draining = True
+
+    def readiness(self):
+        """(ready, reasons, checks) from the cached results"""
+        reasons = []
+        if self.draining:
+            reasons.append("draining")
+        required = ["database"] + (["upstream"] if self.upstream_required else [])
+        stale_after = 3 * self.interval + self.timeout
+        now = time.time()
+        for name in required:
+            result = self.checks.get(name)
+            if result is None:
+                reasons.append(f"{name}: not checked yet")
+            elif not result["ok"]:
+                reasons.append(f"{name}: {result['error']}")
+            elif now - result["checked_at"] > stale_after:
+                reasons.append(f"{name}: stale result")
+        return not reasons, reasons, self.checks
+
+
+monitor = HealthMonitor()
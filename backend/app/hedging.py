@@ -0,0 +1,250 @@
+"""
+Hedged upstream requests for the chat path.
+
+When enabled (CHAT_HEDGING_ENABLED=true), a chat call is made as a streaming
+request. If it has not produced its first token within a threshold derived
+from the observed p95 time-to-first-token, a second identical request is
+fired. Whichever produces a token first wins; the other attempt is aborted
+at once (over HTTP/1.1 its connection is shut down, see upstream_transport.py;
+over HTTP/2 it stops at its next event).
+Extra calls are bounded by a budget (HEDGE_MAX_EXTRA_RATIO, default 5%).
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from prometheus_client import Counter
+
+from .config import get_settings
+from .upstream_transport import AbortHandle, current_abort_handle
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+HEDGING_ENABLED = settings.hedging_enabled
+HEDGE_MAX_EXTRA_RATIO = settings.hedge_max_extra_ratio
+HEDGE_PERCENTILE = settings.hedge_percentile
+HEDGE_MIN_SAMPLES = settings.hedge_min_samples
+HEDGE_MIN_DELAY_MS = settings.hedge_min_delay_ms
+
+hedges_fired = Counter("chat_hedges_fired_total", "Hedge requests sent to the upstream API")
+hedges_won = Counter("chat_hedges_won_total", "Hedge requests that produced the first token before the primary")
+hedges_denied = Counter("chat_hedges_budget_denied_total", "Hedges skipped because the budget was exhausted")
+
+# Hedges only; primary attempts run on the caller's thread
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+
+class LatencyTracker:
+    """Rolling window of time-to-first-token samples (seconds)"""
+
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            values = sorted(self._samples)
+        if len(values) < HEDGE_MIN_SAMPLES:
+            return None
+        index = min(len(values) - 1, int(len(values) * pct / 100.0))
+        return values[index]
+
+
+class HedgeBudget:
+    """
+    Token bucket limiting hedges to a fraction of primary calls.
+    Every primary call deposits `ratio` tokens, every hedge spends one.
+    """
+
+    def __init__(self, ratio, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+first_token_latency = LatencyTracker()
+budget = HedgeBudget(HEDGE_MAX_EXTRA_RATIO)
+
+
+def hedge_threshold():
+    """Seconds to wait for a first token before hedging, or None if unknown"""
+    observed = first_token_latency.percentile(HEDGE_PERCENTILE)
+    if observed is None:
+        return None
+    return max(observed, HEDGE_MIN_DELAY_MS / 1000.0)
+
+
+class _Race:
+    """Shared state between the primary and hedge attempts of one call"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.winner = None
+        self.failures = {}
+        self.handles = {}
+        self.hedge = None
+
+    def enter(self, index, handle):
+        """Register an attempt's abort handle; False if the race is already decided"""
+        with self.cond:
+            if self.winner is not None:
+                return False
+            self.handles[index] = handle
+            return True
+
+    def claim(self, index):
+        with self.cond:
+            if self.winner is None:
+                self.winner = index
+                losers = [handle for i, handle in self.handles.items() if i != index]
+                self.cond.notify_all()
+            else:
+                losers = []
+        # A stalled loser may not read another byte for a long time; stop it now
+        for handle in losers:
+            handle.abort()
+        return self.winner == index
+
+    def abort_all(self):
+        with self.cond:
+            handles = list(self.handles.values())
+        for handle in handles:
+            handle.abort()
+
+    def fail(self, index, error):
+        with self.cond:
+            self.failures[index] = error
+            self.cond.notify_all()
+
+    def lost(self, index):
+        return self.winner is not None and self.winner != index
+
+
+def _consume(index, create_stream, race, cancel=None, on_first_token=None):
+    """Run one streaming attempt; returns the completed response if it wins"""
+    handle = AbortHandle()
+    if not race.enter(index, handle):
+        return None
+    token = current_abort_handle.set(handle)
+    # Timed from the attempt's own start, not from when the call began
+    started = time.monotonic()
+    stream = None
+    try:
+        stream = create_stream()
+        for event in stream:
+            if race.lost(index):
+                return None
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            if event.type == "response.output_text.delta" and race.winner is None:
+                first_token_latency.record(time.monotonic() - started)
+                if not race.claim(index):
+                    return None
+                if on_first_token is not None:
+                    on_first_token()
+            elif event.type == "response.completed":
+                race.claim(index)
+                return event.response if race.winner == index else None
+            elif event.type in ("error", "response.failed"):
+                raise RuntimeError(getattr(event, "message", None) or f"Upstream stream {event.type}")
+        raise RuntimeError("Upstream stream ended without a completed response")
+    except Exception as e:
+        if race.lost(index):
+            # Aborted by the winner
+            return None
+        race.fail(index, e)
+        raise
+    finally:
+        # Before close() hands the connection back to the pool
+        handle.release()
+        current_abort_handle.reset(token)
+        if stream is not None:
+            stream.close()
+
+
+def hedged_create(create_stream, cancel=None, on_first_token=None):
+    """
+    Call create_stream() (a streaming responses.create) with hedging.
+    Returns the final Response object of the winning attempt. Attempts stop
+    (raising cancellation.Cancelled) once the optional cancel token is set.
+    on_first_token() is called once, when the winner streams its first token.
+
+    The primary attempt runs on the calling thread; only hedges use the
+    pool, started by a timer if the primary has no first token in time.
+    """
+    budget.deposit()
+    race = _Race()
+    # Hedges run in the request's context, so per-request state (e.g. the
+    # traffic recorder, tracing) sees their upstream calls
+    context = contextvars.copy_context()
+
+    def fire_hedge():
+        with race.cond:
+            if race.winner is not None or race.failures or (cancel and cancel.cancelled):
+                return
+            if not budget.try_spend():
+                hedges_denied.inc()
+                return
+            hedges_fired.inc()
+            logger.info("Hedging chat request after %.2fs without a first token", threshold)
+            race.hedge = _executor.submit(context.run, _consume, 1, create_stream, race, cancel,
+                                          on_first_token)
+
+    threshold = hedge_threshold()
+    timer = None
+    if threshold is not None:
+        timer = threading.Timer(threshold, fire_hedge)
+        timer.daemon = True
+        timer.start()
+
+    response = primary_error = None
+    try:
+        response = _consume(0, create_stream, race, cancel, on_first_token)
+    except Exception as e:
+        primary_error = e
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    with race.cond:
+        # fire_hedge holds the lock while deciding, so race.hedge is settled here
+        hedge = race.hedge
+        if race.winner == 0:
+            if primary_error is not None:
+                # The primary won with its first token, then failed mid-stream
+                raise primary_error
+            return response
+        if race.winner is None and hedge is not None and cancel is not None and cancel.cancelled:
+            # The client is gone; stop the hedge too
+            race.abort_all()
+            hedge = None
+        if hedge is None:
+            raise race.failures[0]
+        race.cond.wait_for(lambda: race.winner is not None or 1 in race.failures)
+        winner = race.winner
+
+    if winner is None:
+        # Every attempt failed before producing a token; surface the primary's error
+        raise race.failures[0]
+    hedges_won.inc()
+    return hedge.result()
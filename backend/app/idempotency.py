@@ -0,0 +1,213 @@
+"""
+Idempotency-Key support for endpoints that are expensive to repeat
+(/chat and file uploads).
+
+A request carrying an Idempotency-Key header claims the (user, key) row in
+idempotency_keys before doing any work:
+
+- no row yet: the request runs; its successful response is stored for
+  IDEMPOTENCY_TTL_HOURS. On failure the claim is released, so a retry runs
+  again;
+- a completed row: the stored response is replayed (with an
+  Idempotent-Replayed: true header) without calling the handler;
+- a row still in progress: the duplicate waits, up to
+  IDEMPOTENCY_WAIT_SECONDS, for the first request to finish, then replays
+  its response, or runs itself if the first one failed. A claim older than
+  IDEMPOTENCY_LOCK_SECONDS is assumed abandoned (crashed worker) and taken
+  over.
+
+Reusing a key with a different request body is rejected with 422. The
+claim is a unique row in the primary database, so it holds across worker
+processes.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from .config import get_settings
+from .database import SessionLocal
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL_SECONDS = 0.1
+MAX_POLL_INTERVAL_SECONDS = 1.0
+
+settings = get_settings()
+TTL = timedelta(hours=settings.idempotency_ttl_hours)
+LOCK_TIMEOUT = timedelta(seconds=settings.idempotency_lock_seconds)
+WAIT_SECONDS = settings.idempotency_wait_seconds
+
+_last_purge = 0.0
+
+
+def fingerprint(payload):
+    """Stable hash of the request data a key is bound to"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _purge_expired(db, now):
+    """Drop expired records, at most once a minute per process"""
+    global _last_purge
+    if time.monotonic() - _last_purge < 60:
+        return
+    _last_purge = time.monotonic()
+    db.query(IdempotencyRecord).filter(IdempotencyRecord.expires_at < now).delete(synchronize_session=False)
+    db.commit()
+
+
+def claim(user_id, key, request_hash):
+    """
+    Try to take the key. Returns ("claimed", None), ("completed", record)
+    or ("in_progress", None).
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        _purge_expired(db, now)
+        db.add(IdempotencyRecord(
+            user_id=user_id, key=key, request_hash=request_hash,
+            locked_at=now, expires_at=now + TTL
+        ))
+        try:
+            db.commit()
+            return "claimed", None
+        except IntegrityError:
+            db.rollback()
+
+        record = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.user_id == user_id, IdempotencyRecord.key == key
+        ).first()
+        if record is None:
+            # Released or purged in the meantime; the caller tries again
+            return "in_progress", None
+        if record.request_hash != request_hash:
+            raise HTTPException(status_code=422, detail=f"{HEADER} was already used for a different request")
+        if record.expires_at < now or (record.status_code is None and record.locked_at < now - LOCK_TIMEOUT):
+            # Expired, or its owner died: take it over if nobody else did first
+            taken = db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.id == record.id, IdempotencyRecord.locked_at == record.locked_at
+            ).update({
+                "locked_at": now, "expires_at": now + TTL, "status_code": None, "response_body": None
+            }, synchronize_session=False)
+            db.commit()
+            return ("claimed", None) if taken else ("in_progress", None)
+        if record.status_code is not None:
+            return "completed", record
+        return "in_progress", None
+    finally:
+        db.close()
+
+
+def complete(user_id, key, status_code, body):
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.user_id == user_id, IdempotencyRecord.key == key
+        ).update({"status_code": status_code, "response_body": json.dumps(body)}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def release(user_id, key):
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.user_id == user_id,
+            IdempotencyRecord.key == key,
+            IdempotencyRecord.status_code.is_(None)
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def replay(record):
+    return JSONResponse(
+        status_code=record.status_code,
+        content=json.loads(record.response_body),
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def idempotency_key(request: Request):
+    key = request.headers.get(HEADER)
+    if key is not None and not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{HEADER} must be 1-{MAX_KEY_LENGTH} characters")
+    return key
+
+
+def _wait_timeout():
+    return HTTPException(status_code=409, detail=f"A request with this {HEADER} is still in progress")
+
+
+def run_idempotent(request: Request, user_id, payload, handler):
+    """Run handler() at most once per (user, Idempotency-Key); sync endpoints"""
+    key = idempotency_key(request)
+    if key is None:
+        return handler()
+
+    request_hash = fingerprint(payload)
+    deadline = time.monotonic() + WAIT_SECONDS
+    interval = POLL_INTERVAL_SECONDS
+    while True:
+        state, record = claim(user_id, key, request_hash)
+        if state == "completed":
+            return replay(record)
+        if state == "claimed":
+            break
+        if time.monotonic() > deadline:
+            raise _wait_timeout()
+        time.sleep(interval)
+        interval = min(interval * 2, MAX_POLL_INTERVAL_SECONDS)
+
+    try:
+        result = handler()
+    except BaseException:
+        release(user_id, key)
+        raise
+    body = jsonable_encoder(result)
+    complete(user_id, key, 200, body)
+    return body
+
+
+async def run_idempotent_async(request: Request, user_id, payload, handler):
+    """Async variant of run_idempotent; handler is a coroutine function"""
+    key = idempotency_key(request)
+    if key is None:
+        return await handler()
+
+    request_hash = fingerprint(payload)
+    deadline = time.monotonic() + WAIT_SECONDS
+    interval = POLL_INTERVAL_SECONDS
+    while True:
+        state, record = await run_in_threadpool(claim, user_id, key, request_hash)
+        if state == "completed":
+            return replay(record)
+        if state == "claimed":
+            break
+        if time.monotonic() > deadline:
+            raise _wait_timeout()
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, MAX_POLL_INTERVAL_SECONDS)
+
+    try:
+        result = await handler()
+    except BaseException:
+        await run_in_threadpool(release, user_id, key)
+        raise
+    body = jsonable_encoder(result)
+    await run_in_threadpool(complete, user_id, key, 200, body)
+    return body
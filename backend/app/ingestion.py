@@ -0,0 +1,255 @@
+"""
+Background ingestion of uploaded files.
+
+An upload stores its bytes in file_ingestion_jobs, in the same transaction
+that creates the ProjectFile (status "pending"), and returns. A background
+task started with the app claims due jobs (a conditional UPDATE with a
+per-batch token, as in file_cleanup.py, so several worker processes never
+take the same job) and runs text_extraction.ingest on them in a process
+pool, INGEST_PROCESSES at a time, so extraction scales with cores and
+never holds the event loop or the GIL. Every app worker runs its own pool,
+so the default splits the cores between them (cores / SERVE_WORKERS).
+Jobs are claimed without their bytes; each upload is loaded only when its
+extraction starts, so at most one body per busy process is held in memory.
+
+Results replace the file's chunks in file_chunks and set its status:
+
+- ready: text extracted; chunk_count chunks with offsets into the
+  normalized text;
+- unsupported: not a PDF, DOCX, Markdown or text file (or the optional
+  package for its type is missing);
+- failed: the document could not be read, or the job itself kept failing
+  (e.g. a worker process crashed) INGEST_MAX_ATTEMPTS times.
+
+Uploads wake the task up, so jobs normally start right away;
+INGEST_INTERVAL_SECONDS is only the fallback poll for retries and for jobs
+queued by other processes.
+"""
+import asyncio
+import logging
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from prometheus_client import Counter
+from starlette.concurrency import run_in_threadpool
+
+from .capacity import available_cpus, worker_count
+from .config import get_settings
+from .database import SessionLocal
+from .models import FileChunk, FileIngestionJob, ProjectFile
+from .text_extraction import ingest
+
+logger = logging.getLogger(__name__)
+
+# A claimed job becomes due again after this long, in case its worker died
+CLAIM_LEASE = timedelta(minutes=10)
+RETRY_BASE_SECONDS = 30
+# Restart worker processes now and then, so memory held by parsers is returned
+TASKS_PER_PROCESS = 200
+
+files_ingested = Counter("files_ingested_total", "Uploaded files processed by ingestion", ["status"])
+chunks_stored = Counter("file_chunks_stored_total", "Text chunks stored by ingestion")
+
+
+def enqueue_ingestion(db, project_file, contents):
+    """Queue a new ProjectFile for ingestion; committed with the caller's transaction"""
+    db.add(FileIngestionJob(file_id=project_file.id, project_id=project_file.project_id, content=contents))
+
+
+def claim_batch(batch_size):
+    """Claim due jobs for this worker; returns [(job id, file id, attempts, filename)]"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        due = FileIngestionJob.next_attempt_at <= now
+        ids = [row.id for row in db.query(FileIngestionJob.id).filter(due).order_by(
+            FileIngestionJob.next_attempt_at
+        ).limit(batch_size)]
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        db.query(FileIngestionJob).filter(FileIngestionJob.id.in_(ids), due).update(
+            {"claim_token": token, "next_attempt_at": now + CLAIM_LEASE}, synchronize_session=False
+        )
+        rows = db.query(
+            FileIngestionJob.id, FileIngestionJob.file_id, FileIngestionJob.attempts,
+            ProjectFile.filename
+        ).join(ProjectFile, ProjectFile.id == FileIngestionJob.file_id).filter(
+            FileIngestionJob.claim_token == token
+        ).all()
+        db.query(ProjectFile).filter(ProjectFile.id.in_([row.file_id for row in rows])).update(
+            {"status": "processing"}, synchronize_session=False
+        )
+        db.commit()
+        return [tuple(row) for row in rows]
+    finally:
+        db.close()
+
+
+def load_content(job_id):
+    """The uploaded bytes of a claimed job, or None if it was deleted meanwhile"""
+    db = SessionLocal()
+    try:
+        row = db.query(FileIngestionJob.content).filter(FileIngestionJob.id == job_id).first()
+        return row.content if row is not None else None
+    finally:
+        db.close()
+
+
+def store_result(job_id, file_id, status, detail, chunks):
+    """Replace the file's chunks, set its status and drop the job"""
+    db = SessionLocal()
+    try:
+        project_file = db.query(ProjectFile).filter(ProjectFile.id == file_id).first()
+        if project_file is not None:
+            # Deleted files are simply dropped with their job
+            db.query(FileChunk).filter(FileChunk.file_id == file_id).delete(synchronize_session=False)
+            db.bulk_insert_mappings(FileChunk, [
+                {
+                    "file_id": file_id,
+                    "project_id": project_file.project_id,
+                    "chunk_index": index,
+                    "start_offset": start,
+                    "end_offset": end,
+                    "content": content,
+                }
+                for index, (start, end, content) in enumerate(chunks)
+            ])
+            project_file.status = status
+            project_file.status_detail = detail
+            project_file.chunk_count = len(chunks)
+            project_file.ingested_at = datetime.utcnow()
+        db.query(FileIngestionJob).filter(FileIngestionJob.id == job_id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def record_failure(job_id, file_id, attempts, error, max_attempts):
+    """Retry the job later with backoff, or give up and mark the file failed"""
+    if attempts + 1 >= max_attempts:
+        logger.error("Giving up ingesting file %s after %d attempts: %s", file_id, attempts + 1, error)
+        store_result(job_id, file_id, "failed", error, [])
+        return
+    db = SessionLocal()
+    try:
+        db.query(FileIngestionJob).filter(FileIngestionJob.id == job_id).update({
+            "attempts": attempts + 1,
+            "next_attempt_at": datetime.utcnow() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** attempts),
+            "claim_token": None,
+        }, synchronize_session=False)
+        db.query(ProjectFile).filter(ProjectFile.id == file_id).update(
+            {"status": "pending", "status_detail": error[:1000]}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+class IngestionWorker:
+    def __init__(self):
+        settings = get_settings()
+        self.processes = settings.ingest_processes or max(1, available_cpus() // worker_count())
+        self.interval = settings.ingest_interval_seconds
+        self.chunk_size = settings.ingest_chunk_size
+        self.chunk_overlap = settings.ingest_chunk_overlap
+        self.max_attempts = settings.ingest_max_attempts
+        self._pool = None
+        self._task = None
+        self._wake = None
+        self._slots = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn: children must not inherit the app's threads, sockets and pools
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=TASKS_PER_PROCESS,
+            )
+        return self._pool
+
+    def _reset_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def notify(self):
+        """Start on newly queued jobs now instead of at the next poll"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _process(self, job):
+        job_id, file_id, attempts, filename = job
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            await self._extract(loop, job_id, file_id, attempts, filename)
+
+    async def _extract(self, loop, job_id, file_id, attempts, filename):
+        content = await run_in_threadpool(load_content, job_id)
+        if content is None:
+            # The file was deleted after the job was claimed
+            return
+        try:
+            status, detail, chunks = await loop.run_in_executor(
+                self._get_pool(), ingest, filename, content, self.chunk_size, self.chunk_overlap
+            )
+        except BrokenProcessPool as e:
+            # A worker process died (e.g. out of memory); start a fresh pool
+            self._reset_pool()
+            await run_in_threadpool(record_failure, job_id, file_id, attempts,
+                                    f"Worker process died: {e}", self.max_attempts)
+            return
+        except Exception as e:
+            await run_in_threadpool(record_failure, job_id, file_id, attempts,
+                                    str(e) or type(e).__name__, self.max_attempts)
+            return
+        await run_in_threadpool(store_result, job_id, file_id, status, detail, chunks)
+        files_ingested.labels(status).inc()
+        chunks_stored.inc(len(chunks))
+        logger.info("Ingested file %s: %s, %d chunks", file_id, status, len(chunks))
+
+    async def drain_once(self):
+        """Process one batch (enough to keep every process busy); returns its size"""
+        if self._slots is None:
+            # Bodies are loaded only for jobs about to run on a free process
+            self._slots = asyncio.Semaphore(self.processes)
+        batch = await run_in_threadpool(claim_batch, self.processes * 2)
+        if batch:
+            await asyncio.gather(*(self._process(job) for job in batch))
+        return len(batch)
+
+    async def _loop(self):
+        while True:
+            self._wake.clear()
+            try:
+                while await self.drain_once():
+                    pass
+            except Exception as e:
+                logger.error("File ingestion failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Jobs cut short here are claimed again once their lease expires
+        self._reset_pool()
+
+
+worker = IngestionWorker()
@@ -1,68 +1,44 @@
 import logging
-import os
-from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 from pathlib import Path
 from prometheus_fastapi_instrumentator import Instrumentator
 
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path, override=True)
-
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
-from .database import Base, engine
-from .routes import user, project, prompt, chat, files
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+from .database import Base, engine, add_missing_columns
+from .routes import user, project, prompt, chat, chat_ws, files, dashboard
+from .upstream import get_api_key, warmer
+from .logging_config import configure_logging, shutdown_logging
+from .config import get_settings
+from .compression import CompressionMiddleware
+from .assets import ImmutableStaticFiles, PageCache, static_url
+from .health import monitor
+from . import file_cleanup, ingestion, search
+from .read_routing import ReadYourWritesMiddleware
+from .traffic_recorder import TrafficRecorderMiddleware, recorder
+from .tracing import TracingMiddleware, tracer
+from .serialization import FastJSONResponse
 
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
 # Validate OpenAI API key on startup
 def validate_openai_key():
     """Validate OpenAI API key is present and properly formatted"""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key and env_path.exists():
-        try:
-            with open(env_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and line.startswith("OPENAI_API_KEY="):
-                        api_key = line.split("=", 1)[1].strip().strip('"').strip("'")
-                        break
-        except Exception as e:
-            logger.warning(f"Could not read .env file: {e}")
-    
-    if not api_key:
-        logger.error("  WARNING: OPENAI_API_KEY not found in .env file!")
-        logger.error("   Please create backend/.env with: OPENAI_API_KEY=sk-proj-...")
-        return False
-    
-    api_key = api_key.strip()
-    if not api_key.startswith("sk-"):
-        logger.error(f"  WARNING: Invalid API key format! Key should start with 'sk-'")
+    try:
+        api_key = get_api_key()
+    except ValueError as e:
+        logger.error(f"  WARNING: {e}")
         return False
-    
+
     logger.info(f" OpenAI API key loaded successfully (length: {len(api_key)})")
     return True
 
-app = FastAPI(title="Chatbot Platform", version="1.0.0")
-
-Instrumentator().instrument(app).expose(app, endpoint="/metrics")
-
 # Validate required environment variables on startup
 def validate_required_env_vars():
     """Validate all required environment variables are present"""
@@ -85,8 +61,40 @@ def validate_required_env_vars():
         logger.error("   The application may not work correctly. Please check backend/.env file.")
     else:
         logger.info(" All required environment variables are configured")
+    return errors
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup work runs here rather than at import time, so importing the
+    # app (worker boot, test collection) stays cheap
+    configure_logging()
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    search.ensure_index()
+    missing = validate_required_env_vars()
+    monitor.start()
+    file_cleanup.worker.start()
+    ingestion.worker.start()
+    recorder.start()
+    tracer.start()
+    if "OPENAI_API_KEY" not in missing:
+        # Open upstream connections before the first chat needs them
+        warmer.start()
+    yield
+    await warmer.stop()
+    await monitor.stop()
+    await file_cleanup.worker.stop()
+    await ingestion.worker.stop()
+    recorder.stop()
+    tracer.stop()
+    shutdown_logging()
+
+
+app = FastAPI(title="Chatbot Platform", version="1.0.0", lifespan=lifespan,
+              default_response_class=FastJSONResponse)
 
-validate_required_env_vars()
+Instrumentator().instrument(app).expose(app, endpoint="/metrics")
 
 # Rate limiting (basic protection against abuse)
 limiter = Limiter(key_func=get_remote_address)
@@ -102,16 +110,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Route a user's reads to the primary for a short while after they write
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Sample chat/list traffic into a redacted trace (only with TRAFFIC_RECORD_PATH)
+app.add_middleware(TrafficRecorderMiddleware)
+
+# Compress HTML/JSON/JS responses (brotli when available, else gzip)
+settings = get_settings()
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_min_size,
+    compresslevel=settings.gzip_level,
+    brotli_quality=settings.brotli_quality,
+)
+
+# Trace requests, their SQL and upstream calls (only with TRACE_EXPORTER);
+# outermost, so the server span covers the whole request
+app.add_middleware(TracingMiddleware)
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
+app.mount("/static", ImmutableStaticFiles(directory=BASE_DIR / "static"), name="static")
 templates = Jinja2Templates(directory=BASE_DIR / "templates")
+templates.env.globals["static_url"] = static_url
+pages = PageCache(templates, gzip_level=settings.gzip_level)
 
 app.include_router(user.router)
 app.include_router(project.router)
 app.include_router(prompt.router)
 app.include_router(chat.router)
+app.include_router(chat_ws.router)
 app.include_router(files.router)
+app.include_router(dashboard.router)
 
 #@app.get("/")
 #def home(request: Request):
@@ -119,31 +150,44 @@ app.include_router(files.router)
 
 @app.get("/")
 def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return pages.response("index.html", request)
 
 
 
 @app.get("/dashboard")
-def dashboard(request: Request):
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+def dashboard_page(request: Request):
+    return pages.response("dashboard.html", request)
 
 @app.get("/chat")
 def chat_page(request: Request):
-    return templates.TemplateResponse("chat.html", {"request": request})
+    return pages.response("chat.html", request)
+
+
+@app.get("/livez")
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness probe, answered from the cached background checks"""
+    ready, reasons, checks = monitor.readiness()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not ready", "reasons": reasons, "checks": checks}
+    )
 
 
 @app.get("/health")
-def health_check():
-    """Health check endpoint for monitoring"""
-    try:
-        # Check database connection
-        from .database import SessionLocal
-        from sqlalchemy import text
-        db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        db.close()
-        return {"status": "healthy", "database": "connected"}
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return {"status": "unhealthy", "error": str(e)}
-        
\ No newline at end of file
+async def health_check():
+    """Health check endpoint for monitoring (cached; prefer /livez and /readyz)"""
+    ready, reasons, checks = monitor.readiness()
+    database = checks.get("database")
+    content = {
+        "status": "healthy" if ready else "unhealthy",
+        "database": "connected" if database and database["ok"] else "unavailable",
+    }
+    if not ready:
+        content["error"] = "; ".join(reasons)
+    return JSONResponse(status_code=200 if ready else 503, content=content)
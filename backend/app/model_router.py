@@ -0,0 +1,101 @@
+"""
+Latency-aware model routing.
+
+Each project lists its allowed models in preference order. The router keeps
+live per-model stats (EWMA time to first token, EWMA error rate, consecutive
+failures) and picks the first model that is not degraded, so traffic falls
+back to a secondary model while the primary is slow or failing. "Slow" is relative
+to the model's own baseline (a much slower EWMA of its latency), since
+models differ in speed: a larger model is not degraded just for being
+slower than a smaller one. A small share of
+requests still probes a degraded preferred model so it can recover.
+"""
+import random
+import threading
+import time
+
+from prometheus_client import Counter
+
+from .config import get_settings
+
+settings = get_settings()
+ROUTER_EWMA_ALPHA = settings.router_ewma_alpha
+ROUTER_MAX_ERROR_RATE = settings.router_max_error_rate
+ROUTER_LATENCY_FACTOR = settings.router_latency_factor
+ROUTER_FAILURE_THRESHOLD = settings.router_failure_threshold
+ROUTER_COOLDOWN_SECONDS = settings.router_cooldown_seconds
+ROUTER_PROBE_RATE = settings.router_probe_rate
+# The baseline follows sustained changes, over roughly ten times as many calls
+ROUTER_BASELINE_ALPHA = ROUTER_EWMA_ALPHA / 10
+
+model_selected = Counter("chat_model_selected_total", "Chat calls routed to each model", ["model"])
+model_fallbacks = Counter("chat_model_fallbacks_total", "Chat calls routed away from a project's primary model")
+
+
+class ModelStats:
+    def __init__(self):
+        self.latency = None          # EWMA seconds to first token
+        self.baseline = None         # slow EWMA seconds
+        self.error_rate = 0.0        # EWMA of failures (0..1)
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+
+
+class ModelRouter:
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model):
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats()
+        return stats
+
+    def record_success(self, model, seconds):
+        """seconds is the time to first token, which unlike the whole call does not grow with the reply"""
+        with self._lock:
+            stats = self._get(model)
+            if stats.latency is None:
+                stats.latency = stats.baseline = seconds
+            else:
+                stats.latency += ROUTER_EWMA_ALPHA * (seconds - stats.latency)
+                stats.baseline += ROUTER_BASELINE_ALPHA * (seconds - stats.baseline)
+            stats.error_rate *= 1 - ROUTER_EWMA_ALPHA
+            stats.consecutive_failures = 0
+
+    def record_failure(self, model):
+        with self._lock:
+            stats = self._get(model)
+            stats.error_rate += ROUTER_EWMA_ALPHA * (1 - stats.error_rate)
+            stats.consecutive_failures += 1
+            stats.last_failure = time.monotonic()
+
+    def _degraded(self, model):
+        stats = self._stats.get(model)
+        if stats is None:
+            return False
+        if (stats.consecutive_failures >= ROUTER_FAILURE_THRESHOLD
+                and time.monotonic() - stats.last_failure < ROUTER_COOLDOWN_SECONDS):
+            return True
+        if stats.error_rate > ROUTER_MAX_ERROR_RATE:
+            return True
+        if stats.latency is not None and stats.baseline and stats.latency > stats.baseline * ROUTER_LATENCY_FACTOR:
+            return True
+        return False
+
+    def choose(self, models):
+        """Pick the model to call from a project's allowed models (preference order)"""
+        with self._lock:
+            healthy = [m for m in models if not self._degraded(m)]
+
+        if not healthy or healthy[0] == models[0] or random.random() < ROUTER_PROBE_RATE:
+            chosen = models[0]
+        else:
+            chosen = healthy[0]
+            model_fallbacks.inc()
+        model_selected.labels(model=chosen).inc()
+        return chosen
+
+
+router = ModelRouter()
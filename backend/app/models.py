@@ -1,7 +1,16 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, Integer, String, Text, Float, JSON, DateTime, ForeignKey, LargeBinary, UniqueConstraint, Index, func
+)
 from sqlalchemy.orm import relationship
 from .database import Base
 
+# Generation defaults for projects without explicit settings
+DEFAULT_MODELS = ["gpt-4o-mini"]
+DEFAULT_MAX_OUTPUT_TOKENS = 2000
+DEFAULT_TEMPERATURE = 0.7
+
 
 class User(Base):
     __tablename__ = "users"
@@ -12,6 +21,9 @@ class User(Base):
 
     projects = relationship("Project", back_populates="owner")
 
+    # Logins and imports look emails up case-insensitively
+    __table_args__ = (Index("ix_users_email_lower", func.lower(email)),)
+
 
 class Project(Base):
     __tablename__ = "projects"
@@ -20,8 +32,15 @@ class Project(Base):
     name = Column(String)
     owner_id = Column(Integer, ForeignKey("users.id"))
 
+    # Generation settings: allowed models in preference order, output cap, temperature
+    models = Column(JSON, default=lambda: list(DEFAULT_MODELS))
+    max_output_tokens = Column(Integer, default=DEFAULT_MAX_OUTPUT_TOKENS)
+    temperature = Column(Float, default=DEFAULT_TEMPERATURE)
+
     owner = relationship("User", back_populates="projects")
-    prompts = relationship("Prompt", back_populates="project")
+    # Ordered so the system prompt built from them is byte-identical across
+    # requests, which keeps the upstream prompt cache warm
+    prompts = relationship("Prompt", back_populates="project", order_by="Prompt.id")
     files = relationship("ProjectFile", back_populates="project")
 
 
@@ -32,6 +51,8 @@ class Prompt(Base):
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
     name = Column(String(100), nullable=False)
     content = Column(Text, nullable=False)
+    # Higher priority prompts are kept first when the context must be trimmed
+    priority = Column(Integer, default=0)
 
     project = relationship("Project", back_populates="prompts")
 
@@ -44,5 +65,84 @@ class ProjectFile(Base):
     filename = Column(String(255), nullable=False)
     openai_file_id = Column(String(255), nullable=False)
     file_size = Column(Integer)
+    # Text extraction (see ingestion.py): pending, processing, ready,
+    # unsupported or failed; NULL for files uploaded before ingestion existed
+    status = Column(String(20), default="pending")
+    status_detail = Column(Text)
+    chunk_count = Column(Integer)
+    ingested_at = Column(DateTime)
 
     project = relationship("Project", back_populates="files")
+
+
+class FileIngestionJob(Base):
+    """Uploaded bytes waiting for text extraction (see ingestion.py)"""
+    __tablename__ = "file_ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("project_files.id"), unique=True, nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True, nullable=False)
+    content = Column(LargeBinary, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+    # Set by the worker that claimed the row, so concurrent workers skip it
+    claim_token = Column(String(64))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class FileChunk(Base):
+    """A slice of a file's normalized text; offsets index into that text"""
+    __tablename__ = "file_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("project_files.id"), index=True, nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True, nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    start_offset = Column(Integer, nullable=False)
+    end_offset = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+
+
+class RemoteFileDeletion(Base):
+    """Outbox of uploaded files still to be deleted upstream (see file_cleanup.py)"""
+    __tablename__ = "remote_file_deletions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    openai_file_id = Column(String(255), nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+    # Set by the worker that claimed the row, so concurrent workers skip it
+    claim_token = Column(String(64))
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ChatResponse(Base):
+    """One upstream response per chat turn, for chaining and usage stats"""
+    __tablename__ = "chat_responses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    response_id = Column(String(255), unique=True, index=True, nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    model = Column(String(100))
+    input_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class IdempotencyRecord(Base):
+    """Claim and stored response for an Idempotency-Key (see idempotency.py)"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_user_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    # NULL while the first request is still running
+    status_code = Column(Integer)
+    response_body = Column(Text)
+    locked_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, index=True, nullable=False)
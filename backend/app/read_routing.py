@@ -0,0 +1,90 @@
+"""
+Read-replica routing with read-your-writes.
+
+Read-only routes take their session from get_read_db, which uses the
+replica engine (DATABASE_REPLICA_URL) unless the caller wrote recently.
+After a successful POST/PUT/PATCH/DELETE, ReadYourWritesMiddleware
+records the write for READ_YOUR_WRITES_SECONDS:
+
+- per user, in this process (covers API clients without a cookie jar);
+- in a short-lived cookie, so a browser that wrote through one worker also
+  reads from the primary on the others.
+
+During that window the user's reads go to the primary, so they always see
+their own changes despite replication lag. Without a replica configured
+get_read_db simply returns a primary session.
+"""
+import threading
+import time
+
+from fastapi import Depends, Request
+from starlette.datastructures import MutableHeaders
+
+from .auth import get_current_user
+from .config import get_settings
+from .database import SessionLocal, ReadSessionLocal, replica_engine
+
+WINDOW_SECONDS = get_settings().read_your_writes_seconds
+COOKIE_NAME = "read_primary_until"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+_recent_writes = {}
+_lock = threading.Lock()
+
+
+def mark_write(user_id):
+    now = time.monotonic()
+    with _lock:
+        _recent_writes[user_id] = now + WINDOW_SECONDS
+        if len(_recent_writes) > 10000:
+            for key in [k for k, until in _recent_writes.items() if until <= now]:
+                del _recent_writes[key]
+
+
+def wrote_recently(request: Request, user_id):
+    until = _recent_writes.get(user_id)
+    if until is not None and until > time.monotonic():
+        return True
+    try:
+        return float(request.cookies.get(COOKIE_NAME, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def get_read_db(request: Request, user=Depends(get_current_user)):
+    """Session for read-only routes: the replica, or the primary right after a write"""
+    if replica_engine is None or wrote_recently(request, user.id):
+        db = SessionLocal()
+    else:
+        db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class ReadYourWritesMiddleware:
+    """Remember successful writes per user and per client (no-op without a replica)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or replica_engine is None or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                user_id = scope.get("state", {}).get("user_id")
+                if user_id is not None:
+                    mark_write(user_id)
+                    headers = MutableHeaders(scope=message)
+                    headers.append(
+                        "Set-Cookie",
+                        f"{COOKIE_NAME}={int(time.time() + WINDOW_SECONDS) + 1}; Max-Age={int(WINDOW_SECONDS) + 1}; "
+                        "Path=/; HttpOnly; SameSite=Lax"
+                    )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
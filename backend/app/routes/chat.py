@@ -2,91 +2,236 @@ import logging
 import time
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from openai import OpenAI
-from dotenv import load_dotenv
 from slowapi.util import get_remote_address
-import os
-from pathlib import Path
 
 from ..database import get_db
-from ..models import Project
+from ..read_routing import get_read_db
+from ..idempotency import run_idempotent
+from ..models import Project, ChatResponse, DEFAULT_MODELS, DEFAULT_MAX_OUTPUT_TOKENS, DEFAULT_TEMPERATURE
 from ..schemas import ChatRequest
 from ..auth import get_current_user
+from .. import hedging, model_router, tracing
+from ..cancellation import Cancelled, client_disconnect, upstream_cancelled
+from ..context_budget import plan_context, ContextTooLarge
+from ..upstream import get_client
 
 logger = logging.getLogger(__name__)
 
-# Load .env from backend directory
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path, override=True)
-
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
-# Get API key - check multiple sources with robust parsing
-def get_api_key():
-    """Get OpenAI API key from environment or .env file"""
-    # First try environment variable
-    api_key = os.getenv("OPENAI_API_KEY")
-    if api_key:
-        return api_key.strip()
-    
-    # If not found, read from .env file directly
-    if env_path.exists():
-        try:
-            with open(env_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and line.startswith("OPENAI_API_KEY="):
-                        key_value = line.split("=", 1)[1]
-                        # Remove quotes if present
-                        key_value = key_value.strip().strip('"').strip("'")
-                        if key_value:
-                            return key_value
-        except Exception as e:
-            logger.error(f"Error reading .env file: {e}")
-    
-    return None
+# Enhanced default system prompt for ChatGPT-like quality responses
+DEFAULT_SYSTEM_PROMPT = """You are ChatGPT, a large language model trained by OpenAI. 
+You are helpful, harmless, and honest. You provide detailed, accurate, and well-structured responses.
+When answering questions:
+- Be thorough and comprehensive
+- Break down complex topics into clear explanations
+- Use examples when helpful
+- Think step-by-step for complex problems
+- Admit when you don't know something
+- Format responses clearly with proper paragraphs
+- Be conversational but professional
+- Provide actionable advice when applicable"""
 
-api_key = get_api_key()
 
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found. Check backend/.env file has: OPENAI_API_KEY=sk-proj-...")
+def build_messages(prompt_contents, message, chained=False):
+    """
+    Build the Responses API input from a project's prompt contents and the user message.
 
-# Validate key format
-if not api_key.startswith("sk-"):
-    raise ValueError(f"Invalid API key format. Key should start with 'sk-'. Got: {api_key[:10]}...")
+    Stable content (the project prompts, in id order) always comes first and is
+    byte-identical between requests so the upstream prompt cache can reuse it;
+    per-turn content goes last. A chained turn (previous_response_id) sends only
+    the new message, since the earlier input is kept upstream.
+    """
+    user_message = {
+        "role": "user",
+        "content": message
+    }
+    if chained:
+        return [user_message]
+
+    # Build system prompt from project prompts
+    prompt_context = "\n".join(prompt_contents)
+    if not prompt_context:
+        prompt_context = DEFAULT_SYSTEM_PROMPT
+
+    return [
+        {
+            "role": "system",
+            "content": prompt_context
+        },
+        user_message
+    ]
+
+
+def generation_params(project):
+    """A project's generation settings, with defaults for unset columns"""
+    return {
+        "models": project.models or DEFAULT_MODELS,
+        "temperature": project.temperature if project.temperature is not None else DEFAULT_TEMPERATURE,
+        "max_output_tokens": project.max_output_tokens or DEFAULT_MAX_OUTPUT_TOKENS,
+        # Routes a project's requests to the same upstream cache shard
+        "prompt_cache_key": f"project-{project.id}",
+    }
+
+
+def prompt_records(prompts):
+    """Prompt rows as the plain dicts context_budget.plan_context expects"""
+    return [{"id": p.id, "priority": p.priority, "content": p.content} for p in prompts]
+
+
+def usage_counts(response):
+    """(input_tokens, cached_tokens, output_tokens) of a Response, zeros if unreported"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "input_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) if details is not None else 0
+    return usage.input_tokens or 0, cached or 0, usage.output_tokens or 0
+
+
+def record_response(db, response, project_id, user_id):
+    """Store a turn's response id and token usage; never fails the chat"""
+    try:
+        input_tokens, cached_tokens, output_tokens = usage_counts(response)
+        db.add(ChatResponse(
+            response_id=response.id,
+            project_id=project_id,
+            user_id=user_id,
+            model=getattr(response, "model", None),
+            input_tokens=input_tokens,
+            cached_tokens=cached_tokens,
+            output_tokens=output_tokens
+        ))
+        db.commit()
+    except Exception as e:
+        logger.warning("Could not record chat response for project %s: %s", project_id, e)
+        db.rollback()
 
-# Strip any remaining whitespace
-api_key = api_key.strip()
 
-logger.info(f"OpenAI API key loaded successfully (length: {len(api_key)})")
+def is_retryable(error_msg):
+    """Authentication and quota errors will fail the same way on every retry"""
+    # Don't retry on authentication errors
+    if "401" in error_msg or "api_key" in error_msg.lower():
+        return False
+    # Don't retry on quota errors
+    if "quota" in error_msg.lower() or "billing" in error_msg.lower():
+        return False
+    return True
 
-client = OpenAI(api_key=api_key)
 
+def error_response(error_msg):
+    """Map an upstream error message to the (status_code, detail) returned to clients"""
+    if "401" in error_msg or "api_key" in error_msg.lower() or "authentication" in error_msg.lower():
+        return 500, "Invalid OpenAI API key. Please check your .env file and restart the server."
+    elif "429" in error_msg or "rate limit" in error_msg.lower():
+        return 429, "API rate limit exceeded. Please try again later."
+    elif "quota" in error_msg.lower() or "billing" in error_msg.lower():
+        return 500, "OpenAI API quota exceeded. Please check your billing."
+    else:
+        error_detail = error_msg[:150] if len(error_msg) > 150 else error_msg
+        return 500, f"AI response failed: {error_detail}"
 
-def call_openai_with_retry(client, model, messages, max_retries=3, delay=1):
-    """Call OpenAI API with retry logic"""
+
+def request_options(model, messages, temperature, max_output_tokens,
+                    previous_response_id=None, prompt_cache_key=None):
+    """Keyword arguments for responses.create"""
+    options = {
+        "model": model,
+        "input": messages,
+        "temperature": temperature,
+        "max_output_tokens": max_output_tokens,
+    }
+    if previous_response_id:
+        options["previous_response_id"] = previous_response_id
+    if prompt_cache_key:
+        options["prompt_cache_key"] = prompt_cache_key
+    return options
+
+
+def collect_stream(stream, cancel=None, on_first_token=None):
+    """
+    Read a streaming responses.create to its completed Response, giving up
+    (and closing the stream, which stops generation upstream) as soon as
+    the optional cancel token is set. on_first_token() is called at the
+    first output token.
+    """
+    try:
+        for event in stream:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            if event.type == "response.output_text.delta":
+                if on_first_token is not None:
+                    on_first_token()
+                    on_first_token = None
+            elif event.type == "response.completed":
+                return event.response
+            elif event.type in ("error", "response.failed"):
+                raise RuntimeError(getattr(event, "message", None) or f"Upstream stream {event.type}")
+        raise RuntimeError("Upstream stream ended without a completed response")
+    finally:
+        stream.close()
+
+
+def call_openai_with_retry(client, models, messages, max_retries=3, delay=1,
+                           temperature=0.7, max_output_tokens=2000,
+                           previous_response_id=None, prompt_cache_key=None, cancel=None):
+    """
+    Call OpenAI API with retry logic (hedged when CHAT_HEDGING_ENABLED is set).
+    Each attempt asks the model router which of the allowed models to use,
+    and is traced as its own span.
+
+    The reply is read as a stream, so the router is given the time to first
+    token rather than the whole generation, which grows with the length of
+    the reply. With a cancel token (see cancellation.py) the call can be
+    abandoned mid-generation; once the token is set no further attempts are
+    made and Cancelled is raised.
+    """
     for attempt in range(max_retries):
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        model = model_router.router.choose(models)
+        options = request_options(model, messages, temperature, max_output_tokens,
+                                  previous_response_id, prompt_cache_key)
+        start_time = time.time()
+        first_token = []
         try:
-            response = client.responses.create(
-                model=model,
-                input=messages,
-                temperature=0.7,
-                max_output_tokens=2000
-            )
+            with tracing.span("openai.responses.create", tracing.CLIENT, **{
+                "gen_ai.request.model": model,
+                "chat.attempt": attempt + 1,
+                "chat.hedged": hedging.HEDGING_ENABLED,
+            }) as attempt_span:
+                if hedging.HEDGING_ENABLED:
+                    # No SDK retries inside an attempt: an aborted loser must fail at once
+                    hedged_client = client.with_options(max_retries=0)
+                    response = hedging.hedged_create(
+                        lambda: hedged_client.responses.create(**options, stream=True), cancel=cancel,
+                        on_first_token=lambda: first_token.append(time.time())
+                    )
+                else:
+                    response = collect_stream(client.responses.create(**options, stream=True), cancel,
+                                              on_first_token=lambda: first_token.append(time.time()))
+                input_tokens, cached_tokens, output_tokens = usage_counts(response)
+                attempt_span.set("gen_ai.response.id", getattr(response, "id", None))
+                attempt_span.set("gen_ai.usage.input_tokens", input_tokens)
+                attempt_span.set("gen_ai.usage.cached_tokens", cached_tokens)
+                attempt_span.set("gen_ai.usage.output_tokens", output_tokens)
+            # A reply without output text has no first token; use the whole call
+            model_router.router.record_success(model, (first_token[0] if first_token else time.time()) - start_time)
             return response
+        except Cancelled:
+            raise
         except Exception as e:
-            error_msg = str(e)
-            # Don't retry on authentication errors
-            if "401" in error_msg or "api_key" in error_msg.lower():
-                raise e
-            # Don't retry on quota errors
-            if "quota" in error_msg.lower() or "billing" in error_msg.lower():
+            if not is_retryable(str(e)):
                 raise e
-            
+
+            model_router.router.record_failure(model)
             if attempt < max_retries - 1:
                 wait_time = delay * (2 ** attempt)  # Exponential backoff
-                logger.warning(f"OpenAI API call failed (attempt {attempt + 1}/{max_retries}), retrying in {wait_time}s...")
-                time.sleep(wait_time)
+                logger.warning("OpenAI API call to %s failed (attempt %d/%d), retrying in %ss...", model, attempt + 1, max_retries, wait_time)
+                if cancel is not None:
+                    cancel.sleep(wait_time)
+                else:
+                    time.sleep(wait_time)
             else:
                 raise e
     return None
@@ -97,83 +242,82 @@ def chat_endpoint(
     request: Request,
     data: ChatRequest,
     db: Session = Depends(get_db),
-    user=Depends(get_current_user)
+    read_db: Session = Depends(get_read_db),
+    user=Depends(get_current_user),
+    cancel=Depends(client_disconnect)
 ):
-    logger.info(f"Chat request from user {user.email} for project {data.project_id}")
+    # Retries with the same Idempotency-Key get the first reply instead of a second upstream call
+    return run_idempotent(request, user.id, {"chat": data.model_dump()},
+                          lambda: chat_reply(data, db, read_db, user, cancel))
+
+
+def chat_reply(data: ChatRequest, db: Session, read_db: Session, user, cancel=None):
+    logger.info("Chat request from user %s for project %s", user.id, data.project_id)
     
-    project = db.query(Project).filter(
+    # Project and prompts come from the replica; the chain lookup and the
+    # response record below use the primary
+    project = read_db.query(Project).filter(
         Project.id == data.project_id,
         Project.owner_id == user.id
     ).first()
 
     if not project:
-        logger.warning(f"Project {data.project_id} not found for user {user.email}")
+        logger.warning("Project %s not found for user %s", data.project_id, user.id)
         raise HTTPException(status_code=404, detail="Project not found")
 
-    # Build system prompt from project prompts
-    prompt_context = "\n".join(
-        [p.content for p in project.prompts]
-    ) if project.prompts else ""
-    
-    # Enhanced default system prompt for ChatGPT-like quality responses
-    if not prompt_context:
-        prompt_context = """You are ChatGPT, a large language model trained by OpenAI. 
-You are helpful, harmless, and honest. You provide detailed, accurate, and well-structured responses.
-When answering questions:
-- Be thorough and comprehensive
-- Break down complex topics into clear explanations
-- Use examples when helpful
-- Think step-by-step for complex problems
-- Admit when you don't know something
-- Format responses clearly with proper paragraphs
-- Be conversational but professional
-- Provide actionable advice when applicable"""
+    chained = bool(data.previous_response_id)
+    history_tokens = 0
+    if chained:
+        previous = db.query(ChatResponse).filter(
+            ChatResponse.response_id == data.previous_response_id,
+            ChatResponse.project_id == project.id,
+            ChatResponse.user_id == user.id
+        ).first()
+        if not previous:
+            raise HTTPException(status_code=404, detail="Previous response not found")
+        history_tokens = (previous.input_tokens or 0) + (previous.output_tokens or 0)
 
-    messages = [
-        {
-            "role": "system",
-            "content": prompt_context
-        },
-        {
-            "role": "user",
-            "content": data.message
-        }
-    ]
+    params = generation_params(project)
+    prompts = [] if chained else prompt_records(project.prompts)
+    try:
+        plan = plan_context(params["models"], prompts, data.message, params["max_output_tokens"],
+                            history_tokens, default_prompt="" if chained else DEFAULT_SYSTEM_PROMPT)
+    except ContextTooLarge as e:
+        logger.warning("Chat request for project %s rejected before sending: %s", project.id, e)
+        raise HTTPException(status_code=413, detail=str(e))
+    if plan.dropped_prompts or plan.truncated_prompt:
+        logger.info("Trimmed prompts for project %s: dropped=%s truncated=%s",
+                    project.id, plan.dropped_prompts, plan.truncated_prompt)
+
+    messages = build_messages(plan.prompt_contents, data.message, chained=chained)
 
     try:
         start_time = time.time()
-        response = call_openai_with_retry(client, "gpt-4o-mini", messages)
+        with tracing.span("chat.upstream", **{"chat.project_id": project.id, "chat.chained": chained}):
+            response = call_openai_with_retry(get_client(), params["models"], messages,
+                                              temperature=params["temperature"],
+                                              max_output_tokens=plan.max_output_tokens,
+                                              previous_response_id=data.previous_response_id,
+                                              prompt_cache_key=params["prompt_cache_key"],
+                                              cancel=cancel)
         elapsed_time = time.time() - start_time
         
         reply = response.output_text
         if not reply:
             reply = "I received your message but couldn't generate a response."
         
-        logger.info(f"Chat response generated in {elapsed_time:.2f}s for user {user.email}")
-        return {"reply": reply}
+        record_response(db, response, project.id, user.id)
+        logger.info("Chat response generated in %.2fs for user %s", elapsed_time, user.id)
+        return {"reply": reply, "response_id": response.id}
 
+    except Cancelled:
+        upstream_cancelled.labels("http").inc()
+        logger.info("Chat request from user %s cancelled after %.2fs: client disconnected",
+                    user.id, time.time() - start_time)
+        # Nobody is listening; nginx's "client closed request" status keeps it out of 5xx stats
+        raise HTTPException(status_code=499, detail="Client disconnected")
     except Exception as e:
         error_msg = str(e)
-        logger.error(f"Chat error for user {user.email}: {error_msg}")
-        
-        if "401" in error_msg or "api_key" in error_msg.lower() or "authentication" in error_msg.lower():
-            raise HTTPException(
-                status_code=500,
-                detail="Invalid OpenAI API key. Please check your .env file and restart the server."
-            )
-        elif "429" in error_msg or "rate limit" in error_msg.lower():
-            raise HTTPException(
-                status_code=429,
-                detail="API rate limit exceeded. Please try again later."
-            )
-        elif "quota" in error_msg.lower() or "billing" in error_msg.lower():
-            raise HTTPException(
-                status_code=500,
-                detail="OpenAI API quota exceeded. Please check your billing."
-            )
-        else:
-            error_detail = error_msg[:150] if len(error_msg) > 150 else error_msg
-            raise HTTPException(
-                status_code=500,
-                detail=f"AI response failed: {error_detail}"
-            )
+        logger.error("Chat error for user %s: %s", user.id, error_msg)
+        status_code, detail = error_response(error_msg)
+        raise HTTPException(status_code=status_code, detail=detail)
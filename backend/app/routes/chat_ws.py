@@ -0,0 +1,344 @@
+"""
+WebSocket chat channel: /chat/ws
+
+A connection authenticates once, caches the user's projects (prompt
+contents and generation settings) for its lifetime, and multiplexes
+conversations for several projects, streaming reply deltas as they arrive.
+
+Client -> server frames (JSON):
+    {"type": "auth", "token": "..."}    first frame, unless ?token= or an
+                                        Authorization header was sent
+    {"type": "chat", "id": "c1", "project_id": 1, "message": "Hi",
+     "previous_response_id": "resp_..."}   (optional, chains onto an earlier turn)
+    {"type": "cancel", "id": "c1"}
+    {"type": "refresh"}                 reload the cached projects
+
+Server -> client frames:
+    {"type": "ready", "projects": [1, 2]}
+    {"type": "delta", "id": "c1", "delta": "Hel"}
+    {"type": "done", "id": "c1", "reply": "Hello!", "response_id": "resp_..."}
+    {"type": "cancelled", "id": "c1"}
+    {"type": "error", "id": "c1", "detail": "..."}
+
+Outgoing frames go through a bounded per-connection queue drained by a
+single writer. When the client reads slowly the queue fills, the
+conversation tasks wait on it and stop pulling from the upstream stream.
+
+A cancel frame or a disconnect cancels the conversation's task. That
+closes its upstream stream, which stops generation, and ends any retry
+backoff, so no further attempts are made.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from prometheus_client import Counter, Gauge
+from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
+
+from ..auth import user_from_token
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import Project, ChatResponse
+from .. import model_router, tracing
+from ..cancellation import upstream_cancelled
+from ..upstream import get_async_client
+from .chat import (
+    DEFAULT_SYSTEM_PROMPT, build_messages, generation_params, is_retryable, error_response,
+    request_options, record_response, prompt_records
+)
+from ..context_budget import plan_context, ContextTooLarge
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/chat", tags=["Chat"])
+
+ws_connections = Gauge("chat_ws_connections", "Open WebSocket chat connections")
+ws_conversations = Counter("chat_ws_conversations_total", "Conversations started over WebSocket chat")
+
+# WebSocket close code for policy violations (bad or missing token)
+POLICY_VIOLATION = 1008
+
+
+def authenticate(token):
+    """Return the user id for a bearer token, or None"""
+    db = SessionLocal()
+    try:
+        user = user_from_token(token, db)
+        return user.id if user else None
+    finally:
+        db.close()
+
+
+def previous_response_tokens(user_id, project_id, response_id):
+    """Context size carried by an earlier turn of this user's project, or None if unknown"""
+    db = SessionLocal()
+    try:
+        previous = db.query(ChatResponse).filter(
+            ChatResponse.response_id == response_id,
+            ChatResponse.project_id == project_id,
+            ChatResponse.user_id == user_id
+        ).first()
+        if previous is None:
+            return None
+        return (previous.input_tokens or 0) + (previous.output_tokens or 0)
+    finally:
+        db.close()
+
+
+def save_response(response, project_id, user_id):
+    db = SessionLocal()
+    try:
+        record_response(db, response, project_id, user_id)
+    finally:
+        db.close()
+
+
+def load_projects(user_id, project_id=None):
+    """Snapshot a user's projects as plain dicts safe to keep outside a session"""
+    db = SessionLocal()
+    try:
+        query = db.query(Project).options(selectinload(Project.prompts)).filter(
+            Project.owner_id == user_id
+        )
+        if project_id is not None:
+            query = query.filter(Project.id == project_id)
+        return {
+            p.id: {"prompts": prompt_records(p.prompts), **generation_params(p)}
+            for p in query.all()
+        }
+    finally:
+        db.close()
+
+
+async def stream_reply(send, conversation_id, project, messages, max_output_tokens,
+                       previous_response_id=None, max_retries=3, delay=1):
+    """
+    Stream one reply, sending delta frames as they arrive, and return the
+    completed Response. Failed attempts are retried (with the model router
+    choosing the model) only while no delta has been sent yet.
+    """
+    client = get_async_client()
+    for attempt in range(max_retries):
+        model = model_router.router.choose(project["models"])
+        options = request_options(model, messages, project["temperature"], max_output_tokens,
+                                  previous_response_id, project["prompt_cache_key"])
+        start_time = time.time()
+        sent_delta = False
+        try:
+            with tracing.span("openai.responses.create", tracing.CLIENT, **{
+                "gen_ai.request.model": model,
+                "chat.attempt": attempt + 1,
+            }) as attempt_span:
+                stream = await client.responses.create(**options, stream=True)
+                try:
+                    async for event in stream:
+                        if event.type == "response.output_text.delta":
+                            if not sent_delta:
+                                first_token = time.time() - start_time
+                                attempt_span.set("chat.first_token_ms", round(first_token * 1000, 1))
+                            sent_delta = True
+                            await send({"type": "delta", "id": conversation_id, "delta": event.delta})
+                        elif event.type == "response.completed":
+                            # Time to first token: the whole generation grows with the reply length
+                            model_router.router.record_success(
+                                model, first_token if sent_delta else time.time() - start_time)
+                            attempt_span.set("gen_ai.response.id", event.response.id)
+                            return event.response
+                        elif event.type in ("error", "response.failed"):
+                            raise RuntimeError(getattr(event, "message", None) or f"Upstream stream {event.type}")
+                finally:
+                    await stream.close()
+                raise RuntimeError("Upstream stream ended without a completed response")
+        except Exception as e:
+            if not is_retryable(str(e)):
+                raise
+            model_router.router.record_failure(model)
+            if sent_delta or attempt == max_retries - 1:
+                raise
+            wait_time = delay * (2 ** attempt)
+            logger.warning("WebSocket chat call to %s failed (attempt %d/%d), retrying in %ss...",
+                           model, attempt + 1, max_retries, wait_time)
+            await asyncio.sleep(wait_time)
+
+
+class ChatConnection:
+    def __init__(self, websocket: WebSocket, user_id: int):
+        settings = get_settings()
+        self.websocket = websocket
+        self.user_id = user_id
+        self.projects = {}
+        self.conversations = {}
+        self.max_conversations = settings.ws_max_conversations
+        self.outbox = asyncio.Queue(maxsize=settings.ws_send_queue_size)
+
+    async def send(self, frame):
+        # Blocks while the outbox is full, i.e. while the client reads slowly
+        await self.outbox.put(frame)
+
+    async def writer(self):
+        while True:
+            frame = await self.outbox.get()
+            await self.websocket.send_text(json.dumps(frame))
+
+    async def refresh(self):
+        self.projects = await run_in_threadpool(load_projects, self.user_id)
+
+    async def project(self, project_id):
+        project = self.projects.get(project_id)
+        if project is None:
+            # Created after the connection opened (or not the user's project)
+            loaded = await run_in_threadpool(load_projects, self.user_id, project_id)
+            project = loaded.get(project_id)
+            if project is not None:
+                self.projects[project_id] = project
+        return project
+
+    async def converse(self, conversation_id, project_id, message, previous_response_id=None):
+        upstream_started = False
+        try:
+            project = await self.project(project_id)
+            if project is None:
+                await self.send({"type": "error", "id": conversation_id, "detail": "Project not found"})
+                return
+            chained = bool(previous_response_id)
+            history_tokens = 0
+            if chained:
+                history_tokens = await run_in_threadpool(
+                    previous_response_tokens, self.user_id, project_id, previous_response_id
+                )
+                if history_tokens is None:
+                    await self.send({"type": "error", "id": conversation_id, "detail": "Previous response not found"})
+                    return
+            try:
+                plan = plan_context(project["models"], [] if chained else project["prompts"], message,
+                                    project["max_output_tokens"], history_tokens,
+                                    default_prompt="" if chained else DEFAULT_SYSTEM_PROMPT)
+            except ContextTooLarge as e:
+                await self.send({"type": "error", "id": conversation_id, "detail": str(e)})
+                return
+            messages = build_messages(plan.prompt_contents, message, chained=chained)
+            upstream_started = True
+            # No HTTP request to hang it on; each conversation is its own trace
+            with tracing.trace("WS chat", **{"chat.project_id": project_id, "chat.chained": chained}):
+                response = await stream_reply(self.send, conversation_id, project, messages,
+                                              plan.max_output_tokens, previous_response_id)
+            upstream_started = False
+            reply = response.output_text
+            if not reply:
+                reply = "I received your message but couldn't generate a response."
+            await run_in_threadpool(save_response, response, project_id, self.user_id)
+            await self.send({"type": "done", "id": conversation_id, "reply": reply, "response_id": response.id})
+        except asyncio.CancelledError:
+            if upstream_started:
+                upstream_cancelled.labels("websocket").inc()
+            try:
+                self.outbox.put_nowait({"type": "cancelled", "id": conversation_id})
+            except asyncio.QueueFull:
+                pass
+            raise
+        except Exception as e:
+            error_msg = str(e)
+            logger.error("WebSocket chat error for user %s: %s", self.user_id, error_msg)
+            _, detail = error_response(error_msg)
+            await self.send({"type": "error", "id": conversation_id, "detail": detail})
+        finally:
+            self.conversations.pop(conversation_id, None)
+
+    async def handle(self, frame):
+        kind = frame.get("type")
+        conversation_id = frame.get("id")
+        if conversation_id is not None and (
+            isinstance(conversation_id, bool) or not isinstance(conversation_id, (str, int))
+        ):
+            # Ids are dict keys; a list or object would fail the lookup below
+            await self.send({"type": "error", "id": None, "detail": "Frame ids must be strings or integers"})
+            return
+        if kind == "chat":
+            if conversation_id is None or conversation_id in self.conversations:
+                await self.send({"type": "error", "id": conversation_id,
+                                 "detail": "Each chat frame needs a unique id"})
+            elif len(self.conversations) >= self.max_conversations:
+                await self.send({"type": "error", "id": conversation_id,
+                                 "detail": "Too many conversations in flight on this connection"})
+            elif not isinstance(frame.get("project_id"), int) or not isinstance(frame.get("message"), str):
+                await self.send({"type": "error", "id": conversation_id,
+                                 "detail": "chat frames need an integer project_id and a message"})
+            else:
+                ws_conversations.inc()
+                self.conversations[conversation_id] = asyncio.create_task(
+                    self.converse(conversation_id, frame["project_id"], frame["message"],
+                                  frame.get("previous_response_id"))
+                )
+        elif kind == "cancel":
+            task = self.conversations.get(conversation_id)
+            if task is not None:
+                task.cancel()
+        elif kind == "refresh":
+            await self.refresh()
+            await self.send({"type": "ready", "projects": sorted(self.projects)})
+        else:
+            await self.send({"type": "error", "id": conversation_id, "detail": f"Unknown frame type: {kind}"})
+
+    def close(self):
+        for task in list(self.conversations.values()):
+            task.cancel()
+
+
+def bearer_token(websocket: WebSocket, token: Optional[str]):
+    if token:
+        return token
+    header = websocket.headers.get("authorization", "")
+    if header.lower().startswith("bearer "):
+        return header[7:].strip()
+    return None
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket, token: Optional[str] = None):
+    await websocket.accept()
+
+    token = bearer_token(websocket, token)
+    if token is None:
+        try:
+            first = json.loads(await asyncio.wait_for(
+                websocket.receive_text(), timeout=get_settings().ws_auth_timeout_seconds
+            ))
+            if isinstance(first, dict) and first.get("type") == "auth":
+                token = first.get("token")
+        except (asyncio.TimeoutError, ValueError, WebSocketDisconnect):
+            pass
+
+    user_id = await run_in_threadpool(authenticate, token) if token else None
+    if user_id is None:
+        await websocket.close(code=POLICY_VIOLATION, reason="Invalid or expired token")
+        return
+
+    connection = ChatConnection(websocket, user_id)
+    await connection.refresh()
+    writer = asyncio.create_task(connection.writer())
+    ws_connections.inc()
+    logger.info("WebSocket chat opened for user %s", user_id)
+    try:
+        await connection.send({"type": "ready", "projects": sorted(connection.projects)})
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                frame = json.loads(raw)
+            except ValueError:
+                await connection.send({"type": "error", "id": None, "detail": "Frames must be JSON"})
+                continue
+            if not isinstance(frame, dict):
+                await connection.send({"type": "error", "id": None, "detail": "Frames must be JSON objects"})
+                continue
+            await connection.handle(frame)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        connection.close()
+        writer.cancel()
+        ws_connections.dec()
+        logger.info("WebSocket chat closed for user %s", user_id)
@@ -0,0 +1,95 @@
+"""
+Everything the dashboard needs in one request: a page of the user's
+projects with their prompt and file counts and, optionally, the first few
+prompts and files of each. Uses a fixed number of queries whatever the page
+size (count, page with aggregate subqueries, and one windowed query each
+for the prompt and file previews).
+
+Responses carry an ETag over the body; a matching If-None-Match gets a 304.
+"""
+import hashlib
+import logging
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import Response
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models import Project, Prompt, ProjectFile
+from ..schemas import DashboardSummary, DashboardProject, PromptResponse, FileResponse
+from ..auth import get_current_user
+from ..read_routing import get_read_db
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
+
+
+def first_per_project(db, model, project_ids, limit):
+    """The first `limit` rows (by id) of model for each project, in one query"""
+    if not project_ids or limit <= 0:
+        return {}
+    row_number = func.row_number().over(partition_by=model.project_id, order_by=model.id).label("row_number")
+    ranked = db.query(model.id, row_number).filter(model.project_id.in_(project_ids)).subquery()
+    rows = db.query(model).join(ranked, model.id == ranked.c.id).filter(
+        ranked.c.row_number <= limit
+    ).order_by(model.project_id, model.id).all()
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.project_id, []).append(row)
+    return grouped
+
+
+def build_summary(db, user_id, limit, offset, preview):
+    total = db.query(func.count(Project.id)).filter(Project.owner_id == user_id).scalar()
+
+    prompt_count = db.query(func.count(Prompt.id)).filter(
+        Prompt.project_id == Project.id
+    ).correlate(Project).scalar_subquery()
+    file_count = db.query(func.count(ProjectFile.id)).filter(
+        ProjectFile.project_id == Project.id
+    ).correlate(Project).scalar_subquery()
+    rows = db.query(
+        Project.id, Project.name, prompt_count.label("prompt_count"), file_count.label("file_count")
+    ).filter(Project.owner_id == user_id).order_by(Project.id).offset(offset).limit(limit).all()
+
+    project_ids = [row.id for row in rows]
+    prompts = first_per_project(db, Prompt, project_ids, preview)
+    files = first_per_project(db, ProjectFile, project_ids, preview)
+
+    return DashboardSummary(
+        total=total,
+        limit=limit,
+        offset=offset,
+        projects=[
+            DashboardProject(
+                id=row.id,
+                name=row.name,
+                prompt_count=row.prompt_count,
+                file_count=row.file_count,
+                prompts=[PromptResponse.model_validate(p) for p in prompts.get(row.id, [])],
+                files=[FileResponse.model_validate(f) for f in files.get(row.id, [])],
+            )
+            for row in rows
+        ],
+    )
+
+
+@router.get("/summary", response_model=DashboardSummary)
+def dashboard_summary(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    preview: int = Query(0, ge=0, le=20, description="Prompts and files to include per project"),
+    db: Session = Depends(get_read_db),
+    user = Depends(get_current_user)
+):
+    summary = build_summary(db, user.id, limit, offset, preview)
+    body = summary.model_dump_json().encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+    # Private: the body is per user. no-cache: revalidate, which is cheap with the ETag
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    logger.debug("Dashboard summary for user %s: %d of %d projects", user.id, len(summary.projects), summary.total)
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,62 +1,29 @@
+import hashlib
 import logging
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
 from sqlalchemy.orm import Session
-from openai import OpenAI
-from dotenv import load_dotenv
-import os
-from pathlib import Path
+from starlette.concurrency import run_in_threadpool
 
 from ..database import get_db
-from ..models import Project, ProjectFile
-from ..schemas import FileResponse
+from ..models import FileChunk, FileIngestionJob, Project, ProjectFile
+from ..schemas import FileResponse, FileStatusResponse
 from ..auth import get_current_user
+from ..read_routing import get_read_db
+from ..upstream import get_client
+from ..file_cleanup import enqueue_deletions
+from ..idempotency import run_idempotent_async
+from .. import ingestion
+from ..serialization import list_response, model_response
 
 logger = logging.getLogger(__name__)
 
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path, override=True)
-
 router = APIRouter(prefix="/projects", tags=["Files"])
 
-def get_api_key():
-    """Get OpenAI API key from environment or .env file"""
-    api_key = os.getenv("OPENAI_API_KEY")
-    if api_key:
-        return api_key.strip()
-    
-    if env_path.exists():
-        try:
-            with open(env_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and line.startswith("OPENAI_API_KEY="):
-                        key_value = line.split("=", 1)[1]
-                        key_value = key_value.strip().strip('"').strip("'")
-                        if key_value:
-                            return key_value
-        except Exception as e:
-            logger.error(f"Error reading .env file: {e}")
-    
-    return None
-
-api_key = get_api_key()
-
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found")
-
-if not api_key.startswith("sk-"):
-    raise ValueError(f"Invalid API key format. Key should start with 'sk-'")
-
-api_key = api_key.strip()
-
-logger.info(f"OpenAI API key loaded successfully for files (length: {len(api_key)})")
-
-client = OpenAI(api_key=api_key)
-
 
 @router.post("/{project_id}/files", response_model=FileResponse)
 async def upload_file(
     project_id: int,
+    request: Request,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     user = Depends(get_current_user)
@@ -67,40 +34,58 @@ async def upload_file(
     ).first()
 
     if not project:
-        logger.warning(f"Project {project_id} not found for file upload")
+        logger.warning("Project %s not found for file upload", project_id)
         raise HTTPException(status_code=404, detail="Project not found")
 
-    try:
-        contents = await file.read()
-        file_size = len(contents)
-        
-        if file_size > 50 * 1024 * 1024:  # 50MB limit
-            raise HTTPException(status_code=400, detail="File too large (max 50MB)")
+    contents = await file.read()
+    if len(contents) > 50 * 1024 * 1024:  # 50MB limit
+        raise HTTPException(status_code=400, detail="File too large (max 50MB)")
+
+    # A retried upload with the same Idempotency-Key returns the first ProjectFile
+    payload = {"upload": {
+        "project_id": project_id,
+        "filename": file.filename,
+        "sha256": hashlib.sha256(contents).hexdigest(),
+    }}
+    return await run_idempotent_async(
+        request, user.id, payload, lambda: store_upload(db, project_id, file.filename, contents)
+    )
+
 
-        uploaded_file = client.files.create(
+async def store_upload(db: Session, project_id: int, filename: str, contents: bytes):
+    # The Files API push and the commit of up to 50MB both block; keep them off the event loop
+    return await run_in_threadpool(save_upload, db, project_id, filename, contents)
+
+
+def save_upload(db: Session, project_id: int, filename: str, contents: bytes):
+    try:
+        uploaded_file = get_client().files.create(
             file=contents,
             purpose="assistants"
         )
 
         db_file = ProjectFile(
             project_id=project_id,
-            filename=file.filename,
+            filename=filename,
             openai_file_id=uploaded_file.id,
-            file_size=file_size
+            file_size=len(contents),
+            status="pending"
         )
 
         db.add(db_file)
+        db.flush()
+        # Text extraction runs in the background (see ingestion.py)
+        ingestion.enqueue_ingestion(db, db_file, contents)
         db.commit()
         db.refresh(db_file)
+        ingestion.worker.notify()
         
-        logger.info(f"File '{file.filename}' uploaded for project {project_id}")
+        logger.info("File '%s' uploaded for project %s", filename, project_id)
 
-        return db_file
+        return FileResponse.model_validate(db_file)
 
-    except HTTPException:
-        raise
     except Exception as e:
-        logger.error(f"File upload error: {str(e)}")
+        logger.error("File upload error: %s", e)
         db.rollback()
         raise HTTPException(
             status_code=500,
@@ -111,7 +96,7 @@ async def upload_file(
 @router.get("/{project_id}/files", response_model=list[FileResponse])
 def list_files(
     project_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user = Depends(get_current_user)
 ):
     project = db.query(Project).filter(
@@ -122,9 +107,26 @@ def list_files(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    return db.query(ProjectFile).filter(
+    return list_response(FileResponse, db.query(ProjectFile).filter(
         ProjectFile.project_id == project_id
-    ).all()
+    ))
+
+
+@router.get("/files/{file_id}/status", response_model=FileStatusResponse)
+def file_status(
+    file_id: int,
+    db: Session = Depends(get_read_db),
+    user = Depends(get_current_user)
+):
+    db_file = db.query(ProjectFile).join(Project).filter(
+        ProjectFile.id == file_id,
+        Project.owner_id == user.id
+    ).first()
+
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return model_response(FileStatusResponse, db_file)
 
 
 @router.delete("/files/{file_id}")
@@ -141,12 +143,12 @@ def delete_file(
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
 
-    try:
-        client.files.delete(db_file.openai_file_id)
-    except:
-        pass
-
+    # The upstream copy is deleted in the background (see file_cleanup.py)
+    enqueue_deletions(db, [db_file.openai_file_id])
+    for model in (FileChunk, FileIngestionJob):
+        db.query(model).filter(model.file_id == file_id).delete(synchronize_session=False)
     db.delete(db_file)
     db.commit()
+    logger.info("File %s deleted, remote file %s queued for deletion", file_id, db_file.openai_file_id)
 
     return {"message": "File deleted"}
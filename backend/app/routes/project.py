@@ -1,9 +1,15 @@
 import logging
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from ..database import SessionLocal
 from .. import models, schemas
 from ..auth import get_current_user
+from ..config import get_settings
+from ..read_routing import get_read_db
+from ..file_cleanup import enqueue_deletions
+from ..serialization import list_response, model_response
+from .. import search
 
 logger = logging.getLogger(__name__)
 
@@ -31,7 +37,7 @@ def create_project(
         db.commit()
         db.refresh(new_project)
         logger.info(f"Project '{project.name}' created by user {current_user.email}")
-        return new_project
+        return model_response(schemas.ProjectResponse, new_project)
     except Exception as e:
         logger.error(f"Error creating project: {str(e)}")
         db.rollback()
@@ -39,11 +45,107 @@ def create_project(
 
 @router.get("/", response_model=list[schemas.ProjectResponse])
 def list_projects(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    projects = db.query(models.Project).filter(
+    return list_response(schemas.ProjectResponse, db.query(models.Project).filter(
+        models.Project.owner_id == current_user.id
+    ))
+
+
+def get_owned_project(project_id: int, db: Session, current_user: models.User):
+    project = db.query(models.Project).filter(
+        models.Project.id == project_id,
         models.Project.owner_id == current_user.id
-    ).all()
-    logger.debug(f"User {current_user.email} listed {len(projects)} projects")
-    return projects
\ No newline at end of file
+    ).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project
+
+
+@router.delete("/{project_id}")
+def delete_project(
+    project_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Delete a project with its prompts, files and chat history; remote files are removed in the background"""
+    project = get_owned_project(project_id, db, current_user)
+    try:
+        file_ids = [row.openai_file_id for row in db.query(models.ProjectFile.openai_file_id).filter(
+            models.ProjectFile.project_id == project_id
+        )]
+        enqueue_deletions(db, file_ids)
+        search.unindex_project(db, project_id)
+        for model in (models.Prompt, models.FileChunk, models.FileIngestionJob, models.ProjectFile,
+                      models.ChatResponse):
+            db.query(model).filter(model.project_id == project_id).delete(synchronize_session=False)
+        db.delete(project)
+        db.commit()
+    except Exception as e:
+        logger.error("Error deleting project %s: %s", project_id, e)
+        db.rollback()
+        raise
+    logger.info("Project %s deleted by user %s (%d remote files queued)", project_id, current_user.id, len(file_ids))
+    return {"message": "Project deleted", "files_queued": len(file_ids)}
+
+
+@router.get("/{project_id}/settings", response_model=schemas.GenerationSettings)
+def get_generation_settings(
+    project_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    project = get_owned_project(project_id, db, current_user)
+    return schemas.GenerationSettings(
+        models=project.models or models.DEFAULT_MODELS,
+        max_output_tokens=project.max_output_tokens or models.DEFAULT_MAX_OUTPUT_TOKENS,
+        temperature=project.temperature if project.temperature is not None else models.DEFAULT_TEMPERATURE
+    )
+
+
+@router.put("/{project_id}/settings", response_model=schemas.GenerationSettings)
+def update_generation_settings(
+    project_id: int,
+    data: schemas.GenerationSettings,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    allowed = get_settings().allowed_models or models.DEFAULT_MODELS
+    rejected = [model for model in data.models if model not in allowed]
+    if rejected:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Models not allowed on this server: {', '.join(rejected)} (allowed: {', '.join(allowed)})"
+        )
+    project = get_owned_project(project_id, db, current_user)
+    project.models = data.models
+    project.max_output_tokens = data.max_output_tokens
+    project.temperature = data.temperature
+    db.commit()
+    logger.info(f"Generation settings updated for project {project_id}: models={data.models}")
+    return data
+
+
+@router.get("/{project_id}/usage", response_model=schemas.UsageResponse)
+def get_usage(
+    project_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Token usage of a project's chats, including the share served from the prompt cache"""
+    get_owned_project(project_id, db, current_user)
+    responses, input_tokens, cached_tokens, output_tokens = db.query(
+        func.count(models.ChatResponse.id),
+        func.coalesce(func.sum(models.ChatResponse.input_tokens), 0),
+        func.coalesce(func.sum(models.ChatResponse.cached_tokens), 0),
+        func.coalesce(func.sum(models.ChatResponse.output_tokens), 0)
+    ).filter(models.ChatResponse.project_id == project_id).one()
+    return schemas.UsageResponse(
+        project_id=project_id,
+        responses=responses,
+        input_tokens=input_tokens,
+        cached_tokens=cached_tokens,
+        output_tokens=output_tokens,
+        cached_token_ratio=round(cached_tokens / input_tokens, 4) if input_tokens else 0.0
+    )
@@ -1,11 +1,14 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from ..database import get_db
 from ..models import Project, Prompt
-from ..schemas import PromptCreate, PromptUpdate, PromptResponse
+from ..schemas import PromptCreate, PromptUpdate, PromptResponse, PromptSearchResponse
 from ..auth import get_current_user
+from ..read_routing import get_read_db
+from ..serialization import list_response, model_response
+from .. import search
 
 logger = logging.getLogger(__name__)
 
@@ -32,14 +35,17 @@ def create_prompt(
         prompt = Prompt(
             project_id=project_id,
             name=data.name,
-            content=data.content
+            content=data.content,
+            priority=data.priority
         )
 
         db.add(prompt)
+        db.flush()
+        search.index_prompt(db, prompt)
         db.commit()
         db.refresh(prompt)
         logger.info(f"Prompt '{data.name}' created for project {project_id}")
-        return prompt
+        return model_response(PromptResponse, prompt)
     except Exception as e:
         logger.error(f"Error creating prompt: {str(e)}")
         db.rollback()
@@ -50,13 +56,38 @@ def create_prompt(
 @router.get("/{project_id}/prompts", response_model=list[PromptResponse])
 def list_prompts(
     project_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user = Depends(get_current_user)
 ):
-    return db.query(Prompt).join(Project).filter(
+    return list_response(PromptResponse, db.query(Prompt).join(Project).filter(
         Prompt.project_id == project_id,
         Project.owner_id == user.id
-    ).all()
+    ))
+
+
+# SEARCH PROMPTS
+@router.get("/{project_id}/search", response_model=PromptSearchResponse)
+def search_prompts(
+    project_id: int,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=10000),
+    db: Session = Depends(get_read_db),
+    user = Depends(get_current_user)
+):
+    """Ranked full-text matches among the project's prompts, with highlighted snippets"""
+    project = db.query(Project.id).filter(
+        Project.id == project_id,
+        Project.owner_id == user.id
+    ).first()
+
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    results, has_more = search.search_prompts(db, project_id, q, limit, offset)
+    return model_response(PromptSearchResponse, {
+        "query": q, "results": results, "limit": limit, "offset": offset, "has_more": has_more
+    })
 
 
 # UPDATE PROMPT
@@ -77,10 +108,14 @@ def update_prompt(
 
     prompt.name = data.name
     prompt.content = data.content
+    if data.priority is not None:
+        prompt.priority = data.priority
 
+    db.flush()
+    search.index_prompt(db, prompt)
     db.commit()
     db.refresh(prompt)
-    return prompt
+    return model_response(PromptResponse, prompt)
 
 
 # DELETE PROMPT
@@ -98,6 +133,7 @@ def delete_prompt(
     if not prompt:
         raise HTTPException(status_code=404, detail="Prompt not found")
 
+    search.unindex_prompt(db, prompt.id)
     db.delete(prompt)
     db.commit()
     return {"message": "Prompt deleted"}
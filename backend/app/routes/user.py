@@ -1,7 +1,11 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from ..config import get_settings
 from ..database import SessionLocal
+from ..serialization import model_response
+from ..user_import import InvalidUpload, import_batch, read_rows
 from .. import models, schemas, auth
 
 logger = logging.getLogger(__name__)
@@ -26,12 +30,10 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=error_msg)
     
     # Basic email validation
-    if "@" not in user.email or "." not in user.email.split("@")[1]:
+    if not auth.validate_email(user.email):
         raise HTTPException(status_code=400, detail="Invalid email format")
     
-    existing = db.query(models.User).filter(
-        models.User.email == user.email
-    ).first()
+    existing = auth.find_user_by_email(db, user.email)
 
     if existing:
         logger.warning(f"Registration attempt with existing email: {user.email}")
@@ -39,7 +41,7 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
     try:
         new_user = models.User(
-            email=user.email,
+            email=auth.normalize_email(user.email),
             hashed_password=auth.hash_password(user.password)
         )
 
@@ -55,11 +57,47 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Registration failed")
 
 
+@router.post(
+    "/bulk",
+    response_model=schemas.UserImportResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "text/csv": {"schema": {"type": "string"}, "example": "email,password\nada@example.com,Passw0rd123\n"},
+        "application/x-ndjson": {"schema": {"type": "string"}},
+        "application/json": {"schema": {"type": "array", "items": schemas.UserCreate.model_json_schema()}},
+    }}},
+)
+async def bulk_provision(request: Request, admin = Depends(auth.get_admin_user)):
+    """Create many users from a CSV, JSON Lines or JSON array upload (see user_import.py)"""
+    settings = get_settings()
+    results = []
+    seen = set()
+    batch = []
+    truncated = False
+    try:
+        async for row in read_rows(request.headers.get("content-type"), request.stream()):
+            if row["row"] > settings.user_import_max_rows:
+                truncated = True
+                break
+            batch.append(row)
+            if len(batch) >= settings.user_import_batch_size:
+                results.extend(await run_in_threadpool(import_batch, batch, seen))
+                batch = []
+    except InvalidUpload as e:
+        # Raised before any row is read (format, CSV header, JSON array)
+        raise HTTPException(status_code=400, detail=str(e))
+    if batch:
+        results.extend(await run_in_threadpool(import_batch, batch, seen))
+
+    counts = {status: 0 for status in ("created", "exists", "duplicate", "invalid", "failed")}
+    for result in results:
+        counts[result["status"]] += 1
+    logger.info(f"Bulk provisioning by {admin.email}: {counts}" + (" (truncated)" if truncated else ""))
+    return model_response(schemas.UserImportResponse, {**counts, "truncated": truncated, "results": results})
+
+
 @router.post("/login")
 def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(
-        models.User.email == user.email
-    ).first()
+    db_user = auth.find_user_by_email(db, user.email)
 
     if not db_user:
         logger.warning(f"Login attempt with invalid email: {user.email}")
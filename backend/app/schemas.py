@@ -1,4 +1,7 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 
 class UserCreate(BaseModel):
@@ -11,6 +14,25 @@ class UserLogin(BaseModel):
     password: str
 
 
+class UserImportResult(BaseModel):
+    row: int
+    email: Optional[str] = None
+    # created, exists, duplicate, invalid or failed
+    status: str
+    detail: Optional[str] = None
+
+
+class UserImportResponse(BaseModel):
+    created: int
+    exists: int
+    duplicate: int
+    invalid: int
+    failed: int
+    # True if rows past USER_IMPORT_MAX_ROWS were not processed
+    truncated: bool
+    results: list[UserImportResult]
+
+
 class ProjectCreate(BaseModel):
     name: str
 
@@ -23,14 +45,22 @@ class ProjectResponse(BaseModel):
         from_attributes = True
 
 
+class GenerationSettings(BaseModel):
+    models: list[str] = Field(min_length=1, max_length=5)
+    max_output_tokens: int = Field(ge=16, le=16384)
+    temperature: float = Field(ge=0.0, le=2.0)
+
+
 class PromptCreate(BaseModel):
     name: str
     content: str
+    priority: int = 0
 
 
 class PromptUpdate(BaseModel):
     name: str
     content: str
+    priority: Optional[int] = None
 
 
 class PromptResponse(BaseModel):
@@ -38,14 +68,42 @@ class PromptResponse(BaseModel):
     project_id: int
     name: str
     content: str
+    priority: Optional[int] = 0
 
     class Config:
         from_attributes = True
 
 
+class PromptSearchResult(BaseModel):
+    id: int
+    # HTML with the matched terms in <mark> tags
+    name: str
+    snippet: Optional[str] = None
+    score: float
+
+
+class PromptSearchResponse(BaseModel):
+    query: str
+    results: list[PromptSearchResult]
+    limit: int
+    offset: int
+    has_more: bool
+
+
 class ChatRequest(BaseModel):
     project_id: int
     message: str
+    # Chain onto an earlier turn: only the new message is sent upstream
+    previous_response_id: Optional[str] = None
+
+
+class UsageResponse(BaseModel):
+    project_id: int
+    responses: int
+    input_tokens: int
+    cached_tokens: int
+    output_tokens: int
+    cached_token_ratio: float
 
 
 class FileResponse(BaseModel):
@@ -54,6 +112,38 @@ class FileResponse(BaseModel):
     filename: str
     openai_file_id: str
     file_size: int
+    # Ingestion state (see ingestion.py); None for files uploaded before it existed
+    status: Optional[str] = None
+    chunk_count: Optional[int] = None
 
     class Config:
         from_attributes = True
+
+
+class FileStatusResponse(BaseModel):
+    id: int
+    filename: str
+    status: Optional[str] = None
+    status_detail: Optional[str] = None
+    chunk_count: Optional[int] = None
+    ingested_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class DashboardProject(BaseModel):
+    id: int
+    name: str
+    prompt_count: int
+    file_count: int
+    # First `preview` prompts/files of the project, by id
+    prompts: list[PromptResponse] = []
+    files: list[FileResponse] = []
+
+
+class DashboardSummary(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    projects: list[DashboardProject]
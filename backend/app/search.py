@@ -0,0 +1,233 @@
+"""
+Full-text search over a project's prompts.
+
+The index lives next to the prompts table and is updated by the prompt
+routes in the same transaction as the prompt itself (index_prompt,
+unindex_prompt, unindex_project):
+
+- SQLite: an FTS5 table prompt_search(project, name, content). The project
+  is stored as a token ("p42") and matched together with the query terms,
+  so a search only walks the posting lists of its own project. Results are
+  ranked with bm25 (name matches weigh more than content matches).
+- PostgreSQL: a prompt_search table with a weighted tsvector (name "A",
+  content "B") under a GIN index, ranked with ts_rank_cd.
+- Anything else (or SQLite without FTS5): a LIKE scan, logged as a warning.
+
+User input is reduced to word tokens, all of which must match; the last one
+also matches as a prefix, for search-as-you-type. Highlighted snippets are
+HTML-escaped with only the <mark> tags added. Pagination uses limit/offset
+with a has_more flag rather than a total count, which would have to visit
+every match.
+"""
+import html
+import logging
+import re
+
+from sqlalchemy import inspect, text
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+MAX_TERMS = 10
+SNIPPET_TOKENS = 24
+# Marks placed by the database, replaced after escaping
+_START, _END = "\x02", "\x03"
+# PostgreSQL text search configuration; "simple" does no stemming, so it
+# works for prompts in any language
+PG_CONFIG = "simple"
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def dialect(bind):
+    return bind.dialect.name
+
+
+def fts5_available(conn):
+    try:
+        conn.exec_driver_sql("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)")
+        conn.exec_driver_sql("DROP TABLE temp.fts5_probe")
+        return True
+    except Exception:
+        return False
+
+
+# Whether each engine's SQLite has FTS5, found out by ensure_index
+_fts5 = {}
+
+
+def backend(bind=engine):
+    name = dialect(bind)
+    if name == "postgresql":
+        return "postgresql"
+    if name == "sqlite" and _fts5.get(id(bind), True):
+        return "fts5"
+    return "like"
+
+
+def ensure_index(bind=engine):
+    """Create the search index if needed and fill it from existing prompts"""
+    exists = "prompt_search" in inspect(bind).get_table_names()
+    with bind.begin() as conn:
+        if dialect(bind) == "sqlite":
+            _fts5[id(bind)] = available = fts5_available(conn)
+            if not available:
+                logger.warning("SQLite was built without FTS5; prompt search falls back to a table scan")
+                return
+            conn.exec_driver_sql(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS prompt_search USING fts5("
+                "project, name, content, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            if not exists:
+                conn.exec_driver_sql(
+                    "INSERT INTO prompt_search (rowid, project, name, content) "
+                    "SELECT id, 'p' || project_id, name, content FROM prompts"
+                )
+        elif dialect(bind) == "postgresql":
+            conn.exec_driver_sql(
+                "CREATE TABLE IF NOT EXISTS prompt_search ("
+                "prompt_id INTEGER PRIMARY KEY REFERENCES prompts(id) ON DELETE CASCADE, "
+                "project_id INTEGER NOT NULL, document TSVECTOR NOT NULL)"
+            )
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_prompt_search_document "
+                                 "ON prompt_search USING GIN (document)")
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_prompt_search_project "
+                                 "ON prompt_search (project_id)")
+            if not exists:
+                conn.execute(text(
+                    "INSERT INTO prompt_search (prompt_id, project_id, document) "
+                    f"SELECT id, project_id, {_pg_document('name', 'content')} FROM prompts "
+                    "ON CONFLICT (prompt_id) DO NOTHING"
+                ))
+        else:
+            logger.warning("No full-text index for %s; prompt search falls back to a table scan", dialect(bind))
+            return
+    if not exists:
+        logger.info("Created the prompt search index")
+
+
+def _pg_document(name, content):
+    return (f"setweight(to_tsvector('{PG_CONFIG}', {name}), 'A') || "
+            f"setweight(to_tsvector('{PG_CONFIG}', {content}), 'B')")
+
+
+def index_prompt(db, prompt):
+    """Add or refresh a prompt in the index; call after the prompt is flushed"""
+    kind = backend(db.get_bind())
+    params = {"id": prompt.id, "project_id": prompt.project_id, "name": prompt.name, "content": prompt.content}
+    if kind == "fts5":
+        db.execute(text("DELETE FROM prompt_search WHERE rowid = :id"), params)
+        db.execute(text(
+            "INSERT INTO prompt_search (rowid, project, name, content) "
+            "VALUES (:id, 'p' || :project_id, :name, :content)"
+        ), params)
+    elif kind == "postgresql":
+        db.execute(text(
+            "INSERT INTO prompt_search (prompt_id, project_id, document) "
+            f"VALUES (:id, :project_id, {_pg_document(':name', ':content')}) "
+            "ON CONFLICT (prompt_id) DO UPDATE SET project_id = EXCLUDED.project_id, document = EXCLUDED.document"
+        ), params)
+
+
+def unindex_prompt(db, prompt_id):
+    kind = backend(db.get_bind())
+    if kind == "fts5":
+        db.execute(text("DELETE FROM prompt_search WHERE rowid = :id"), {"id": prompt_id})
+    elif kind == "postgresql":
+        db.execute(text("DELETE FROM prompt_search WHERE prompt_id = :id"), {"id": prompt_id})
+
+
+def unindex_project(db, project_id):
+    kind = backend(db.get_bind())
+    if kind == "fts5":
+        db.execute(text(
+            "DELETE FROM prompt_search WHERE rowid IN "
+            "(SELECT rowid FROM prompt_search WHERE prompt_search MATCH :match)"
+        ), {"match": f"project : p{int(project_id)}"})
+    elif kind == "postgresql":
+        db.execute(text("DELETE FROM prompt_search WHERE project_id = :id"), {"id": project_id})
+
+
+def terms(query):
+    return _TOKEN.findall(query)[:MAX_TERMS]
+
+
+def _fts5_match(project_id, words):
+    phrases = " AND ".join(f'"{w}"' for w in words[:-1])
+    last = f'"{words[-1]}" *'
+    expression = f"{phrases} AND {last}" if phrases else last
+    return f"project : p{int(project_id)} AND {{name content}} : ({expression})"
+
+
+def _pg_tsquery(words):
+    # Tokens are \w+ only, so they need no quoting inside to_tsquery
+    return " & ".join(words[:-1] + [words[-1] + ":*"])
+
+
+def highlight(value):
+    """HTML-escape a database highlight, then turn its marks into <mark> tags"""
+    if value is None:
+        return None
+    return html.escape(value).replace(_START, "<mark>").replace(_END, "</mark>")
+
+
+def search_prompts(db, project_id, query, limit, offset):
+    """One page of ranked matches: ([{id, name, snippet, score}], has_more)"""
+    words = terms(query)
+    if not words:
+        return [], False
+    kind = backend(db.get_bind())
+    params = {"project_id": project_id, "limit": limit + 1, "offset": offset,
+              "start": _START, "end": _END, "ellipsis": "…"}
+    if kind == "fts5":
+        params.update(match=_fts5_match(project_id, words), tokens=SNIPPET_TOKENS)
+        rows = db.execute(text(
+            "SELECT rowid AS id, "
+            "highlight(prompt_search, 1, :start, :end) AS name, "
+            "snippet(prompt_search, 2, :start, :end, :ellipsis, :tokens) AS snippet, "
+            "bm25(prompt_search, 0.0, 10.0, 1.0) AS score "
+            "FROM prompt_search WHERE prompt_search MATCH :match "
+            "ORDER BY score LIMIT :limit OFFSET :offset"
+        ), params).all()
+        # bm25 is lower-is-better; report higher-is-better
+        results = [{"id": r.id, "name": r.name, "snippet": r.snippet, "score": -r.score} for r in rows]
+    elif kind == "postgresql":
+        params.update(
+            tsquery=_pg_tsquery(words),
+            options=f"StartSel={_START}, StopSel={_END}, MaxWords=35, MinWords=10, "
+                    f"MaxFragments=2, FragmentDelimiter=\" … \"",
+        )
+        # Rank and page first; headlines are only built for the page
+        rows = db.execute(text(
+            "WITH query AS (SELECT to_tsquery(:config, :tsquery) AS q), "
+            "page AS ("
+            "  SELECT s.prompt_id, ts_rank_cd(s.document, query.q) AS score "
+            "  FROM prompt_search s, query "
+            "  WHERE s.project_id = :project_id AND s.document @@ query.q "
+            "  ORDER BY score DESC, s.prompt_id LIMIT :limit OFFSET :offset"
+            ") "
+            "SELECT p.id, ts_headline(:config, p.name, query.q, :name_options) AS name, "
+            "ts_headline(:config, p.content, query.q, :options) AS snippet, page.score "
+            "FROM page JOIN prompts p ON p.id = page.prompt_id, query "
+            "ORDER BY page.score DESC, p.id"
+        ), {**params, "config": PG_CONFIG,
+            "name_options": f"StartSel={_START}, StopSel={_END}, HighlightAll=true"}).all()
+        results = [{"id": r.id, "name": r.name, "snippet": r.snippet, "score": float(r.score)} for r in rows]
+    else:
+        conditions = " AND ".join(
+            f"(lower(name) LIKE :w{i} OR lower(content) LIKE :w{i})" for i in range(len(words))
+        )
+        params.update({f"w{i}": f"%{w.lower()}%" for i, w in enumerate(words)})
+        rows = db.execute(text(
+            f"SELECT id, name, substr(content, 1, 200) AS snippet FROM prompts "
+            f"WHERE project_id = :project_id AND {conditions} ORDER BY id LIMIT :limit OFFSET :offset"
+        ), params).all()
+        results = [{"id": r.id, "name": r.name, "snippet": r.snippet, "score": 0.0} for r in rows]
+
+    has_more = len(results) > limit
+    results = results[:limit]
+    for result in results:
+        result["name"] = highlight(result["name"])
+        result["snippet"] = highlight(result["snippet"])
+    return results, has_more
@@ -0,0 +1,76 @@
+"""
+Fast JSON responses.
+
+- FastJSONResponse is the app's default response class: orjson (when
+  installed) instead of json.dumps for the final encode.
+- model_response() and list_response() turn ORM rows into JSON bytes in
+  one go: pydantic validates the rows against the response model
+  (from_attributes) and serializes them straight to JSON in Rust, skipping
+  FastAPI's dict round trip (validate, dump to Python, encode again).
+  Routes keep their response_model for the OpenAPI schema.
+- list_response() streams lists longer than STREAM_THRESHOLD rows in
+  batches while they are read from the database, so a large prompt list is
+  never held in memory as one body.
+
+benchmarks/serialization.py compares the cost per 1k prompts.
+"""
+from functools import lru_cache
+from itertools import islice
+
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the standard library
+    orjson = None
+
+# Lists with more rows than this are streamed
+STREAM_THRESHOLD = 500
+STREAM_BATCH_SIZE = 200
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+@lru_cache(maxsize=None)
+def _adapter(model, many):
+    return TypeAdapter(list[model] if many else model)
+
+
+def encode(model, value, many=False):
+    """JSON bytes of value (ORM rows or dicts) shaped by the response model"""
+    adapter = _adapter(model, many)
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+
+def model_response(model, value, status_code=200, headers=None):
+    return Response(encode(model, value), status_code=status_code, media_type="application/json", headers=headers)
+
+
+def list_response(model, rows):
+    """
+    Response for a list of rows (a query or any iterable). Up to
+    STREAM_THRESHOLD rows are encoded into one body; beyond that the rows
+    are streamed as one JSON array, fetched and encoded in batches.
+    """
+    rows = iter(rows.yield_per(STREAM_BATCH_SIZE) if hasattr(rows, "yield_per") else rows)
+    head = list(islice(rows, STREAM_THRESHOLD + 1))
+    if len(head) <= STREAM_THRESHOLD:
+        return Response(encode(model, head, many=True), media_type="application/json")
+
+    def chunks():
+        # Encoded batches are JSON arrays; splice them into a single one
+        batch = head
+        separator = b"["
+        while batch:
+            yield separator + encode(model, batch, many=True)[1:-1]
+            separator = b","
+            batch = list(islice(rows, STREAM_BATCH_SIZE))
+        yield b"]"
+
+    return StreamingResponse(chunks(), media_type="application/json")
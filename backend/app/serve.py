@@ -0,0 +1,168 @@
+"""
+Production server entrypoint:
+
+    cd backend
+    python -m app.serve --host 0.0.0.0 --port 8000
+
+Runs gunicorn with uvicorn workers:
+
+- the app is imported once in the master (preload) and its objects are
+  frozen out of the garbage collector before forking, so workers share
+  those pages copy-on-write instead of each importing the app;
+- one worker per available core (CPU affinity and cgroup quota aware)
+  unless SERVE_WORKERS is set;
+- workers are recycled after SERVE_MAX_REQUESTS requests (with jitter)
+  or once their resident memory exceeds SERVE_MAX_WORKER_MEMORY_MB;
+- on SIGTERM each worker first reports not-ready on /readyz for
+  SERVE_DRAIN_DELAY_SECONDS while still serving, so load balancers stop
+  routing to it, then stops accepting connections and waits for in-flight
+  requests (including streamed replies) up to SERVE_GRACEFUL_TIMEOUT
+  (the drain itself is done by the app, see health.py).
+
+Without gunicorn and uvicorn-worker (e.g. on Windows) it falls back to uvicorn's own
+multi-process mode, which has no preload or memory-based recycling.
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import sys
+
+from .capacity import worker_count
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+APP_PATH = "app.main:app"
+MEMORY_CHECK_SECONDS = 10
+
+
+def resident_memory_mb():
+    """Current RSS of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource  # not available on Windows
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_gunicorn(host, port):
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.arbiter import Arbiter
+    from uvicorn.server import Server
+    from uvicorn_worker import UvicornWorker
+
+    settings = get_settings()
+
+    class Worker(UvicornWorker):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # Time left for in-flight requests once the drain delay is over
+            self.config.timeout_graceful_shutdown = max(
+                1, settings.serve_graceful_timeout - settings.serve_drain_delay_seconds
+            )
+
+        async def _watch_memory(self, server):
+            limit = settings.serve_max_worker_memory_mb
+            while not server.should_exit:
+                await asyncio.sleep(MEMORY_CHECK_SECONDS)
+                rss = resident_memory_mb()
+                if rss > limit:
+                    logger.warning("Worker %s uses %.0f MB (limit %d MB), recycling", os.getpid(), rss, limit)
+                    # Graceful, without the drain delay: the other workers keep the instance ready
+                    server.should_exit = True
+
+        async def _serve(self):
+            self.config.app = self.wsgi
+            server = Server(config=self.config)
+            self._install_sigquit_handler()
+            if settings.serve_max_worker_memory_mb > 0:
+                watcher = asyncio.create_task(self._watch_memory(server))
+            await server.serve(sockets=self.sockets)
+            if settings.serve_max_worker_memory_mb > 0:
+                watcher.cancel()
+            if not server.started:
+                sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+    def post_fork(server, worker):
+        # Connection pools must not be shared across processes
+        from .database import engine, replica_engine
+
+        for bind in (engine, replica_engine):
+            if bind is not None:
+                bind.dispose(close=False)
+
+    class Application(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from .main import app
+
+            # Keep the collector from touching (and so copying) preloaded objects in workers
+            gc.freeze()
+            return app
+
+    workers = worker_count()
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": Worker,
+        "preload_app": True,
+        "max_requests": settings.serve_max_requests,
+        "max_requests_jitter": settings.serve_max_requests_jitter,
+        "graceful_timeout": int(settings.serve_graceful_timeout),
+        "timeout": int(settings.serve_worker_timeout),
+        "keepalive": settings.serve_keepalive_seconds,
+        "post_fork": post_fork,
+    }
+    logger.info("Starting gunicorn on %s:%s with %d workers", host, port, workers)
+    Application(options).run()
+
+
+def run_uvicorn(host, port):
+    import uvicorn
+
+    settings = get_settings()
+    workers = worker_count()
+    logger.warning("gunicorn is not available; using uvicorn workers (no preload or memory recycling)")
+    uvicorn.run(
+        APP_PATH,
+        host=host,
+        port=port,
+        workers=workers,
+        limit_max_requests=settings.serve_max_requests or None,
+        timeout_graceful_shutdown=settings.serve_graceful_timeout,
+        timeout_keep_alive=settings.serve_keepalive_seconds,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the app with multiple production workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        import gunicorn  # noqa: F401
+        import uvicorn_worker  # noqa: F401
+    except ImportError:
+        run_uvicorn(args.host, args.port)
+        return
+    run_gunicorn(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Text extraction, normalization and chunking for uploaded files.
+
+Everything here is pure CPU work on bytes and strings, without database or
+app state, so ingestion.py can run it in worker processes. PDF and DOCX
+support needs the optional pypdf and python-docx packages; without them
+those files are reported as unsupported.
+"""
+import io
+import re
+import unicodedata
+from pathlib import PurePath
+
+TEXT_EXTENSIONS = {".txt", ".text", ".csv", ".log", ".json", ".yaml", ".yml", ".rst"}
+MARKDOWN_EXTENSIONS = {".md", ".markdown"}
+
+# Where to end a chunk, best first: paragraph, line, sentence, word
+BREAKS = ("\n\n", "\n", ". ", " ")
+
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_SPACES = re.compile(r"[ \t]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_MD_FENCE = re.compile(r"^(```|~~~).*$", re.MULTILINE)
+_MD_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+", re.MULTILINE)
+_MD_IMAGE = re.compile(r"!\[([^\]]*)\]\([^)]*\)")
+_MD_LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_MD_EMPHASIS = re.compile(r"(\*\*|__|\*|_|`)(\S(?:.*?\S)?)\1")
+_MD_QUOTE = re.compile(r"^\s{0,3}>\s?", re.MULTILINE)
+
+
+class UnsupportedFile(Exception):
+    """The file type cannot be read (or needs a package that is not installed)"""
+
+
+def decode_text(data):
+    if data.startswith(b"\xef\xbb\xbf"):
+        return data[3:].decode("utf-8", errors="replace")
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16", errors="replace")
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def looks_like_text(data):
+    return b"\x00" not in data[:8192]
+
+
+def extract_pdf(data):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise UnsupportedFile("PDF extraction needs the pypdf package")
+    reader = PdfReader(io.BytesIO(data))
+    return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def extract_docx(data):
+    try:
+        import docx
+    except ImportError:
+        raise UnsupportedFile("DOCX extraction needs the python-docx package")
+    document = docx.Document(io.BytesIO(data))
+    parts = [paragraph.text for paragraph in document.paragraphs]
+    for table in document.tables:
+        for row in table.rows:
+            parts.append("\t".join(cell.text for cell in row.cells))
+    return "\n".join(parts)
+
+
+def strip_markdown(text):
+    """Drop Markdown syntax, keeping the words (link text, code, headings)"""
+    text = _MD_FENCE.sub("", text)
+    text = _MD_HEADING.sub("", text)
+    text = _MD_IMAGE.sub(r"\1", text)
+    text = _MD_LINK.sub(r"\1", text)
+    text = _MD_QUOTE.sub("", text)
+    return _MD_EMPHASIS.sub(r"\2", text)
+
+
+def extract_text(filename, data):
+    extension = PurePath(filename or "").suffix.lower()
+    if extension == ".pdf":
+        return extract_pdf(data)
+    if extension == ".docx":
+        return extract_docx(data)
+    if extension in MARKDOWN_EXTENSIONS:
+        return strip_markdown(decode_text(data))
+    if extension in TEXT_EXTENSIONS or looks_like_text(data):
+        return decode_text(data)
+    raise UnsupportedFile(f"Cannot extract text from {extension or 'this'} files")
+
+
+def normalize(text):
+    """NFKC, Unix newlines, no control characters, collapsed whitespace"""
+    text = unicodedata.normalize("NFKC", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _CONTROL.sub("", text)
+    text = _SPACES.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def chunk_spans(text, size, overlap):
+    """
+    (start, end) offsets of chunks of at most size characters, each
+    overlapping the previous one by about overlap characters. Chunks end at
+    the best boundary (see BREAKS) in their last fifth, if there is one.
+    """
+    spans = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + size, length)
+        if end < length:
+            window_start = start + size * 4 // 5
+            for separator in BREAKS:
+                cut = text.rfind(separator, window_start, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        spans.append((start, end))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+        if not text[start - 1].isspace():
+            # Start the overlap on a word
+            space = text.find(" ", start, end)
+            if space != -1 and space + 1 < end:
+                start = space + 1
+    return spans
+
+
+def ingest(filename, data, chunk_size, chunk_overlap):
+    """
+    Extract, normalize and chunk one file. Returns (status, detail, chunks)
+    with chunks as [(start, end, content)]; runs in a worker process.
+    """
+    try:
+        text = normalize(extract_text(filename, data))
+    except UnsupportedFile as e:
+        return "unsupported", str(e), []
+    except Exception as e:
+        # Corrupt or encrypted documents
+        return "failed", f"{type(e).__name__}: {e}"[:1000], []
+    chunks = [(start, end, text[start:end]) for start, end in chunk_spans(text, chunk_size, chunk_overlap)]
+    return "ready", None, chunks
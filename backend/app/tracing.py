@@ -0,0 +1,513 @@
+"""
+Request tracing: one trace per request, with spans for the route, its SQL
+queries and its upstream OpenAI calls.
+
+Enabled with TRACE_EXPORTER ("file", "console" or both, comma separated).
+The span model follows OpenTelemetry, so traces line up with other
+services. Ids, parent links and kinds (server, client, internal) match, and
+context is propagated with W3C trace context:
+
+- An incoming traceparent header continues the caller's trace; otherwise a
+  new trace starts. Every response carries its trace id in X-Trace-Id.
+- Upstream HTTP requests carry a traceparent for their own client span.
+
+Spans come from:
+
+- TracingMiddleware: a server span per HTTP request, named after the
+  matched route template (e.g. "POST /chat"), tagged with its router;
+- instrument_engine: a client span per SQL statement (SQLAlchemy cursor
+  events), with the parameterized statement but never the values;
+- upstream_transport.TracedTransport: a client span per upstream HTTP
+  request, so retries made inside the OpenAI SDK show up too;
+- span(): anything else, e.g. one span per call_openai_with_retry attempt.
+
+Sampling is meant for high request rates. Spans are only collected in
+memory while the request runs; the keep-or-drop decision is made when it
+ends. A trace is exported if any of these holds:
+
+- the caller sampled it (traceparent flag), if the caller's address is in
+  TRACE_TRUSTED_PEERS. Anyone can send the flag, so from other clients it
+  is ignored (the trace id is still continued);
+- its trace id falls in TRACE_SAMPLE_RATE (the same ratio rule as
+  OpenTelemetry's TraceIdRatioBased, so services agree);
+- it took longer than TRACE_SLOW_MS;
+- it recorded an error.
+
+Slow and failing requests are therefore always there to inspect. A trace
+keeps at most TRACE_MAX_SPANS spans.
+
+Kept traces are handed to a writer thread through a bounded queue (dropped,
+never blocking, when it is full). The file exporter appends one JSON span
+per line to TRACE_FILE. The console exporter prints an indented tree to
+stderr. To read a trace file without a collector:
+
+    python -m app.tracing traces.jsonl --slowest 10
+    python -m app.tracing traces.jsonl --trace 4bf92f3577b34da6a3ce929d0e0e4736
+"""
+import argparse
+import contextvars
+import ipaddress
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+SERVER, CLIENT, INTERNAL = "server", "client", "internal"
+TRACE_ID_HEADER = "x-trace-id"
+QUEUE_SIZE = 2000
+# Requests not worth a trace at any rate
+UNTRACED_PREFIXES = ("/metrics", "/static", "/favicon.ico")
+MAX_STATEMENT_CHARS = 1000
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+traces_exported = Counter("traces_exported_total", "Traces kept and exported", ["reason"])
+traces_dropped = Counter("traces_dropped_total", "Kept traces dropped because the export queue was full")
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "spans", "dropped_spans", "error", "max_spans")
+
+    def __init__(self, trace_id, sampled, max_spans):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans = []
+        self.dropped_spans = 0
+        self.error = False
+        self.max_spans = max_spans
+
+    def add(self, span):
+        # list.append is atomic, so spans can end on any thread
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start", "end", "attributes", "status")
+
+    def __init__(self, trace, name, kind=INTERNAL, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes or {}
+        self.status = "ok"
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, error):
+        self.status = "error"
+        self.attributes["error.type"] = type(error).__name__
+        self.attributes["error.message"] = str(error)[:300]
+        self.trace.error = True
+
+    def traceparent(self):
+        return f"00-{self.trace.trace_id}-{self.span_id}-{'01' if self.trace.sampled else '00'}"
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.time_ns()
+            self.trace.add(self)
+
+    @property
+    def duration_ms(self):
+        return ((self.end or time.time_ns()) - self.start) / 1e6
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_unix_nano": self.start,
+            "end_unix_nano": self.end,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Stands in for a span outside any trace, so callers need no checks"""
+
+    def set(self, key, value):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def traceparent(self):
+        return None
+
+
+NOOP = _NoopSpan()
+
+
+def current_span():
+    return _current.get()
+
+
+def parse_traceparent(value):
+    """(trace id, parent span id, sampled) from a W3C traceparent header, or None"""
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if match is None:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+class Tracer:
+    def __init__(self):
+        settings = get_settings()
+        self.exporters = {name.strip().lower() for name in settings.trace_exporter.split(",") if name.strip()}
+        self.path = settings.trace_file
+        self.sample_rate = settings.trace_sample_rate
+        self.slow_ms = settings.trace_slow_ms
+        self.max_spans = settings.trace_max_spans
+        self.trusted_peers = []
+        for peer in settings.trace_trusted_peers:
+            try:
+                self.trusted_peers.append(ipaddress.ip_network(peer, strict=False))
+            except ValueError:
+                logger.warning("Ignoring invalid TRACE_TRUSTED_PEERS entry %r", peer)
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return bool(self.exporters)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def ratio_sampled(self, trace_id):
+        # Lower 64 bits of the trace id against the ratio, as TraceIdRatioBased does
+        return int(trace_id[16:], 16) < self.sample_rate * 2 ** 64
+
+    def trusts(self, peer):
+        """Whether the sampled flag of a traceparent from this address is honored"""
+        try:
+            address = ipaddress.ip_address(peer)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_peers)
+
+    def start_trace(self, name, traceparent=None, kind=SERVER, attributes=None, trusted=False):
+        """
+        Root span of a new trace, continuing the caller's trace if traceparent
+        is valid. Its sampled flag counts only from a trusted caller.
+        """
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+            if not trusted:
+                sampled = self.ratio_sampled(trace_id)
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = self.ratio_sampled(trace_id)
+        return Span(Trace(trace_id, sampled, self.max_spans), name, kind, parent_id, attributes)
+
+    def end_trace(self, root):
+        """Finish the root span and export the trace if it is worth keeping"""
+        root.finish()
+        trace = root.trace
+        if trace.sampled:
+            reason = "sampled"
+        elif trace.error:
+            reason = "error"
+        elif self.slow_ms and root.duration_ms >= self.slow_ms:
+            reason = "slow"
+        else:
+            return
+        if trace.dropped_spans:
+            root.set("trace.dropped_spans", trace.dropped_spans)
+        try:
+            self._queue.put_nowait((reason, list(trace.spans)))
+        except queue.Full:
+            traces_dropped.inc()
+
+    def _export(self, fd, batch):
+        lines = []
+        for reason, spans in batch:
+            records = [span.to_dict() for span in spans]
+            for record in records:
+                record["kept"] = reason
+            if fd is not None:
+                lines.extend(json.dumps(record, separators=(",", ":"), default=str) + "\n" for record in records)
+            if "console" in self.exporters:
+                sys.stderr.write(render(records) + "\n")
+            traces_exported.labels(reason).inc()
+        if lines:
+            # One append per batch, so several workers can share the file
+            os.write(fd, "".join(lines).encode("utf-8"))
+
+    def _run(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600) if "file" in self.exporters else None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                stop = False
+                while len(batch) < 100:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                try:
+                    self._export(fd, batch)
+                except (OSError, ValueError) as e:
+                    logger.error("Exporting traces failed: %s", e)
+                if stop:
+                    break
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            unknown = self.exporters - {"file", "console"}
+            if unknown:
+                logger.warning("Unknown TRACE_EXPORTER value(s) ignored: %s", ", ".join(sorted(unknown)))
+            logger.info("Tracing to %s (sampling %.2f%%, keeping traces slower than %s ms)",
+                        ", ".join(sorted(self.exporters & {"file", "console"})) or "nothing",
+                        self.sample_rate * 100, self.slow_ms or "-")
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Flush kept traces and stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+tracer = Tracer()
+
+
+@contextmanager
+def trace(name, traceparent=None, kind=SERVER, trusted=False, **attributes):
+    """Run the block as the root span of a trace (see Tracer.start_trace)"""
+    if not tracer.running:
+        yield NOOP
+        return
+    root = tracer.start_trace(name, traceparent, kind, attributes, trusted)
+    token = _current.set(root)
+    try:
+        yield root
+    except Exception as e:
+        root.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        tracer.end_trace(root)
+
+
+@contextmanager
+def span(name, kind=INTERNAL, **attributes):
+    """Run the block as a child of the current span; a no-op outside a trace"""
+    parent = _current.get()
+    if parent is None:
+        yield NOOP
+        return
+    child = Span(parent.trace, name, kind, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def inject(headers):
+    """Add the current span's traceparent to outgoing request headers"""
+    current = _current.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent()
+
+
+def instrument_engine(engine, name):
+    """Trace every SQL statement run on engine while a trace is active"""
+    if not tracer.enabled:
+        return
+    from sqlalchemy import event
+
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if parent is None or context is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        context._trace_span = Span(parent.trace, f"{operation} {name}", CLIENT, parent.span_id, {
+            "db.system": system,
+            "db.statement": statement[:MAX_STATEMENT_CHARS],
+            "db.executemany": executemany,
+        })
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        query_span = getattr(context, "_trace_span", None)
+        if query_span is not None:
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                query_span.set("db.rows", cursor.rowcount)
+            query_span.finish()
+            context._trace_span = None
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        query_span = getattr(exception_context.execution_context, "_trace_span", None)
+        if query_span is not None:
+            query_span.record_error(exception_context.original_exception)
+            query_span.finish()
+            exception_context.execution_context._trace_span = None
+
+
+class TracingMiddleware:
+    """Server span per HTTP request, continuing an incoming traceparent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.running or scope["path"].startswith(UNTRACED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1")
+        method = scope["method"]
+        status = {}
+        client = scope.get("client")
+        trusted = bool(traceparent) and client is not None and tracer.trusts(client[0])
+
+        with trace(f"{method} {scope['path']}", traceparent, SERVER, trusted, **{
+            "http.method": method,
+            "http.target": scope["path"],
+        }) as root:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (TRACE_ID_HEADER.encode("latin-1"), root.trace.trace_id.encode("latin-1"))
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None and getattr(route, "path", None):
+                    # Name by template, so one route's spans group together
+                    root.name = f"{method} {route.path}"
+                    root.set("http.route", route.path)
+                    tags = getattr(route, "tags", None)
+                    if tags:
+                        root.set("http.router", tags[0])
+                code = status.get("code")
+                root.set("http.status_code", code)
+                if code is None or code >= 500:
+                    root.status = "error"
+                    root.trace.error = True
+
+
+def render(records):
+    """Indented text tree of one trace's span records (dicts from to_dict)"""
+    if not records:
+        return ""
+    ids = {r["span_id"] for r in records}
+    children = {}
+    for record in records:
+        parent = record["parent_id"] if record["parent_id"] in ids else None
+        children.setdefault(parent, []).append(record)
+    for group in children.values():
+        group.sort(key=lambda r: r["start_unix_nano"])
+    roots = children.get(None, [])
+    origin = min(r["start_unix_nano"] for r in records)
+    head = roots[0] if roots else records[0]
+    lines = [f"trace {head['trace_id']}  {head['duration_ms']:.1f} ms  kept: {head.get('kept', '-')}"]
+
+    def walk(record, depth):
+        offset = (record["start_unix_nano"] - origin) / 1e6
+        attributes = " ".join(f"{k}={v}" for k, v in record["attributes"].items() if k != "db.statement")
+        statement = record["attributes"].get("db.statement")
+        if statement:
+            attributes = (attributes + " " + " ".join(statement.split())[:120]).strip()
+        error = "  ERROR" if record["status"] == "error" else ""
+        lines.append(f"{'  ' * (depth + 1)}{record['name']}  {record['duration_ms']:.1f} ms  "
+                     f"(+{offset:.1f}) [{record['kind']}]{error}  {attributes}".rstrip())
+        for child in children.get(record["span_id"], []):
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show traces from a TRACE_FILE")
+    parser.add_argument("file")
+    parser.add_argument("--trace", help="Show this trace id")
+    parser.add_argument("--slowest", type=int, default=10, help="Show the N slowest traces")
+    parser.add_argument("--name", help="Only traces whose root span name contains this")
+    args = parser.parse_args()
+
+    traces = {}
+    with open(args.file, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                traces.setdefault(record["trace_id"], []).append(record)
+
+    if args.trace:
+        selected = [traces.get(args.trace.lower(), [])]
+    else:
+        def root_of(records):
+            ids = {r["span_id"] for r in records}
+            return next((r for r in records if r["parent_id"] not in ids), records[0])
+
+        candidates = [records for records in traces.values()
+                      if not args.name or args.name in root_of(records)["name"]]
+        selected = sorted(candidates, key=lambda records: root_of(records)["duration_ms"], reverse=True)
+        selected = selected[:args.slowest]
+    for records in selected:
+        print(render(records) if records else f"Trace {args.trace} not found")
+        print()
+
+
+if __name__ == "__main__":
+    main()
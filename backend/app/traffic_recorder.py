@@ -0,0 +1,256 @@
+"""
+Opt-in traffic recorder for replay-based performance testing.
+
+With TRAFFIC_RECORD_PATH set, a sample (TRAFFIC_RECORD_SAMPLE_RATE) of
+/chat and list requests is appended to that file, one compact JSON object
+per line:
+
+    {"ts": 1760000000.123, "op": "chat", "user": "3f9a...", "project": "b01c...",
+     "status": 200, "ms": 812.4, "ttfb_ms": 812.1, "req_bytes": 96,
+     "resp_bytes": 431, "msg_chars": 57, "msg_hash": "c4e2...", "chained": false,
+     "upstream": [{"status": 200, "ms": 790.2, "bytes": 1630, "stream": false}]}
+
+No content is stored: user and project ids and the chat message are
+replaced by keyed hashes (TRAFFIC_RECORD_SALT), so the trace keeps who
+talks to which project and which messages repeat, plus message lengths,
+timings and upstream response sizes. Lines are handed to a writer thread
+through a bounded queue and dropped (traffic_records_dropped_total) rather
+than blocking requests. Several workers can share one file: each batch is
+a single append.
+
+benchmarks/replay.py turns a trace back into traffic against the fake
+upstream.
+"""
+import contextvars
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs
+
+from prometheus_client import Counter
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+ROUTES = [
+    ("POST", re.compile(r"^/chat/?$"), "chat"),
+    ("GET", re.compile(r"^/projects/?$"), "list_projects"),
+    ("GET", re.compile(r"^/projects/(\d+)/prompts/?$"), "list_prompts"),
+    ("GET", re.compile(r"^/projects/(\d+)/files/?$"), "list_files"),
+    ("GET", re.compile(r"^/dashboard/summary/?$"), "dashboard_summary"),
+]
+# Query parameters worth keeping (none of them carry content)
+RECORDED_QUERY = {"limit", "offset", "preview"}
+# Request bodies are only parsed for /chat; larger ones are just counted
+MAX_CAPTURED_BODY = 1024 * 1024
+QUEUE_SIZE = 10000
+
+records_written = Counter("traffic_records_written_total", "Requests written to the traffic trace")
+records_dropped = Counter("traffic_records_dropped_total", "Trace records dropped because the queue was full")
+
+# Upstream responses made while handling the current request
+_upstream_responses = contextvars.ContextVar("upstream_responses", default=None)
+
+
+def note_upstream_response(response):
+    """httpx response hook: remember the upstream call if this request is recorded"""
+    responses = _upstream_responses.get()
+    if responses is not None:
+        responses.append(response)
+
+
+def _upstream_summary(response):
+    entry = {
+        "status": response.status_code,
+        "bytes": response.num_bytes_downloaded,
+        "stream": response.headers.get("content-type", "").startswith("text/event-stream"),
+    }
+    try:
+        entry["ms"] = round(response.elapsed.total_seconds() * 1000, 1)
+    except RuntimeError:
+        # Never read to the end (e.g. a cancelled hedge)
+        entry["ms"] = None
+    return entry
+
+
+def match_route(method, path):
+    """(op, path project id) for recorded endpoints, else (None, None)"""
+    for route_method, pattern, op in ROUTES:
+        if method == route_method:
+            match = pattern.match(path)
+            if match:
+                return op, match.group(1) if match.groups() else None
+    return None, None
+
+
+class TrafficRecorder:
+    def __init__(self):
+        settings = get_settings()
+        self.path = settings.traffic_record_path
+        self.sample_rate = settings.traffic_record_sample_rate
+        # Without a configured salt hashes only correlate within one run (the
+        # preloaded master's salt is shared by its workers)
+        salt = settings.traffic_record_salt
+        self.salt = salt.encode("utf-8") if salt else os.urandom(16)
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return bool(self.path) and self.sample_rate > 0
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def sampled(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def hash(self, kind, value):
+        """Keyed hash of value; kind keeps e.g. user 1 and project 1 apart"""
+        if value is None:
+            return None
+        return hmac.new(self.salt, f"{kind}:{value}".encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+    def record(self, entry):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            records_dropped.inc()
+
+    def _write(self, fd, entries):
+        data = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries).encode("utf-8")
+        os.write(fd, data)
+        records_written.inc(len(entries))
+
+    def _run(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            while True:
+                entry = self._queue.get()
+                if entry is None:
+                    break
+                entries = [entry]
+                stop = False
+                while len(entries) < 500:
+                    try:
+                        entry = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if entry is None:
+                        stop = True
+                        break
+                    entries.append(entry)
+                try:
+                    self._write(fd, entries)
+                except OSError as e:
+                    logger.error("Writing the traffic trace failed: %s", e)
+                if stop:
+                    break
+        finally:
+            os.close(fd)
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            logger.info("Recording %.0f%% of chat and list traffic to %s", self.sample_rate * 100, self.path)
+            self._thread = threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Flush queued records and stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+recorder = TrafficRecorder()
+
+
+def _chat_fields(body):
+    try:
+        data = json.loads(body)
+        message = data["message"]
+    except (ValueError, KeyError, TypeError):
+        return {}, None
+    if not isinstance(message, str):
+        return {}, None
+    return {
+        "msg_chars": len(message),
+        "msg_hash": recorder.hash("message", message),
+        "chained": bool(data.get("previous_response_id")),
+    }, data.get("project_id")
+
+
+class TrafficRecorderMiddleware:
+    """Time sampled requests and queue their redacted trace records"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not recorder.running:
+            await self.app(scope, receive, send)
+            return
+        op, path_project = match_route(scope["method"], scope["path"])
+        if op is None or not recorder.sampled():
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        ts = round(time.time(), 3)
+        body = bytearray()
+        sizes = {"req": 0, "resp": 0}
+        status = {}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                sizes["req"] += len(chunk)
+                if op == "chat" and len(body) < MAX_CAPTURED_BODY:
+                    body.extend(chunk)
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                status["ttfb"] = time.perf_counter()
+            elif message["type"] == "http.response.body":
+                sizes["resp"] += len(message.get("body", b""))
+            await send(message)
+
+        responses = []
+        token = _upstream_responses.set(responses)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            _upstream_responses.reset(token)
+            finished = time.perf_counter()
+            fields, project = _chat_fields(bytes(body)) if op == "chat" else ({}, path_project)
+            entry = {
+                "ts": ts,
+                "op": op,
+                "user": recorder.hash("user", scope.get("state", {}).get("user_id")),
+                "project": recorder.hash("project", project),
+                "status": status.get("code"),
+                "ms": round((finished - started) * 1000, 1),
+                "ttfb_ms": round((status.get("ttfb", finished) - started) * 1000, 1),
+                "req_bytes": sizes["req"],
+                "resp_bytes": sizes["resp"],
+                **fields,
+            }
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            params = {k: int(v[0]) for k, v in query.items() if k in RECORDED_QUERY and v[0].isdigit()}
+            if params:
+                entry["query"] = params
+            entry["upstream"] = [_upstream_summary(r) for r in responses]
+            recorder.record(entry)
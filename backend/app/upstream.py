@@ -0,0 +1,124 @@
+"""
+Shared OpenAI clients, created on first use.
+
+The openai package (and the tuned transport in upstream_transport.py) is
+imported lazily so that importing the app (worker boot, test collection)
+does not pay for it. UpstreamWarmer opens connections when a worker starts
+and pings the API periodically so idle workers keep them open.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_api_key():
+    """Return the configured OpenAI API key, validating its format"""
+    api_key = get_settings().openai_api_key
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found. Check backend/.env file has: OPENAI_API_KEY=sk-proj-...")
+    if not api_key.startswith("sk-"):
+        raise ValueError(f"Invalid API key format. Key should start with 'sk-'. Got: {api_key[:10]}...")
+    return api_key
+
+
+def get_client():
+    """Return the process-wide OpenAI client, creating it on first call"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                from .upstream_transport import build_http_client
+
+                api_key = get_api_key()
+                _client = OpenAI(api_key=api_key, base_url=get_settings().openai_base_url,
+                                 http_client=build_http_client())
+                logger.info("OpenAI client initialized (key length: %d)", len(api_key))
+    return _client
+
+
+def get_async_client():
+    """Return the process-wide AsyncOpenAI client (used by the WebSocket chat)"""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                from openai import AsyncOpenAI
+                from .upstream_transport import build_async_http_client
+
+                _async_client = AsyncOpenAI(api_key=get_api_key(), base_url=get_settings().openai_base_url,
+                                            http_client=build_async_http_client())
+    return _async_client
+
+
+def _ping(client):
+    client.with_options(max_retries=0).models.list()
+
+
+class UpstreamWarmer:
+    """
+    Opens UPSTREAM_PREWARM_CONNECTIONS connections per client when the
+    worker starts, and repeats every UPSTREAM_KEEPWARM_SECONDS so they are
+    not closed by the keep-alive expiry while the worker is idle.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.upstream_prewarm
+        self.connections = settings.upstream_prewarm_connections
+        self.interval = settings.upstream_keepwarm_seconds
+        self._task = None
+
+    async def warm(self):
+        # Concurrent pings force distinct connections (one per in-flight request)
+        from starlette.concurrency import run_in_threadpool
+
+        # Creating the clients imports openai; keep that off the event loop
+        sync_client, async_client = await run_in_threadpool(lambda: (get_client(), get_async_client()))
+        results = await asyncio.gather(
+            *(run_in_threadpool(_ping, sync_client) for _ in range(self.connections)),
+            *(async_client.with_options(max_retries=0).models.list() for _ in range(self.connections)),
+            return_exceptions=True,
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            logger.warning("Upstream warm-up: %d of %d pings failed: %s", len(errors), len(results), errors[0])
+
+    async def _loop(self):
+        started = time.monotonic()
+        while True:
+            try:
+                await self.warm()
+            except Exception as e:
+                logger.warning("Upstream warm-up failed: %s", e)
+            if started is not None:
+                logger.info("Upstream connections pre-warmed in %.0fms", (time.monotonic() - started) * 1000)
+                started = None
+            if self.interval <= 0:
+                return
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+warmer = UpstreamWarmer()
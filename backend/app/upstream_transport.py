@@ -0,0 +1,318 @@
+"""
+Tuned HTTP transport for the OpenAI clients (UPSTREAM_* settings).
+
+HTTP/2 when the h2 package is installed, explicit pool limits and
+keep-alive expiry, and a small DNS cache in front of the connection pool.
+Requests and newly opened connections are counted per client on /metrics
+(upstream_http_requests_total vs upstream_connections_opened_total), so
+connection reuse can be read off directly. Responses are also reported to
+the traffic recorder when it is on.
+
+Over HTTP/1.1 the sync client's connections also report to the
+AbortHandle of the call using them, so a hedged attempt that lost its race
+can be stopped from another thread even while it waits for its first byte.
+"""
+import contextvars
+import logging
+import socket
+import threading
+import time
+
+import anyio
+import httpcore
+import httpx
+from prometheus_client import Counter
+
+from .config import get_settings
+from .traffic_recorder import note_upstream_response
+from .tracing import CLIENT, inject, span
+
+logger = logging.getLogger(__name__)
+
+upstream_requests = Counter("upstream_http_requests_total", "HTTP requests sent to the OpenAI API", ["client"])
+connections_opened = Counter(
+    "upstream_connections_opened_total", "New TCP connections opened to the OpenAI API", ["client"]
+)
+dns_lookups = Counter("upstream_dns_lookups_total", "Upstream host name resolutions", ["result"])
+
+
+class DNSCache:
+    """Resolved addresses per (host, port), kept for UPSTREAM_DNS_CACHE_SECONDS"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port):
+        entry = self._entries.get((host, port))
+        if entry and entry[0] > time.monotonic():
+            dns_lookups.labels("hit").inc()
+            return entry[1]
+        dns_lookups.labels("miss").inc()
+        return None
+
+    def put(self, host, port, infos):
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._entries[(host, port)] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+# The AbortHandle of the upstream call made from this context, if any
+current_abort_handle = contextvars.ContextVar("upstream_abort_handle", default=None)
+
+
+def _shutdown(stream):
+    sock = stream.get_extra_info("socket")
+    if sock is None:
+        return
+    try:
+        # Plain socket shutdown, also under TLS: the reading thread owns the SSL object
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class AbortHandle:
+    """
+    Stops one upstream call from another thread. The connection the call
+    writes to or reads from attaches itself here; abort() shuts its socket
+    down, which wakes a blocked read and drops the request upstream.
+    release() once the call is over, before its connection can be reused.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stream = None
+        self._aborted = False
+        self._released = False
+
+    def attach(self, stream):
+        with self._lock:
+            if self._released:
+                return
+            self._stream = stream
+            aborted = self._aborted
+        if aborted:
+            _shutdown(stream)
+
+    def abort(self):
+        with self._lock:
+            self._aborted = True
+            stream = None if self._released else self._stream
+        # The connection may have been handed to another call meanwhile (SDK retries)
+        if stream is not None and stream.owner is self:
+            _shutdown(stream)
+
+    def release(self):
+        with self._lock:
+            self._released = True
+            self._stream = None
+
+
+class TrackedStream(httpcore.NetworkStream):
+    """Network stream that attaches itself to the AbortHandle of the call using it"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.owner = None
+
+    def _attach(self):
+        self.owner = current_abort_handle.get()
+        if self.owner is not None:
+            self.owner.attach(self)
+
+    def read(self, max_bytes, timeout=None):
+        self._attach()
+        return self.inner.read(max_bytes, timeout)
+
+    def write(self, buffer, timeout=None):
+        self._attach()
+        self.inner.write(buffer, timeout)
+
+    def close(self):
+        self.inner.close()
+
+    def start_tls(self, ssl_context, server_hostname=None, timeout=None):
+        return TrackedStream(self.inner.start_tls(ssl_context, server_hostname, timeout))
+
+    def get_extra_info(self, info):
+        return self.inner.get_extra_info(info)
+
+
+class CachingBackend(httpcore.NetworkBackend):
+    """Sync network backend that resolves through the DNS cache and counts connects"""
+
+    def __init__(self, inner, cache, track=False):
+        self.inner = inner
+        self.cache = cache
+        # Only over HTTP/1.1: an HTTP/2 connection is shared by concurrent calls
+        self.track = track
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addresses = self.cache.get(host, port)
+        if addresses is None:
+            addresses = self.cache.put(host, port, socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        try:
+            # TLS still verifies and sends SNI for the host name (start_tls gets it separately)
+            stream = self.inner.connect_tcp(addresses[0], port, timeout, local_address, socket_options)
+        except Exception:
+            self.cache.forget(host, port)
+            raise
+        connections_opened.labels("sync").inc()
+        return TrackedStream(stream) if self.track else stream
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return self.inner.connect_unix_socket(path, timeout, socket_options)
+
+    def sleep(self, seconds):
+        self.inner.sleep(seconds)
+
+
+class AsyncCachingBackend(httpcore.AsyncNetworkBackend):
+    """Async counterpart of CachingBackend"""
+
+    def __init__(self, inner, cache):
+        self.inner = inner
+        self.cache = cache
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addresses = self.cache.get(host, port)
+        if addresses is None:
+            addresses = self.cache.put(host, port, await anyio.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        try:
+            stream = await self.inner.connect_tcp(addresses[0], port, timeout, local_address, socket_options)
+        except Exception:
+            self.cache.forget(host, port)
+            raise
+        connections_opened.labels("async").inc()
+        return stream
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self.inner.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds):
+        await self.inner.sleep(seconds)
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def transport_options():
+    """Keyword arguments shared by the sync and async transports"""
+    settings = get_settings()
+    http2 = settings.upstream_http2 and _http2_available()
+    if settings.upstream_http2 and not http2:
+        logger.warning("UPSTREAM_HTTP2 is on but the h2 package is not installed; using HTTP/1.1")
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=settings.upstream_max_connections,
+            max_keepalive_connections=settings.upstream_max_keepalive,
+            keepalive_expiry=settings.upstream_keepalive_expiry,
+        ),
+    }
+
+
+def _install_dns_cache(transport, backend_class, cache, **kwargs):
+    # httpx builds the httpcore pool itself; wrap its network backend in place
+    pool = getattr(transport, "_pool", None)
+    if pool is None or not hasattr(pool, "_network_backend"):
+        logger.warning("Cannot install the upstream DNS cache on this httpx version")
+        return
+    pool._network_backend = backend_class(pool._network_backend, cache, **kwargs)
+
+
+def client_timeout():
+    settings = get_settings()
+    return httpx.Timeout(settings.upstream_timeout, connect=settings.upstream_connect_timeout)
+
+
+def _span_attributes(request):
+    attributes = {
+        "http.method": request.method,
+        "server.address": request.url.host,
+        "url.path": request.url.path,
+    }
+    retry = request.headers.get("x-stainless-retry-count")
+    if retry and retry != "0":
+        # Set by the OpenAI SDK on its own retries
+        attributes["http.resend_count"] = int(retry) if retry.isdigit() else retry
+    return attributes
+
+
+class TracedTransport(httpx.BaseTransport):
+    """
+    A client span per HTTP request (see tracing.py). The OpenAI SDK retries
+    on its own, so one responses.create can be several requests. The
+    request carries a traceparent for its span, so the upstream can join
+    the trace.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def handle_request(self, request):
+        with span(request.method, CLIENT, **_span_attributes(request)) as request_span:
+            inject(request.headers)
+            # Returns once the headers are in; a streamed body is read afterwards
+            response = self.inner.handle_request(request)
+            request_span.set("http.status_code", response.status_code)
+            return response
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncTracedTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of TracedTransport"""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def handle_async_request(self, request):
+        with span(request.method, CLIENT, **_span_attributes(request)) as request_span:
+            inject(request.headers)
+            response = await self.inner.handle_async_request(request)
+            request_span.set("http.status_code", response.status_code)
+            return response
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def build_http_client():
+    options = transport_options()
+    transport = httpx.HTTPTransport(**options)
+    _install_dns_cache(transport, CachingBackend, DNSCache(get_settings().upstream_dns_cache_seconds),
+                       track=not options["http2"])
+    return httpx.Client(
+        transport=TracedTransport(transport),
+        timeout=client_timeout(),
+        event_hooks={
+            "request": [lambda request: upstream_requests.labels("sync").inc()],
+            "response": [note_upstream_response],
+        },
+    )
+
+
+def build_async_http_client():
+    async def count_request(request):
+        upstream_requests.labels("async").inc()
+
+    async def note_response(response):
+        note_upstream_response(response)
+
+    transport = httpx.AsyncHTTPTransport(**transport_options())
+    _install_dns_cache(transport, AsyncCachingBackend, DNSCache(get_settings().upstream_dns_cache_seconds))
+    return httpx.AsyncClient(transport=AsyncTracedTransport(transport), timeout=client_timeout(), event_hooks={"request": [count_request], "response": [note_response]})
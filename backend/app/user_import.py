@@ -0,0 +1,219 @@
+"""
+Bulk user provisioning (POST /users/bulk).
+
+Onboarding an organization used to mean one POST /users/register per seat.
+Each of those calls ran its own existence query, password hash and commit.
+Here the upload is read as a stream and handled in batches of
+USER_IMPORT_BATCH_SIZE rows. The upload can be CSV with email and password
+columns, JSON Lines, or a JSON array of {"email", "password"} objects.
+
+- Rows are validated with the same rules as /users/register.
+- Emails are lowercased, and existing ones are found with one IN query
+  per batch.
+- Passwords are hashed in parallel on a thread pool. passlib's pbkdf2 runs
+  in OpenSSL (hashlib.pbkdf2_hmac), which releases the GIL, so threads keep
+  every core busy without the start-up cost of worker processes.
+- New users are inserted with one transaction per batch.
+
+Every row gets a result with its 1-based row number. The status is created,
+exists, duplicate (repeated earlier in the upload), invalid (with the
+reason) or failed (the batch could not be saved).
+"""
+import codecs
+import csv
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from . import auth
+from .capacity import available_cpus
+from .config import get_settings
+from .database import SessionLocal
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+CSV_TYPES = {"text/csv", "application/csv"}
+JSON_LINES_TYPES = {"application/x-ndjson", "application/jsonl", "application/x-jsonlines"}
+
+_hash_pool = None
+
+
+class InvalidUpload(Exception):
+    """The upload as a whole cannot be read (unknown format, no email column)"""
+
+
+def _get_hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(
+            max_workers=get_settings().user_import_hash_threads or available_cpus(),
+            thread_name_prefix="password-hash",
+        )
+    return _hash_pool
+
+
+async def _lines(chunks):
+    """Text lines of a byte stream (UTF-8, with or without a BOM)"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+
+async def _csv_records(lines):
+    """Join lines into CSV records; a quoted field may span lines"""
+    parts = []
+    quotes = 0
+    async for line in lines:
+        parts.append(line)
+        # Escaped quotes come in pairs, so an odd count means a field is still open
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            yield "\n".join(parts)
+            parts = []
+            quotes = 0
+    if parts:
+        # Unterminated quote; the csv module takes the rest as the field
+        yield "\n".join(parts)
+
+
+def _row(number, value):
+    if not isinstance(value, dict):
+        return {"row": number, "error": "Expected an object with email and password"}
+    email, password = value.get("email"), value.get("password")
+    if not isinstance(email, str) or not isinstance(password, str):
+        return {"row": number, "email": email if isinstance(email, str) else None,
+                "error": "email and password must be strings"}
+    return {"row": number, "email": email, "password": password}
+
+
+async def read_rows(content_type, chunks):
+    """
+    Rows of the upload as {"row", "email", "password"}, or with "error" for
+    rows that cannot be parsed. Raises InvalidUpload for unreadable uploads.
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in CSV_TYPES:
+        columns = None
+        number = 0
+        async for record in _csv_records(_lines(chunks)):
+            if not record.strip():
+                continue
+            fields = next(csv.reader([record]))
+            if columns is None:
+                columns = [name.strip().lower() for name in fields]
+                if "email" not in columns or "password" not in columns:
+                    raise InvalidUpload("The CSV header must have email and password columns")
+                continue
+            number += 1
+            record = dict(zip(columns, (field.strip() for field in fields)))
+            yield _row(number, {"email": record.get("email", ""), "password": record.get("password", "")})
+    elif media_type in JSON_LINES_TYPES:
+        number = 0
+        async for line in _lines(chunks):
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                yield _row(number, json.loads(line))
+            except json.JSONDecodeError:
+                yield {"row": number, "error": "Invalid JSON"}
+    elif media_type == "application/json":
+        # A JSON array has to be read whole; JSON Lines is streamed
+        body = b"".join([chunk async for chunk in chunks])
+        try:
+            values = json.loads(body)
+        except ValueError:
+            raise InvalidUpload("Invalid JSON")
+        if not isinstance(values, list):
+            raise InvalidUpload("Expected a JSON array of users")
+        for number, value in enumerate(values, start=1):
+            yield _row(number, value)
+    else:
+        raise InvalidUpload("Send text/csv, application/x-ndjson or application/json")
+
+
+def _result(row, status, detail=None):
+    return {"row": row["row"], "email": row.get("email"), "status": status, "detail": detail}
+
+
+def _insert(db, rows, hashes):
+    """Insert in one transaction; on a conflict, insert one by one. Returns the emails that already existed."""
+    users = [{"email": row["email"], "hashed_password": hashed} for row, hashed in zip(rows, hashes)]
+    try:
+        db.bulk_insert_mappings(User, users)
+        db.commit()
+        return set()
+    except IntegrityError:
+        # Someone registered one of these emails since the existence query
+        db.rollback()
+    taken = set()
+    for user in users:
+        try:
+            db.bulk_insert_mappings(User, [user])
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            taken.add(user["email"])
+    return taken
+
+
+def import_batch(rows, seen):
+    """
+    Validate, hash and insert one batch. seen holds the emails of earlier
+    rows of the same upload and is updated. Returns the rows' results.
+    """
+    results = {}
+    candidates = []
+    for row in rows:
+        email = auth.normalize_email(row.get("email") or "")
+        row["email"] = email or row.get("email")
+        error = row.get("error")
+        if error is None:
+            if not auth.validate_email(email):
+                error = "Invalid email format"
+            else:
+                valid, error = auth.validate_password(row["password"])
+                error = None if valid else error
+        if error:
+            results[row["row"]] = _result(row, "invalid", error)
+        elif email in seen:
+            results[row["row"]] = _result(row, "duplicate", "Repeated earlier in the upload")
+        else:
+            seen.add(email)
+            candidates.append(row)
+
+    if candidates:
+        db = SessionLocal()
+        try:
+            existing = {email for (email,) in db.query(func.lower(User.email)).filter(
+                func.lower(User.email).in_([row["email"] for row in candidates])
+            )}
+            new = [row for row in candidates if row["email"] not in existing]
+            hashes = list(_get_hash_pool().map(auth.hash_password, [row["password"] for row in new]))
+            existing |= _insert(db, new, hashes)
+            for row in candidates:
+                if row["email"] in existing:
+                    results[row["row"]] = _result(row, "exists", "Email already registered")
+                else:
+                    results[row["row"]] = _result(row, "created")
+        except Exception as e:
+            logger.error(f"Bulk provisioning batch failed: {str(e)}")
+            db.rollback()
+            for row in candidates:
+                if row["row"] not in results:
+                    results[row["row"]] = _result(row, "failed", "Could not be saved")
+        finally:
+            db.close()
+
+    return [results[row["row"]] for row in rows]
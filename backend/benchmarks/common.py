@@ -0,0 +1,144 @@
+"""Shared helpers for the benchmark scripts: process launching and statistics."""
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# A SECRET_KEY that satisfies auth.get_secret_key() (>= 32 chars)
+BENCH_SECRET_KEY = "benchmark-secret-key-not-for-production-use"
+
+
+def free_port():
+    """Ask the OS for an unused local TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_http(url, timeout=30.0):
+    """Poll url until it answers (any status) or timeout expires"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def launch(args, env=None, cwd=None, log_path=None):
+    """Start a Python module as a subprocess, logging output to log_path"""
+    full_env = os.environ.copy()
+    if env:
+        full_env.update(env)
+    stdout = open(log_path, "wb") if log_path else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, *args],
+        env=full_env,
+        cwd=cwd or BACKEND_DIR,
+        stdout=stdout,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def stop(proc, timeout=10.0):
+    """Terminate a subprocess started with launch()"""
+    if proc is None or proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def start_fake_upstream(port, fake_args=(), log_path=None):
+    """Start benchmarks.fake_openai on port and wait until it is up"""
+    proc = launch(
+        ["-m", "benchmarks.fake_openai", "--port", str(port), *fake_args],
+        log_path=log_path,
+    )
+    wait_for_http(f"http://127.0.0.1:{port}/v1/models")
+    return proc
+
+
+def app_env(upstream_port, workdir):
+    """Environment for an app process that talks to the fake upstream"""
+    return {
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{upstream_port}/v1",
+        "SECRET_KEY": BENCH_SECRET_KEY,
+        "DATABASE_URL": f"sqlite:///{Path(workdir) / 'bench.db'}",
+    }
+
+
+def start_app(port, upstream_port, workdir, workers=1, extra_env=None, log_path=None, app_dir=None):
+    """Start the chatbot app under uvicorn against the fake upstream
+
+    app_dir selects another checkout's backend directory (e.g. a git worktree
+    of the baseline build); it defaults to this one.
+    """
+    env = app_env(upstream_port, workdir)
+    if extra_env:
+        env.update(extra_env)
+    proc = launch(
+        [
+            "-m", "uvicorn", "app.main:app",
+            "--app-dir", str(app_dir or BACKEND_DIR),
+            "--host", "127.0.0.1",
+            "--port", str(port),
+            "--workers", str(workers),
+            "--log-level", "warning",
+        ],
+        env=env,
+        cwd=workdir,
+        log_path=log_path,
+    )
+    wait_for_http(f"http://127.0.0.1:{port}/docs", timeout=60.0)
+    return proc
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies_ms):
+    """Latency summary (milliseconds) used in every benchmark report"""
+    values = sorted(latencies_ms)
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+        "mean": round(sum(values) / len(values), 2),
+        "max": round(values[-1], 2),
+    }
+
+
+def git_revision(directory=None):
+    """Current git commit of the tree being benchmarked, if available"""
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=directory or BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
@@ -0,0 +1,304 @@
+"""
+Local stand-in for the OpenAI Responses and Files APIs.
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 to
+benchmark without spending money. Latency, streaming speed and error
+injection are configurable:
+
+    python -m benchmarks.fake_openai --port 9100 --latency-ms 300 \
+        --tokens-per-second 80 --error-rate 0.01
+
+A request can override the latency, output length and speed for itself by
+putting a directive such as [[fake latency_ms=420 output_tokens=75]] in its
+input (tokens_per_second=0 generates instantly);
+the trace replayer (benchmarks.replay) uses this to reproduce recorded
+upstream timings and response sizes.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while our helpful assistant "
+    "explains each step clearly and concisely for the user"
+).split()
+
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = 250.0          # time to first byte
+    jitter_ms: float = 50.0            # uniform +/- jitter on latency
+    slow_rate: float = 0.0             # fraction of calls that hit the slow tail
+    slow_latency_ms: float = 3000.0    # latency for slow-tail calls
+    tokens_per_second: float = 100.0   # streaming speed (and buffered generation time)
+    output_tokens: int = 120           # tokens generated per response
+    error_rate: float = 0.0            # fraction of calls that fail
+    error_status: int = 500            # status returned for injected errors
+    cached_token_ratio: float = 0.0    # reported share of input tokens served from cache
+    file_latency_ms: float = 100.0     # latency for Files API calls
+
+
+DIRECTIVE = re.compile(r"\[\[fake ([^\]]*)\]\]")
+
+# Approximate size of a generated response (see tokens_for_bytes)
+BUFFERED_BASE_BYTES = 450
+BUFFERED_BYTES_PER_TOKEN = 6
+STREAMED_BASE_BYTES = 1000
+STREAMED_BYTES_PER_TOKEN = 234
+
+
+def tokens_for_bytes(num_bytes, stream):
+    """Output tokens that make a response of roughly num_bytes"""
+    if stream:
+        return max(1, round((num_bytes - STREAMED_BASE_BYTES) / STREAMED_BYTES_PER_TOKEN))
+    return max(1, round((num_bytes - BUFFERED_BASE_BYTES) / BUFFERED_BYTES_PER_TOKEN))
+
+
+def directive(**values):
+    """Per-request override understood by the fake server, to embed in a message"""
+    return "[[fake " + " ".join(f"{key}={value}" for key, value in values.items()) + "]]"
+
+
+def _overrides(body):
+    """Values from the last [[fake ...]] directive in the request input"""
+    matches = DIRECTIVE.findall(json.dumps(body.get("input", "")))
+    if not matches:
+        return {}
+    overrides = {}
+    for part in matches[-1].split():
+        key, _, value = part.partition("=")
+        if key in ("latency_ms", "output_tokens", "tokens_per_second"):
+            try:
+                overrides[key] = float(value)
+            except ValueError:
+                pass
+    return overrides
+
+
+def _estimate_tokens(value):
+    """Roughly 4 characters per token, good enough for usage reporting"""
+    return max(1, len(json.dumps(value)) // 4)
+
+
+def _first_token_delay(config, latency_ms=None):
+    if latency_ms is not None:
+        base = latency_ms
+    elif config.slow_rate and random.random() < config.slow_rate:
+        base = config.slow_latency_ms
+    else:
+        base = config.latency_ms
+    jitter = random.uniform(-config.jitter_ms, config.jitter_ms)
+    return max(0.0, base + jitter) / 1000.0
+
+
+def _injected_error(config):
+    if config.error_rate and random.random() < config.error_rate:
+        return JSONResponse(
+            status_code=config.error_status,
+            content={"error": {"message": "Injected fake upstream error", "type": "server_error"}},
+        )
+    return None
+
+
+def _response_object(response_id, model, text, input_tokens, output_tokens, config):
+    cached = int(input_tokens * config.cached_token_ratio)
+    return {
+        "id": response_id,
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "output": [
+            {
+                "type": "message",
+                "id": f"msg_{response_id[5:]}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": cached},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+def _sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+def create_app(config: FakeConfig):
+    app = FastAPI(title="Fake OpenAI")
+    app.state.config = config
+    app.state.calls = {"responses": 0, "files_create": 0, "files_delete": 0, "errors": 0,
+                       "streams_abandoned": 0}
+
+    @app.get("/v1/models")
+    def list_models():
+        return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "fake"}]}
+
+    @app.get("/_stats")
+    def stats():
+        return app.state.calls
+
+    @app.post("/v1/responses")
+    async def create_response(request: Request):
+        body = await request.json()
+        app.state.calls["responses"] += 1
+        model = body.get("model", "gpt-4o-mini")
+        input_tokens = _estimate_tokens(body.get("input", ""))
+        overrides = _overrides(body)
+        wanted = int(overrides.get("output_tokens", config.output_tokens))
+        output_tokens = min(wanted, body.get("max_output_tokens") or wanted)
+        words = [random.choice(WORDS) for _ in range(output_tokens)]
+        response_id = f"resp_{uuid.uuid4().hex}"
+
+        await asyncio.sleep(_first_token_delay(config, overrides.get("latency_ms")))
+        error = _injected_error(config)
+        if error is not None:
+            app.state.calls["errors"] += 1
+            return error
+
+        tokens_per_second = overrides.get("tokens_per_second", config.tokens_per_second)
+        per_token = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+        if not body.get("stream"):
+            await asyncio.sleep(per_token * output_tokens)
+            text = " ".join(words)
+            return _response_object(response_id, model, text, input_tokens, output_tokens, config)
+
+        async def events():
+            seq = 0
+            created = _response_object(response_id, model, "", input_tokens, 0, config)
+            created["status"] = "in_progress"
+            created["output"] = []
+            yield _sse({"type": "response.created", "sequence_number": seq, "response": created})
+            item_id = f"msg_{response_id[5:]}"
+            try:
+                for i, word in enumerate(words):
+                    seq += 1
+                    yield _sse({
+                        "type": "response.output_text.delta",
+                        "sequence_number": seq,
+                        "item_id": item_id,
+                        "output_index": 0,
+                        "content_index": 0,
+                        "delta": word if i == 0 else f" {word}",
+                        "logprobs": [],
+                    })
+                    if per_token:
+                        await asyncio.sleep(per_token)
+            except (GeneratorExit, asyncio.CancelledError):
+                # The client closed the stream before the reply was complete
+                app.state.calls["streams_abandoned"] += 1
+                raise
+            seq += 1
+            done = _response_object(response_id, model, " ".join(words), input_tokens, output_tokens, config)
+            yield _sse({"type": "response.completed", "sequence_number": seq, "response": done})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/files")
+    async def create_file(request: Request):
+        form = await request.form()
+        upload = form.get("file")
+        data = await upload.read() if upload is not None else b""
+        app.state.calls["files_create"] += 1
+        await asyncio.sleep(config.file_latency_ms / 1000.0)
+        error = _injected_error(config)
+        if error is not None:
+            app.state.calls["errors"] += 1
+            return error
+        return {
+            "id": f"file-{uuid.uuid4().hex[:24]}",
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": getattr(upload, "filename", None) or "upload",
+            "purpose": form.get("purpose", "assistants"),
+            "status": "processed",
+        }
+
+    @app.delete("/v1/files/{file_id}")
+    async def delete_file(file_id: str):
+        app.state.calls["files_delete"] += 1
+        await asyncio.sleep(config.file_latency_ms / 1000.0)
+        error = _injected_error(config)
+        if error is not None:
+            app.state.calls["errors"] += 1
+            return error
+        return {"id": file_id, "object": "file", "deleted": True}
+
+    return app
+
+
+def add_config_arguments(parser):
+    """Register FakeConfig options on an argparse parser"""
+    defaults = FakeConfig()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms)
+    parser.add_argument("--slow-rate", type=float, default=defaults.slow_rate)
+    parser.add_argument("--slow-latency-ms", type=float, default=defaults.slow_latency_ms)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--output-tokens", type=int, default=defaults.output_tokens)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--error-status", type=int, default=defaults.error_status)
+    parser.add_argument("--cached-token-ratio", type=float, default=defaults.cached_token_ratio)
+    parser.add_argument("--file-latency-ms", type=float, default=defaults.file_latency_ms)
+
+
+def config_from_args(args):
+    return FakeConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        slow_rate=args.slow_rate,
+        slow_latency_ms=args.slow_latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        cached_token_ratio=args.cached_token_ratio,
+        file_latency_ms=args.file_latency_ms,
+    )
+
+
+def config_to_args(config: FakeConfig):
+    """Inverse of config_from_args, for launching the server as a subprocess"""
+    return [
+        "--latency-ms", str(config.latency_ms),
+        "--jitter-ms", str(config.jitter_ms),
+        "--slow-rate", str(config.slow_rate),
+        "--slow-latency-ms", str(config.slow_latency_ms),
+        "--tokens-per-second", str(config.tokens_per_second),
+        "--output-tokens", str(config.output_tokens),
+        "--error-rate", str(config.error_rate),
+        "--error-status", str(config.error_status),
+        "--cached-token-ratio", str(config.cached_token_ratio),
+        "--file-latency-ms", str(config.file_latency_ms),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI Responses/Files API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
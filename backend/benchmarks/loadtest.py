@@ -0,0 +1,258 @@
+"""
+Load-test the app against the local fake OpenAI server.
+
+Starts benchmarks.fake_openai and the app (uvicorn) in subprocesses with a
+throwaway SQLite database, seeds users/projects/prompts, then drives a
+weighted mix of /users/login, /chat, list endpoints and uploads at each
+concurrency level. Results are printed (and optionally written) as JSON:
+
+    python -m benchmarks.loadtest --concurrency 1,8,32 --duration 20 \
+        --latency-ms 300 --output results-$(git rev-parse --short HEAD).json
+
+Use --app-url to target an already running app instead; it must be
+configured with OPENAI_BASE_URL pointing at a fake upstream.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from . import common
+from .fake_openai import add_config_arguments, config_from_args, config_to_args
+
+# Relative weights of each operation in the default traffic mix
+DEFAULT_MIX = {
+    "login": 5,
+    "chat": 40,
+    "list_projects": 20,
+    "list_prompts": 15,
+    "list_files": 15,
+    "upload": 5,
+}
+
+PASSWORD = "Benchmark123"
+
+
+def parse_mix(value):
+    """Parse 'chat=50,list_projects=30' into a weight dict"""
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class VirtualUser:
+    """One seeded account with its token and project ids"""
+
+    def __init__(self, email, token, project_ids):
+        self.email = email
+        self.token = token
+        self.project_ids = project_ids
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+async def seed(client, users, projects_per_user, prompts_per_project):
+    """Register and log in benchmark users, each with projects and prompts"""
+    run_id = f"{int(time.time())}{random.randint(0, 9999):04d}"
+    seeded = []
+    for i in range(users):
+        email = f"bench{run_id}-{i}@example.com"
+        r = await client.post("/users/register", json={"email": email, "password": PASSWORD})
+        r.raise_for_status()
+        r = await client.post("/users/login", json={"email": email, "password": PASSWORD})
+        r.raise_for_status()
+        token = r.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        project_ids = []
+        for p in range(projects_per_user):
+            r = await client.post("/projects/", json={"name": f"Bench project {p}"}, headers=headers)
+            r.raise_for_status()
+            project_id = r.json()["id"]
+            project_ids.append(project_id)
+            for n in range(prompts_per_project):
+                r = await client.post(
+                    f"/projects/{project_id}/prompts",
+                    json={"name": f"Prompt {n}", "content": "You are a concise support assistant. " * 20},
+                    headers=headers,
+                )
+                r.raise_for_status()
+        seeded.append(VirtualUser(email, token, project_ids))
+    return seeded
+
+
+async def run_operation(client, op, vuser, upload_bytes):
+    """Issue one request of the given kind; returns the HTTP status"""
+    project_id = random.choice(vuser.project_ids)
+    if op == "login":
+        r = await client.post("/users/login", json={"email": vuser.email, "password": PASSWORD})
+    elif op == "chat":
+        r = await client.post(
+            "/chat",
+            json={"project_id": project_id, "message": "How do I reset my password?"},
+            headers=vuser.headers,
+        )
+    elif op == "list_projects":
+        r = await client.get("/projects/", headers=vuser.headers)
+    elif op == "list_prompts":
+        r = await client.get(f"/projects/{project_id}/prompts", headers=vuser.headers)
+    elif op == "list_files":
+        r = await client.get(f"/projects/{project_id}/files", headers=vuser.headers)
+    elif op == "upload":
+        r = await client.post(
+            f"/projects/{project_id}/files",
+            files={"file": ("bench.txt", os.urandom(upload_bytes), "text/plain")},
+            headers=vuser.headers,
+        )
+    else:
+        raise ValueError(op)
+    await r.aread()
+    return r.status_code
+
+
+async def run_level(client, vusers, mix, concurrency, duration, warmup, upload_bytes):
+    """Run the mix at a fixed concurrency and return the level report"""
+    ops = list(mix)
+    weights = [mix[o] for o in ops]
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    statuses = defaultdict(int)
+    measure_from = time.perf_counter() + warmup
+    stop_at = measure_from + duration
+
+    async def worker(index):
+        vuser = vusers[index % len(vusers)]
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                return
+            op = random.choices(ops, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = await run_operation(client, op, vuser, upload_bytes)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            if start < measure_from:
+                continue
+            samples[op].append(elapsed_ms)
+            statuses[str(status)] += 1
+            if not isinstance(status, int) or status >= 400:
+                errors[op] += 1
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+    all_latencies = [v for values in samples.values() for v in values]
+    total = len(all_latencies)
+    return {
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "requests": total,
+        "errors": sum(errors.values()),
+        "throughput_rps": round(total / duration, 2) if duration else 0.0,
+        "latency_ms": common.summarize(all_latencies),
+        "status_codes": dict(statuses),
+        "endpoints": {
+            op: {
+                "requests": len(values),
+                "errors": errors[op],
+                "throughput_rps": round(len(values) / duration, 2) if duration else 0.0,
+                "latency_ms": common.summarize(values),
+            }
+            for op, values in sorted(samples.items())
+        },
+    }
+
+
+async def run_benchmark(app_url, args, mix, levels):
+    max_conn = max(levels) * 2
+    limits = httpx.Limits(max_connections=max_conn, max_keepalive_connections=max_conn)
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+        vusers = await seed(client, args.users, args.projects_per_user, args.prompts_per_project)
+        results = []
+        for concurrency in levels:
+            print(f"Running concurrency={concurrency} for {args.duration}s...", file=sys.stderr)
+            results.append(await run_level(
+                client, vusers, mix, concurrency, args.duration, args.warmup, args.upload_bytes
+            ))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chatbot app against a fake OpenAI upstream")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=15.0, help="Measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds before each level")
+    parser.add_argument("--mix", default="", help="Weights, e.g. chat=50,list_projects=30,login=20")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--projects-per-user", type=int, default=3)
+    parser.add_argument("--prompts-per-project", type=int, default=3)
+    parser.add_argument("--upload-bytes", type=int, default=16 * 1024)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--app-url", default=None, help="Benchmark an already running app")
+    parser.add_argument("--label", default=None, help="Free-form build label stored in the report")
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    fake_config = config_from_args(args)
+
+    upstream = app = None
+    workdir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    try:
+        if args.app_url:
+            app_url = args.app_url.rstrip("/")
+        else:
+            upstream_port = common.free_port()
+            app_port = common.free_port()
+            upstream = common.start_fake_upstream(
+                upstream_port, config_to_args(fake_config), log_path=os.path.join(workdir, "upstream.log")
+            )
+            app = common.start_app(
+                app_port, upstream_port, workdir, workers=args.workers,
+                log_path=os.path.join(workdir, "app-stdout.log"),
+            )
+            app_url = f"http://127.0.0.1:{app_port}"
+
+        levels_report = asyncio.run(run_benchmark(app_url, args, mix, levels))
+    finally:
+        common.stop(app)
+        common.stop(upstream)
+
+    report = {
+        "benchmark": "loadtest",
+        "label": args.label,
+        "git_revision": common.git_revision(),
+        "timestamp": int(time.time()),
+        "workers": args.workers,
+        "mix": mix,
+        "upstream": vars(fake_config),
+        "levels": levels_report,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+"""
+Replay a recorded traffic trace (see app/traffic_recorder.py) against the
+local fake OpenAI server, and compare the results of two builds.
+
+    python -m benchmarks.replay run traffic.jsonl --speed 2 --output new.json
+    python -m benchmarks.replay run traffic.jsonl --app-dir ../base/backend --output base.json
+    python -m benchmarks.replay compare base.json new.json --fail-above-pct 10
+
+`run` starts the fake server and the app (or targets --app-url), recreates
+one account per recorded user with its projects, sized so list responses
+match the recorded sizes, then sends the recorded requests in order:
+
+- at the recorded pace divided by --speed (--speed 0: back to back, with
+  --concurrency requests in flight);
+- chat messages are synthetic text of the recorded length; repeated
+  messages (same hash) repeat the same text, and chained turns chain onto
+  the previous reply in the same project;
+- unless --synthetic-upstream is given, each chat tells the fake server the
+  recorded upstream latency and response size, so upstream behaviour
+  matches the recording and only the app's own time differs between builds.
+
+The order of requests and their upstream timings are fixed by the trace,
+so two runs differ only in the build under test. `compare` prints per
+operation latency deltas and can fail CI on a regression.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from . import common
+from .fake_openai import (
+    WORDS, add_config_arguments, config_from_args, config_to_args, directive, tokens_for_bytes,
+)
+
+OPS = ("chat", "list_projects", "list_prompts", "list_files", "dashboard_summary")
+PASSWORD = "Replay12345"
+PROMPT_CONTENT = "You are a concise support assistant. " * 10
+FILE_BYTES = 1024
+STATS = ("p50", "p95", "p99", "mean")
+
+
+def load_trace(paths, ops, include_errors, limit):
+    """Trace records from one or more files, in arrival order"""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a worker that was killed mid-write
+                    continue
+                if record.get("op") not in ops or record.get("user") is None:
+                    continue
+                if not include_errors and (record.get("status") or 500) >= 400:
+                    continue
+                records.append(record)
+    records.sort(key=lambda r: r["ts"])
+    return records[:limit] if limit else records
+
+
+def synthetic_message(record, prefix=""):
+    """Stand-in text of the recorded length; the same hash gives the same text"""
+    length = record.get("msg_chars") or 16
+    rng = random.Random(record.get("msg_hash") or length)
+    text = prefix
+    while len(text) < length:
+        text += (" " if text else "") + rng.choice(WORDS)
+    return text[:max(length, len(prefix))]
+
+
+def upstream_directive(record, tokens_per_second):
+    """[[fake ...]] directive reproducing the recorded upstream call, if any"""
+    calls = [c for c in record.get("upstream") or [] if c.get("status") == 200 and c.get("ms") is not None]
+    if not calls:
+        return ""
+    call = calls[-1]
+    output_tokens = tokens_for_bytes(call["bytes"], call["stream"])
+    generation_ms = output_tokens / tokens_per_second * 1000 if tokens_per_second > 0 else 0.0
+    if generation_ms > call["ms"]:
+        # The recorded call was faster than the fake generates: speed up
+        # generation so the call takes as long as it did (0 = instant)
+        tokens_per_second = round(output_tokens / (call["ms"] / 1000), 1) if call["ms"] > 0 else 0
+        generation_ms = call["ms"]
+    return directive(
+        latency_ms=round(call["ms"] - generation_ms, 1),
+        output_tokens=output_tokens,
+        tokens_per_second=tokens_per_second,
+    ) + " "
+
+
+class ReplayUser:
+    def __init__(self, email, token):
+        self.email = email
+        self.token = token
+        # recorded project hash -> project id in this run
+        self.projects = {}
+        self.default_project = None
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+def plan_seed(records):
+    """{user: {project: {"list_prompts": max bytes, "list_files": max bytes}}}"""
+    plan = defaultdict(dict)
+    for record in records:
+        projects = plan[record["user"]]
+        if record.get("project") is None:
+            continue
+        sizes = projects.setdefault(record["project"], {"list_prompts": 0, "list_files": 0})
+        if record["op"] in sizes:
+            sizes[record["op"]] = max(sizes[record["op"]], record.get("resp_bytes") or 0)
+    return plan
+
+
+async def register(client, email):
+    r = await client.post("/users/register", json={"email": email, "password": PASSWORD})
+    r.raise_for_status()
+    r = await client.post("/users/login", json={"email": email, "password": PASSWORD})
+    r.raise_for_status()
+    return ReplayUser(email, r.json()["access_token"])
+
+
+async def add_prompt(client, user, project_id, n):
+    r = await client.post(
+        f"/projects/{project_id}/prompts",
+        json={"name": f"Prompt {n}", "content": PROMPT_CONTENT},
+        headers=user.headers,
+    )
+    r.raise_for_status()
+
+
+async def add_file(client, user, project_id, n):
+    r = await client.post(
+        f"/projects/{project_id}/files",
+        files={"file": (f"replay-{n}.txt", os.urandom(FILE_BYTES), "text/plain")},
+        headers=user.headers,
+    )
+    r.raise_for_status()
+
+
+async def calibrate(client, run_id):
+    """Bytes per item in the prompt and file lists, measured on a scratch project"""
+    user = await register(client, f"replay{run_id}-calibration@example.com")
+    r = await client.post("/projects/", json={"name": "Calibration"}, headers=user.headers)
+    r.raise_for_status()
+    project_id = r.json()["id"]
+    await add_prompt(client, user, project_id, 0)
+    await add_file(client, user, project_id, 0)
+    prompts = await client.get(f"/projects/{project_id}/prompts", headers=user.headers)
+    files = await client.get(f"/projects/{project_id}/files", headers=user.headers)
+    # "[...]" around a single item
+    return {"list_prompts": len(prompts.content) - 2, "list_files": len(files.content) - 2}
+
+
+async def seed(client, plan, max_items, concurrency=8):
+    """Create an account per recorded user with its projects, prompts and files"""
+    run_id = f"{int(time.time())}{random.randint(0, 9999):04d}"
+    item_bytes = await calibrate(client, run_id)
+    semaphore = asyncio.Semaphore(concurrency)
+    users = {}
+
+    async def seed_user(index, user_hash, projects):
+        async with semaphore:
+            user = await register(client, f"replay{run_id}-{index}@example.com")
+            for p, (project_hash, sizes) in enumerate(projects.items()):
+                r = await client.post("/projects/", json={"name": f"Replay project {p}"}, headers=user.headers)
+                r.raise_for_status()
+                project_id = r.json()["id"]
+                user.projects[project_hash] = project_id
+                prompts = min(max_items, math.ceil(sizes["list_prompts"] / max(1, item_bytes["list_prompts"])))
+                files = min(max_items, math.ceil(sizes["list_files"] / max(1, item_bytes["list_files"])))
+                for n in range(prompts):
+                    await add_prompt(client, user, project_id, n)
+                for n in range(files):
+                    await add_file(client, user, project_id, n)
+            if not user.projects:
+                r = await client.post("/projects/", json={"name": "Replay project"}, headers=user.headers)
+                r.raise_for_status()
+                user.default_project = r.json()["id"]
+            users[user_hash] = user
+
+    await asyncio.gather(*(
+        seed_user(i, user_hash, projects) for i, (user_hash, projects) in enumerate(plan.items())
+    ))
+    return users
+
+
+class Replayer:
+    def __init__(self, client, users, tokens_per_second, synthetic_upstream):
+        self.client = client
+        self.users = users
+        self.tokens_per_second = tokens_per_second
+        self.synthetic_upstream = synthetic_upstream
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(int)
+        self.lag_ms = []
+        # (user, project) -> last response id, for chained turns
+        self.last_response = {}
+
+    def project_id(self, user, record):
+        return user.projects.get(record.get("project")) or user.default_project or next(iter(user.projects.values()))
+
+    async def send(self, record):
+        user = self.users[record["user"]]
+        op = record["op"]
+        if op == "chat":
+            project_id = self.project_id(user, record)
+            prefix = "" if self.synthetic_upstream else upstream_directive(record, self.tokens_per_second)
+            payload = {"project_id": project_id, "message": synthetic_message(record, prefix)}
+            chain_key = (record["user"], record.get("project"))
+            if record.get("chained") and chain_key in self.last_response:
+                payload["previous_response_id"] = self.last_response[chain_key]
+            r = await self.client.post("/chat", json=payload, headers=user.headers)
+            await r.aread()
+            if r.status_code == 200:
+                self.last_response[chain_key] = r.json().get("response_id")
+            return r.status_code
+        if op == "list_projects":
+            url = "/projects/"
+        elif op == "dashboard_summary":
+            url = "/dashboard/summary"
+        else:
+            url = f"/projects/{self.project_id(user, record)}/{op.split('_', 1)[1]}"
+        r = await self.client.get(url, params=record.get("query"), headers=user.headers)
+        await r.aread()
+        return r.status_code
+
+    async def issue(self, record, scheduled_at=None):
+        start = time.perf_counter()
+        if scheduled_at is not None:
+            self.lag_ms.append(max(0.0, (start - scheduled_at) * 1000.0))
+        try:
+            status = await self.send(record)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        op = record["op"]
+        self.samples[op].append((time.perf_counter() - start) * 1000.0)
+        self.statuses[str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[op] += 1
+
+    async def run(self, records, speed, concurrency):
+        if speed <= 0:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def limited(record):
+                async with semaphore:
+                    await self.issue(record)
+
+            await asyncio.gather(*(limited(r) for r in records))
+            return
+        t0 = records[0]["ts"]
+        start = time.perf_counter()
+        tasks = []
+        for record in records:
+            scheduled_at = start + (record["ts"] - t0) / speed
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.issue(record, scheduled_at)))
+        await asyncio.gather(*tasks)
+
+
+def recorded_summary(records):
+    by_op = defaultdict(list)
+    for record in records:
+        by_op[record["op"]].append(record["ms"])
+    return {op: {"requests": len(v), "latency_ms": common.summarize(v)} for op, v in sorted(by_op.items())}
+
+
+async def replay(app_url, records, args, fake_config):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=64)
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+        print(f"Seeding {len({r['user'] for r in records})} users...", file=sys.stderr)
+        users = await seed(client, plan_seed(records), args.max_seed_items)
+        replayer = Replayer(client, users, fake_config.tokens_per_second, args.synthetic_upstream)
+        print(f"Replaying {len(records)} requests at speed {args.speed}...", file=sys.stderr)
+        started = time.perf_counter()
+        await replayer.run(records, args.speed, args.concurrency)
+        elapsed = time.perf_counter() - started
+
+    all_latencies = [v for values in replayer.samples.values() for v in values]
+    return {
+        "duration_s": round(elapsed, 2),
+        "requests": len(all_latencies),
+        "errors": sum(replayer.errors.values()),
+        "throughput_rps": round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": common.summarize(all_latencies),
+        "schedule_lag_ms": common.summarize(replayer.lag_ms),
+        "status_codes": dict(replayer.statuses),
+        "endpoints": {
+            op: {
+                "requests": len(values),
+                "errors": replayer.errors[op],
+                "latency_ms": common.summarize(values),
+            }
+            for op, values in sorted(replayer.samples.items())
+        },
+    }
+
+
+def run_command(args):
+    ops = set(args.ops.split(",")) if args.ops else set(OPS)
+    unknown = ops - set(OPS)
+    if unknown:
+        raise SystemExit(f"Unknown operation in --ops: {', '.join(sorted(unknown))}")
+    records = load_trace(args.trace, ops, args.include_errors, args.limit)
+    if not records:
+        raise SystemExit("No replayable records in the trace")
+    fake_config = config_from_args(args)
+
+    upstream = app = None
+    workdir = tempfile.mkdtemp(prefix="chatbot-replay-")
+    try:
+        if args.app_url:
+            app_url = args.app_url.rstrip("/")
+        else:
+            upstream_port = common.free_port()
+            app_port = common.free_port()
+            upstream = common.start_fake_upstream(
+                upstream_port, config_to_args(fake_config), log_path=os.path.join(workdir, "upstream.log")
+            )
+            app = common.start_app(
+                app_port, upstream_port, workdir, workers=args.workers,
+                log_path=os.path.join(workdir, "app-stdout.log"), app_dir=args.app_dir,
+            )
+            app_url = f"http://127.0.0.1:{app_port}"
+
+        result = asyncio.run(replay(app_url, records, args, fake_config))
+    finally:
+        common.stop(app)
+        common.stop(upstream)
+
+    report = {
+        "benchmark": "replay",
+        "label": args.label,
+        "git_revision": common.git_revision(args.app_dir),
+        "timestamp": int(time.time()),
+        "trace": {
+            "files": args.trace,
+            "records": len(records),
+            "recorded_duration_s": round(records[-1]["ts"] - records[0]["ts"], 2),
+        },
+        "speed": args.speed,
+        "workers": args.workers,
+        "synthetic_upstream": args.synthetic_upstream,
+        "upstream": vars(fake_config),
+        "recorded": recorded_summary(records),
+        "replay": result,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+def compare_reports(base, new, fail_above_pct, min_delta_ms):
+    """Per operation latency deltas (new - base); regressions are judged on p95"""
+    rows = {}
+    regressions = []
+    sections = {"overall": (base["replay"], new["replay"])}
+    for op in sorted(set(base["replay"]["endpoints"]) & set(new["replay"]["endpoints"])):
+        sections[op] = (base["replay"]["endpoints"][op], new["replay"]["endpoints"][op])
+    for name, (b, n) in sections.items():
+        row = {}
+        for stat in STATS:
+            before, after = b["latency_ms"][stat], n["latency_ms"][stat]
+            delta = after - before
+            row[stat] = {
+                "base": before,
+                "new": after,
+                "delta_ms": round(delta, 2),
+                "delta_pct": round(delta / before * 100, 1) if before else None,
+            }
+        row["errors"] = {"base": b["errors"], "new": n["errors"]}
+        p95 = row["p95"]
+        if (fail_above_pct is not None and p95["delta_pct"] is not None
+                and p95["delta_pct"] > fail_above_pct and p95["delta_ms"] > min_delta_ms):
+            regressions.append(name)
+        rows[name] = row
+    return {
+        "base": {"label": base.get("label"), "git_revision": base.get("git_revision")},
+        "new": {"label": new.get("label"), "git_revision": new.get("git_revision")},
+        "operations": rows,
+        "regressions": regressions,
+    }
+
+
+def print_table(comparison):
+    print(f"{'operation':<20}" + "".join(f"{stat + ' (ms)':>26}" for stat in STATS), file=sys.stderr)
+    for name, row in comparison["operations"].items():
+        cells = []
+        for stat in STATS:
+            cell = row[stat]
+            pct = f"{cell['delta_pct']:+.1f}%" if cell["delta_pct"] is not None else "n/a"
+            cells.append(f"{cell['base']:>8.1f} -> {cell['new']:>8.1f} {pct:>7}")
+        print(f"{name:<20}" + "".join(f"{c:>26}" for c in cells), file=sys.stderr)
+
+
+def compare_command(args):
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    if base.get("trace", {}).get("records") != new.get("trace", {}).get("records"):
+        print("Warning: the reports replayed different traces", file=sys.stderr)
+    comparison = compare_reports(base, new, args.fail_above_pct, args.min_delta_ms)
+    print_table(comparison)
+    print(json.dumps(comparison, indent=2))
+    if comparison["regressions"]:
+        print(f"p95 regressions: {', '.join(comparison['regressions'])}", file=sys.stderr)
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic and compare builds")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Replay a trace against the fake upstream")
+    run.add_argument("trace", nargs="+", help="Trace file(s) written by the traffic recorder")
+    run.add_argument("--speed", type=float, default=1.0, help="Pace multiplier; 0 replays back to back")
+    run.add_argument("--concurrency", type=int, default=16, help="In-flight requests with --speed 0")
+    run.add_argument("--ops", default="", help=f"Comma separated subset of {','.join(OPS)}")
+    run.add_argument("--limit", type=int, default=0, help="Replay only the first N records")
+    run.add_argument("--include-errors", action="store_true", help="Also replay requests that failed")
+    run.add_argument("--synthetic-upstream", action="store_true",
+                     help="Use the fake server's settings instead of the recorded upstream timings")
+    run.add_argument("--max-seed-items", type=int, default=50, help="Cap on prompts/files seeded per project")
+    run.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    run.add_argument("--timeout", type=float, default=60.0)
+    run.add_argument("--app-url", default=None, help="Replay against an already running app")
+    run.add_argument("--app-dir", default=None, help="backend directory of the build to run (default: this one)")
+    run.add_argument("--label", default=None, help="Free-form build label stored in the report")
+    run.add_argument("--output", default=None, help="Also write the JSON report to this file")
+    add_config_arguments(run)
+    # Recorded latencies already vary; extra jitter would only add noise
+    run.set_defaults(jitter_ms=0.0, func=run_command)
+
+    compare = commands.add_parser("compare", help="Latency deltas between two replay reports")
+    compare.add_argument("base", help="Report of the baseline build")
+    compare.add_argument("new", help="Report of the build under test")
+    compare.add_argument("--fail-above-pct", type=float, default=None,
+                         help="Exit non-zero when an operation's p95 grew by more than this")
+    compare.add_argument("--min-delta-ms", type=float, default=5.0,
+                         help="Ignore p95 growth smaller than this (noise floor)")
+    compare.set_defaults(func=compare_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
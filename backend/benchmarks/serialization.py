@@ -0,0 +1,106 @@
+"""
+Micro-benchmark of response serialization for prompt lists.
+
+Encodes the same prompt rows two ways and reports the cost per 1,000
+prompts for each prompt size:
+
+- default: what FastAPI does for `response_model=list[PromptResponse]`
+  returning ORM rows (validate, dump to Python objects, then JSONResponse
+  encodes them again with json.dumps), using the real list_prompts route's
+  response field;
+- fast: app.serialization.encode (validate and dump straight to JSON).
+
+    python -m benchmarks.serialization --rows 1000 --content-chars 200,2000,20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from . import common
+
+
+def build_rows(count, content_chars):
+    from app.models import Prompt
+
+    content = ("You are a concise support assistant. " * (content_chars // 37 + 1))[:content_chars]
+    return [
+        Prompt(id=i, project_id=1, name=f"Prompt {i}", content=content, priority=i % 5)
+        for i in range(count)
+    ]
+
+
+def time_per_run(fn, runs):
+    fn()  # warm up caches (adapters, schema)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON encode cost per 1k prompts")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--content-chars", default="200,2000,20000", help="Comma separated prompt sizes")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="chatbot-serialization-")
+    # Importing the app needs its settings; nothing is served
+    os.environ.update(common.app_env(upstream_port=9, workdir=workdir))
+    sys.path.insert(0, str(common.BACKEND_DIR))
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+
+    from app.main import app
+    from app.schemas import PromptResponse
+    from app.serialization import encode
+
+    route = next(r for r in app.routes if getattr(r, "name", None) == "list_prompts")
+
+    def default_path(rows):
+        content = asyncio.run(serialize_response(field=route.response_field, response_content=rows))
+        return JSONResponse(content).body
+
+    results = []
+    for chars in [int(c) for c in args.content_chars.split(",") if c.strip()]:
+        rows = build_rows(args.rows, chars)
+        if json.loads(default_path(rows)) != json.loads(encode(PromptResponse, rows, many=True)):
+            raise SystemExit("The two paths produced different JSON")
+        scale = 1000.0 / args.rows
+        default_ms = time_per_run(lambda: default_path(rows), args.runs) * scale
+        fast_ms = time_per_run(lambda: encode(PromptResponse, rows, many=True), args.runs) * scale
+        results.append({
+            "content_chars": chars,
+            "body_bytes_per_1k": round(len(encode(PromptResponse, rows, many=True)) * scale),
+            "default_ms_per_1k": round(default_ms, 3),
+            "fast_ms_per_1k": round(fast_ms, 3),
+            "speedup": round(default_ms / fast_ms, 2) if fast_ms else None,
+        })
+        print(f"{chars:>7} chars: default {default_ms:8.2f} ms, fast {fast_ms:8.2f} ms per 1k prompts",
+              file=sys.stderr)
+
+    report = {
+        "benchmark": "serialization",
+        "git_revision": common.git_revision(),
+        "timestamp": int(time.time()),
+        "rows": args.rows,
+        "runs": args.runs,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Cold-start benchmark.
+
+Measures, in fresh interpreters, how long it takes to import app.main (what
+every uvicorn worker and every test process pays) and to run the app's
+startup (lifespan) on top of that. Reports JSON; with --budget-ms it exits
+non-zero when the median import time exceeds the budget, so it can gate CI:
+
+    python -m benchmarks.startup --runs 10 --budget-ms 1500 --top 15
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from . import common
+
+MEASURE_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app.main.app):
+    t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "startup_ms": (t2 - t1) * 1000}))
+"""
+
+
+def bench_env(workdir):
+    # The upstream is never called during startup; the port is unused
+    env = os.environ.copy()
+    env.update(common.app_env(upstream_port=9, workdir=workdir))
+    env["PYTHONPATH"] = str(common.BACKEND_DIR)
+    return env
+
+
+def measure_once(workdir):
+    out = subprocess.run(
+        [sys.executable, "-c", MEASURE_SNIPPET],
+        env=bench_env(workdir),
+        cwd=workdir,
+        capture_output=True,
+        text=True,
+    )
+    if out.returncode != 0:
+        raise RuntimeError(f"Startup measurement failed:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(workdir, top):
+    """Top-N modules by cumulative import time, from python -X importtime"""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=bench_env(workdir),
+        cwd=workdir,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if m:
+            rows.append((int(m.group(2)), m.group(4).strip()))
+    rows.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in rows[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import and startup time of the app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="Also list the N slowest imports")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if median import time exceeds this")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="chatbot-startup-")
+    samples = [measure_once(workdir) for _ in range(args.runs)]
+    import_ms = [s["import_ms"] for s in samples]
+    startup_ms = [s["startup_ms"] for s in samples]
+    total_ms = [s["import_ms"] + s["startup_ms"] for s in samples]
+
+    report = {
+        "benchmark": "startup",
+        "git_revision": common.git_revision(),
+        "timestamp": int(time.time()),
+        "runs": args.runs,
+        "import_ms": common.summarize(import_ms),
+        "startup_ms": common.summarize(startup_ms),
+        "total_ms": common.summarize(total_ms),
+    }
+    if args.top:
+        report["slowest_imports"] = slowest_imports(workdir, args.top)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+
+    if args.budget_ms is not None and report["import_ms"]["p50"] > args.budget_ms:
+        print(f"Median import time {report['import_ms']['p50']}ms exceeds budget {args.budget_ms}ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
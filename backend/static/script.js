@@ -90,31 +90,61 @@ async function createProject() {
     body: JSON.stringify({ name })
   });
 
-  loadProjects();
+  loadDashboard();
 }
 
 // ---------------- LOAD PROJECTS ----------------
-async function loadProjects() {
-  const res = await fetch("/projects", {
-    headers: {
-      "Authorization": "Bearer " + token
-    }
+function fillProjectSelect(select, projects, onchange) {
+  select.innerHTML = "<option value=''>Select a project</option>";
+
+  projects.forEach(p => {
+    const option = document.createElement("option");
+    option.value = p.id;
+    option.textContent = p.name;
+    select.appendChild(option);
   });
 
-  const projects = await res.json();
+  select.onchange = onchange;
+}
+
+// One /dashboard/summary call (per 100 projects) fills the project list and
+// both project pickers
+async function loadDashboard() {
+  const projects = [];
+  let total = 0;
+
+  try {
+    do {
+      const res = await fetch(`/dashboard/summary?limit=100&offset=${projects.length}`, {
+        headers: { "Authorization": "Bearer " + token }
+      });
+
+      if (!res.ok) {
+        window.location.href = "/";
+        return;
+      }
+
+      const page = await res.json();
+      total = page.total;
+      projects.push(...page.projects);
+      if (page.projects.length === 0) break;
+    } while (projects.length < total);
+  } catch (error) {
+    console.error("Error loading dashboard:", error);
+    return;
+  }
+
   const list = document.getElementById("projectList");
   list.innerHTML = "";
 
   projects.forEach(p => {
     const li = document.createElement("li");
-    li.innerText = p.name;
+    li.innerText = `${p.name} (${p.prompt_count} prompts, ${p.file_count} files)`;
     list.appendChild(li);
   });
-}
 
-// Auto load dashboard
-if (window.location.pathname === "/dashboard") {
-  loadProjects();
+  fillProjectSelect(document.getElementById("promptProjectSelect"), projects, loadPrompts);
+  fillProjectSelect(document.getElementById("fileProjectSelect"), projects, loadFiles);
 }
 
 // ---------------- CHAT ----------------
@@ -208,30 +238,6 @@ async function sendMessage() {
 }
 
 // ---------------- PROMPTS ----------------
-async function loadProjectsForPrompts() {
-  const select = document.getElementById("promptProjectSelect");
-  
-  try {
-    const res = await fetch("/projects", {
-      headers: { "Authorization": "Bearer " + token }
-    });
-
-    const projects = await res.json();
-    select.innerHTML = "<option value=''>Select a project</option>";
-
-    projects.forEach(p => {
-      const option = document.createElement("option");
-      option.value = p.id;
-      option.textContent = p.name;
-      select.appendChild(option);
-    });
-
-    select.onchange = loadPrompts;
-  } catch (error) {
-    console.error("Error loading projects:", error);
-  }
-}
-
 async function loadPrompts() {
   const projectId = document.getElementById("promptProjectSelect").value;
   const promptsDiv = document.getElementById("promptsList");
@@ -324,30 +330,6 @@ async function deletePrompt(promptId) {
 }
 
 // ---------------- FILES ----------------
-async function loadProjectsForFiles() {
-  const select = document.getElementById("fileProjectSelect");
-  
-  try {
-    const res = await fetch("/projects", {
-      headers: { "Authorization": "Bearer " + token }
-    });
-
-    const projects = await res.json();
-    select.innerHTML = "<option value=''>Select a project</option>";
-
-    projects.forEach(p => {
-      const option = document.createElement("option");
-      option.value = p.id;
-      option.textContent = p.name;
-      select.appendChild(option);
-    });
-
-    select.onchange = loadFiles;
-  } catch (error) {
-    console.error("Error loading projects:", error);
-  }
-}
-
 async function loadFiles() {
   const projectId = document.getElementById("fileProjectSelect").value;
   const filesDiv = document.getElementById("filesList");
@@ -377,6 +359,7 @@ async function loadFiles() {
       div.style.margin = "5px 0";
       div.innerHTML = `
         <strong>${f.filename}</strong> (${(f.file_size / 1024).toFixed(2)} KB)
+        ${fileStatusLabel(f)}
         <button onclick="deleteFile(${f.id})">Delete</button>
       `;
       filesDiv.appendChild(div);
@@ -386,6 +369,28 @@ async function loadFiles() {
   }
 }
 
+function fileStatusLabel(f) {
+  if (!f.status) return "";
+  if (f.status === "ready") return `<em>ready, ${f.chunk_count} chunks</em>`;
+  return `<em>${f.status}</em>`;
+}
+
+// Refresh the list once background text extraction of a new file is done
+async function watchFileStatus(fileId) {
+  for (let i = 0; i < 60; i++) {
+    await new Promise(resolve => setTimeout(resolve, 2000));
+    const res = await fetch(`/projects/files/${fileId}/status`, {
+      headers: { "Authorization": "Bearer " + token }
+    });
+    if (!res.ok) return;
+    const data = await res.json();
+    if (data.status !== "pending" && data.status !== "processing") {
+      loadFiles();
+      return;
+    }
+  }
+}
+
 async function uploadFile() {
   const projectId = document.getElementById("fileProjectSelect").value;
   const fileInput = document.getElementById("fileInput");
@@ -413,8 +418,10 @@ async function uploadFile() {
     });
 
     if (res.ok) {
+      const uploaded = await res.json();
       fileInput.value = "";
       loadFiles();
+      watchFileStatus(uploaded.id);
       alert("File uploaded successfully");
     } else {
       const data = await res.json();
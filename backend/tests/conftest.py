@@ -0,0 +1,5 @@
+import os
+
+# app.auth needs a key at import; the unit tests never touch a real database
+os.environ.setdefault("SECRET_KEY", "unit-test-secret-key-unit-test-secret-key")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,73 @@
+import pytest
+
+from app import context_budget
+from app.config import get_settings
+from app.context_budget import MESSAGE_OVERHEAD_TOKENS, ContextTooLarge, estimate_tokens, plan_context
+
+WINDOW = 1000
+MAX_OUTPUT = 100
+
+
+@pytest.fixture(autouse=True)
+def small_model(monkeypatch):
+    monkeypatch.setitem(context_budget.MODEL_CONTEXT_WINDOWS, "test-small", WINDOW)
+
+
+def budget():
+    """Input tokens the test model allows once the output allowance is reserved"""
+    return WINDOW - get_settings().context_safety_margin_tokens - MAX_OUTPUT
+
+
+def words(n, word="alpha"):
+    return " ".join([word] * n)
+
+
+def prompt(pid, content, priority=0):
+    return {"id": pid, "priority": priority, "content": content}
+
+
+def test_conversation_that_fits_keeps_everything():
+    prompts = [prompt(1, "Be brief."), prompt(2, "Answer in English.")]
+    plan = plan_context(["test-small"], prompts, "Hello there", MAX_OUTPUT)
+    assert plan.prompt_contents == ["Be brief.", "Answer in English."]
+    assert plan.dropped_prompts == [] and plan.truncated_prompt is None
+    assert plan.max_output_tokens == MAX_OUTPUT
+    assert plan.input_tokens < budget()
+
+
+def test_smallest_window_among_models_applies():
+    plan = plan_context(["gpt-4.1", "test-small"], [], "Hello", 10 ** 6)
+    assert plan.max_output_tokens == WINDOW - get_settings().context_safety_margin_tokens - plan.input_tokens
+
+
+def test_prompts_are_trimmed_by_priority_then_id():
+    # Each prompt takes about a third of the budget, so only two fit whole
+    size = budget() // 3
+    content = words(size)
+    while estimate_tokens(content) + 1 > size:
+        content = content.rsplit(" ", 1)[0]
+    prompts = [prompt(1, content), prompt(2, content, priority=5), prompt(3, content), prompt(4, content)]
+    plan = plan_context(["test-small"], prompts, "Hi", MAX_OUTPUT)
+    # Highest priority first, then the oldest prompt; the next one is cut to fit and the rest dropped
+    assert plan.prompt_contents[:2] == [content, content]
+    assert plan.truncated_prompt == 3
+    assert plan.dropped_prompts == [4]
+    assert content.startswith(plan.prompt_contents[2]) and len(plan.prompt_contents[2]) < len(content)
+    # The output cap is the minimum allowance once the prompts have used the rest
+    assert plan.input_tokens <= budget()
+    assert plan.max_output_tokens == MAX_OUTPUT
+
+
+def test_history_counts_against_the_budget():
+    history = budget() - estimate_tokens("Hi") - MESSAGE_OVERHEAD_TOKENS - 10
+    plan = plan_context(["test-small"], [prompt(1, words(50))], "Hi", MAX_OUTPUT, history_tokens=history)
+    assert plan.dropped_prompts == [] and plan.truncated_prompt == 1
+    with pytest.raises(ContextTooLarge):
+        plan_context(["test-small"], [], "Hi", MAX_OUTPUT, history_tokens=history + 20)
+
+
+def test_message_alone_over_budget_is_rejected():
+    message = words(budget())
+    assert estimate_tokens(message) > budget()
+    with pytest.raises(ContextTooLarge, match="Shorten the message"):
+        plan_context(["test-small"], [prompt(1, "Be brief.")], message, MAX_OUTPUT)
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import hedging
+
+
+class FakeStream:
+    """Yields the given events; an exception among them is raised in its place"""
+
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def __iter__(self):
+        for event in self.events:
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+def delta(text):
+    return SimpleNamespace(type="response.output_text.delta", delta=text)
+
+
+def completed(response):
+    return SimpleNamespace(type="response.completed", response=response)
+
+
+@pytest.fixture(autouse=True)
+def no_hedges(monkeypatch):
+    # Too few latency samples for a threshold, so only the primary runs
+    monkeypatch.setattr(hedging, "first_token_latency", hedging.LatencyTracker())
+
+
+def test_primary_response_is_returned():
+    stream = FakeStream([delta("Hel"), delta("lo"), completed("resp")])
+    assert hedging.hedged_create(lambda: stream) == "resp"
+    assert stream.closed
+
+
+def test_primary_failing_after_its_first_token_raises():
+    stream = FakeStream([delta("Hel"), ConnectionError("stream cut")])
+    with pytest.raises(ConnectionError, match="stream cut"):
+        hedging.hedged_create(lambda: stream)
+    assert stream.closed
+
+
+def test_primary_failing_before_any_token_raises():
+    def create_stream():
+        raise TimeoutError("no answer")
+
+    with pytest.raises(TimeoutError):
+        hedging.hedged_create(create_stream)
+
+
+def test_stream_ending_without_completion_raises():
+    with pytest.raises(RuntimeError, match="without a completed response"):
+        hedging.hedged_create(lambda: FakeStream([delta("Hel")]))
+
+
+def test_first_token_is_reported_once():
+    calls = []
+    stream = FakeStream([delta("Hel"), delta("lo"), completed("resp")])
+    assert hedging.hedged_create(lambda: stream, on_first_token=lambda: calls.append(1)) == "resp"
+    assert calls == [1]
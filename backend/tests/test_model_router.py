@@ -0,0 +1,47 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import hedging, model_router
+from app.routes.chat import call_openai_with_retry
+
+
+class SlowStream:
+    """One delta at once, then the rest of the reply after a delay"""
+
+    def __init__(self, generation_seconds):
+        self.generation_seconds = generation_seconds
+
+    def __iter__(self):
+        yield SimpleNamespace(type="response.output_text.delta", delta="Hel")
+        time.sleep(self.generation_seconds)
+        yield SimpleNamespace(type="response.output_text.delta", delta="lo")
+        yield SimpleNamespace(type="response.completed", response=SimpleNamespace(id="resp", usage=None))
+
+    def close(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self, stream):
+        self.responses = SimpleNamespace(create=lambda **options: stream)
+
+    def with_options(self, **options):
+        return self
+
+
+@pytest.fixture(autouse=True)
+def fresh_router(monkeypatch):
+    monkeypatch.setattr(model_router, "router", model_router.ModelRouter())
+    monkeypatch.setattr(hedging, "first_token_latency", hedging.LatencyTracker())
+
+
+@pytest.mark.parametrize("hedged", [False, True])
+def test_router_records_time_to_first_token(monkeypatch, hedged):
+    monkeypatch.setattr(hedging, "HEDGING_ENABLED", hedged)
+    response = call_openai_with_retry(FakeClient(SlowStream(0.3)), ["test-model"], [])
+    assert response.id == "resp"
+    # The long generation after the first token is not counted
+    assert model_router.router._stats["test-model"].latency < 0.2
+
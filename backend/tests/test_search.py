@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+from app.search import _END, _START, _fts5_match, _pg_tsquery, highlight, terms
+
+
+def test_terms_keep_words_only():
+    assert terms('refund "policy" -- OR (NEAR) *') == ["refund", "policy", "OR", "NEAR"]
+
+
+def test_terms_are_capped():
+    assert terms(" ".join(f"w{i}" for i in range(20))) == [f"w{i}" for i in range(10)]
+
+
+def test_terms_keep_unicode_words():
+    assert terms("Größe, 日本語!") == ["Größe", "日本語"]
+
+
+def test_fts5_match_single_word_is_a_prefix():
+    assert _fts5_match(3, ["ref"]) == 'project : p3 AND {name content} : ("ref" *)'
+
+
+def test_fts5_match_quotes_every_word():
+    assert _fts5_match("7", ["refund", "OR", "pol"]) == (
+        'project : p7 AND {name content} : ("refund" AND "OR" AND "pol" *)'
+    )
+
+
+def test_pg_tsquery_prefixes_the_last_word():
+    assert _pg_tsquery(["refund", "pol"]) == "refund & pol:*"
+
+
+def test_highlight_escapes_before_marking():
+    value = f"<b>{_START}refund{_END}</b> & more"
+    assert highlight(value) == "&lt;b&gt;<mark>refund</mark>&lt;/b&gt; &amp; more"
+    assert highlight(None) is None
+
+
+@pytest.fixture
+def fts5():
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE prompt_search USING fts5("
+                     "project, name, content, tokenize = 'unicode61 remove_diacritics 2')")
+    except sqlite3.OperationalError:
+        pytest.skip("SQLite was built without FTS5")
+    conn.executemany("INSERT INTO prompt_search (rowid, project, name, content) VALUES (?, ?, ?, ?)", [
+        (1, "p1", "Refunds", "Explain the refund policy or escalate"),
+        (2, "p1", "Tone", "Be near and friendly"),
+        (3, "p11", "Refunds", "Another project's refund policy"),
+        (4, "p1", "Größe", "Sizes and résumé tips"),
+    ])
+    yield conn
+    conn.close()
+
+
+def matches(conn, project_id, query):
+    return [row[0] for row in conn.execute(
+        "SELECT rowid FROM prompt_search WHERE prompt_search MATCH ? ORDER BY rowid",
+        (_fts5_match(project_id, terms(query)),)
+    )]
+
+
+def test_fts5_match_runs_and_stays_in_the_project(fts5):
+    assert matches(fts5, 1, "refund pol") == [1]
+    assert matches(fts5, 11, "refund") == [3]
+
+
+def test_fts5_operators_in_the_query_are_plain_words(fts5):
+    assert matches(fts5, 1, "policy OR") == [1]
+    assert matches(fts5, 1, "NEAR") == [2]
+    assert matches(fts5, 1, "project") == []
+
+
+def test_fts5_match_ignores_diacritics(fts5):
+    assert matches(fts5, 1, "resume") == [4]
+    assert matches(fts5, 1, "größe") == [4]
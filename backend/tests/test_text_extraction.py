@@ -0,0 +1,124 @@
+import io
+
+import pytest
+
+from app.text_extraction import chunk_spans, extract_text, ingest, normalize
+
+
+def assert_covers(text, spans, size):
+    """Chunks start at 0, end at the end, never exceed size and leave no gaps"""
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(text)
+    for start, end in spans:
+        assert 0 < end - start <= size
+    for (_, previous_end), (start, _) in zip(spans, spans[1:]):
+        assert start <= previous_end
+
+
+def test_short_text_is_one_chunk():
+    assert chunk_spans("Hello world.", 100, 10) == [(0, 12)]
+
+
+def test_empty_text_has_no_chunks():
+    assert chunk_spans("", 100, 10) == []
+
+
+def test_chunks_end_at_the_best_break():
+    text = "First paragraph here.\n\nSecond one. " + "word " * 20
+    spans = chunk_spans(text, 28, 5)
+    assert text[:spans[0][1]] == "First paragraph here.\n\n"
+    assert_covers(text, spans, 28)
+
+
+def test_overlap_starts_on_a_word():
+    text = " ".join(f"w{i:03d}" for i in range(200))
+    spans = chunk_spans(text, 100, 20)
+    assert_covers(text, spans, 100)
+    for start, _ in spans[1:]:
+        assert text[start - 1] == " "
+
+
+def test_no_break_in_window_cuts_at_size():
+    text = "x" * 250
+    assert chunk_spans(text, 100, 10) == [(0, 100), (90, 190), (180, 250)]
+
+
+def test_overlap_not_smaller_than_size_still_advances():
+    text = "abcdefghij" * 5
+    for overlap in (10, 15):
+        spans = chunk_spans(text, 10, overlap)
+        assert_covers(text, spans, 10)
+        starts = [start for start, _ in spans]
+        assert starts == sorted(set(starts))
+
+
+def test_multibyte_text_offsets_are_characters():
+    text = "Größe über alles. " * 30 + "日本語のテキストです。" * 20 + " 🙂 emoji 🙂" * 10
+    spans = chunk_spans(text, 80, 15)
+    assert_covers(text, spans, 80)
+    # Offsets index the str, so slices round-trip through UTF-8
+    for start, end in spans:
+        chunk = text[start:end]
+        assert chunk.encode("utf-8").decode("utf-8") == chunk
+    assert text[spans[0][0]:spans[0][1]].endswith(". ")
+
+
+def test_text_without_spaces_is_cut_at_size():
+    text = "日本語のテキスト" * 30
+    spans = chunk_spans(text, 50, 10)
+    assert_covers(text, spans, 50)
+    assert [end - start for start, end in spans[:-1]] == [50] * (len(spans) - 1)
+
+
+def test_normalize_collapses_whitespace_and_controls():
+    raw = "ﬁne\r\nline\x00 two \t\tspaced\r\n\n\n\nend  "
+    assert normalize(raw) == "fine\nline two spaced\n\nend"
+
+
+def _pdf(text):
+    """A one-page PDF showing text in Helvetica"""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+
+def test_pdf_text_is_extracted():
+    pytest.importorskip("pypdf")
+    status, detail, chunks = ingest("report.pdf", _pdf("Quarterly   report for Acme"), 100, 10)
+    assert (status, detail) == ("ready", None)
+    assert [content for _, _, content in chunks] == ["Quarterly report for Acme"]
+
+
+def test_docx_paragraphs_and_tables_are_extracted():
+    docx = pytest.importorskip("docx")
+    document = docx.Document()
+    document.add_paragraph("First paragraph.")
+    document.add_paragraph("Second paragraph.")
+    table = document.add_table(rows=1, cols=2)
+    table.rows[0].cells[0].text = "Name"
+    table.rows[0].cells[1].text = "Ada"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    assert extract_text("notes.docx", buffer.getvalue()) == "First paragraph.\nSecond paragraph.\nName\tAda"
+
+
+def test_corrupt_pdf_fails_without_raising():
+    pytest.importorskip("pypdf")
+    status, detail, chunks = ingest("broken.pdf", b"%PDF-1.4\nnot really a pdf", 100, 10)
+    assert status == "failed" and detail and chunks == []
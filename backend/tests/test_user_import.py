@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.auth import normalize_email
+from app.user_import import InvalidUpload, read_rows
+
+
+async def _chunks(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def rows(content_type, data, chunk_size=7):
+    """read_rows over data fed in small chunks, so lines and characters span chunk boundaries"""
+    async def collect():
+        return [row async for row in read_rows(content_type, _chunks(data, chunk_size))]
+    return asyncio.run(collect())
+
+
+def test_csv_rows_are_numbered_from_one():
+    data = b"email,password\nada@example.com,Passw0rd123\n\ngrace@example.com,Passw0rd456\n"
+    assert rows("text/csv", data) == [
+        {"row": 1, "email": "ada@example.com", "password": "Passw0rd123"},
+        {"row": 2, "email": "grace@example.com", "password": "Passw0rd456"},
+    ]
+
+
+def test_csv_quoted_comma_and_column_order():
+    data = b'Password , EMAIL\r\n"Pass,w0rd123",ada@example.com\r\n'
+    assert rows("text/csv; charset=utf-8", data) == [
+        {"row": 1, "email": "ada@example.com", "password": "Pass,w0rd123"},
+    ]
+
+
+def test_csv_with_bom_and_multibyte_text():
+    data = "﻿email,password\nzoë@example.com,Pässw0rd123\n".encode("utf-8")
+    for chunk_size in (1, 2, 3, 64):
+        assert rows("text/csv", data, chunk_size) == [
+            {"row": 1, "email": "zoë@example.com", "password": "Pässw0rd123"},
+        ]
+
+
+def test_csv_quoted_field_spanning_lines():
+    data = (b'email,password\n'
+            b'ada@example.com,"Pass\r\nw0rd""123"\n'
+            b'grace@example.com,Passw0rd456\n')
+    for chunk_size in (1, 5, 64):
+        assert rows("text/csv", data, chunk_size) == [
+            {"row": 1, "email": "ada@example.com", "password": 'Pass\nw0rd"123'},
+            {"row": 2, "email": "grace@example.com", "password": "Passw0rd456"},
+        ]
+
+
+def test_csv_without_last_newline():
+    assert rows("text/csv", b"email,password\nada@example.com,Passw0rd123")[0]["email"] == "ada@example.com"
+
+
+def test_csv_missing_column_in_row():
+    assert rows("text/csv", b"email,password\nada@example.com\n") == [
+        {"row": 1, "email": "ada@example.com", "password": ""},
+    ]
+
+
+@pytest.mark.parametrize("header", [b"mail,password\n", b"email;password\n", b"\n\n"])
+def test_csv_bad_header(header):
+    with pytest.raises(InvalidUpload):
+        rows("text/csv", header + b"ada@example.com,Passw0rd123\n")
+
+
+def test_ndjson_rows_and_errors():
+    data = (b'{"email": "ada@example.com", "password": "Passw0rd123"}\n'
+            b'not json\n'
+            b'\n'
+            b'["a", "b"]\n'
+            b'{"email": 1, "password": "x"}\r\n')
+    assert rows("application/x-ndjson", data) == [
+        {"row": 1, "email": "ada@example.com", "password": "Passw0rd123"},
+        {"row": 2, "error": "Invalid JSON"},
+        {"row": 3, "error": "Expected an object with email and password"},
+        {"row": 4, "email": None, "error": "email and password must be strings"},
+    ]
+
+
+def test_json_array():
+    data = b'[{"email": "ada@example.com", "password": "Passw0rd123"}]'
+    assert rows("application/json", data) == [
+        {"row": 1, "email": "ada@example.com", "password": "Passw0rd123"},
+    ]
+
+
+@pytest.mark.parametrize("content_type, data", [
+    ("application/json", b'{"email": "ada@example.com"}'),
+    ("application/json", b"[{"),
+    ("application/xml", b"<users/>"),
+    (None, b"email,password\n"),
+])
+def test_unreadable_uploads(content_type, data):
+    with pytest.raises(InvalidUpload):
+        rows(content_type, data)
+
+
+def test_emails_are_normalized_for_lookups():
+    assert normalize_email("  ADMIN@Corp.com ") == "admin@corp.com"